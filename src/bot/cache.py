@@ -0,0 +1,146 @@
+"""Кэш ответов на вопросы пользователей"""
+
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    """Нормализовать текст вопроса для ключа кэша"""
+    return _WHITESPACE_RE.sub(" ", query.strip().lower())
+
+
+def _words_key(normalized: str) -> str:
+    """Мультимножество слов вопроса: порядок слов и пунктуация не важны"""
+    return " ".join(sorted(_WORD_RE.findall(normalized)))
+
+
+@dataclass
+class CacheStats:
+    """Статистика кэша"""
+    hits: int = 0
+    similar_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class _CacheEntry:
+    created_at: float
+    value: dict[str, Any]
+    query: str
+
+
+class SmartAskCache:
+    """
+    LRU-кэш ответов /ask с TTL.
+
+    Ключ - отсортированные слова нормализованного вопроса, поэтому вопрос
+    с переставленными словами или другой пунктуацией находит тот же ответ.
+    Вопросы, отличающиеся хотя бы одним словом ("статья 81" и "статья 82"),
+    считаются разными: приблизительное совпадение для юридических ответов
+    недопустимо.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: OrderedDict[tuple[str, str], _CacheEntry] = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    async def get(self, role: str, query: str) -> dict[str, Any] | None:
+        """Найти закэшированный ответ для вопроса"""
+        normalized = normalize_query(query)
+        key = (role, _words_key(normalized))
+        now = time.monotonic()
+
+        async with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry.created_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    if entry.query == normalized:
+                        self.stats.hits += 1
+                    else:
+                        self.stats.similar_hits += 1
+                    return entry.value
+                del self._entries[key]
+
+            self.stats.misses += 1
+            return None
+
+    def has(self, role: str, query: str) -> bool:
+        """Есть ли живой ответ на вопрос (не влияет на статистику и порядок LRU)"""
+        entry = self._entries.get((role, _words_key(normalize_query(query))))
+        return entry is not None and time.monotonic() - entry.created_at < self.ttl
+
+    async def set(self, role: str, query: str, value: dict[str, Any]) -> None:
+        """Сохранить ответ в кэш"""
+        normalized = normalize_query(query)
+        key = (role, _words_key(normalized))
+        entry = _CacheEntry(created_at=time.monotonic(), value=value, query=normalized)
+
+        async with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        self._entries.clear()
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SourceCache:
+    """
+    LRU-кэш фрагментов источников по (файл, страница, лимит).
+
+    Фрагменты меняются только при переиндексации, поэтому кэш
+    сбрасывается после успешной загрузки документов.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[str, int, int], list[dict]] = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    async def get(self, filename: str, page: int, limit: int) -> list[dict] | None:
+        """Найти закэшированные фрагменты"""
+        key = (filename, page, limit)
+        async with self._lock:
+            chunks = self._entries.get(key)
+            if chunks is not None:
+                self._entries.move_to_end(key)
+            return chunks
+
+    async def set(self, filename: str, page: int, limit: int, chunks: list[dict]) -> None:
+        """Сохранить фрагменты в кэш"""
+        key = (filename, page, limit)
+        async with self._lock:
+            self._entries[key] = chunks
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+ask_cache = SmartAskCache()
+source_cache = SourceCache()
@@ -1,19 +1,49 @@
 import asyncio
+import hmac
+import logging
+import os
 import re
+import tempfile
+from dataclasses import asdict, dataclass
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
 import aiohttp
+import orjson
+from aiogram.exceptions import TelegramAPIError
 
+from bot.cache import ask_cache, source_cache
+from bot.http import get_http_session
 from bot.keyboards import mode_keyboard
+from bot.upload_queue import UploadJob, UploadQueue
+from bot.user_cache import get_user_cached, invalidate_user, last_seen_user, peek_cached_user
 from config import settings
-from infra.db.database import get_session
+from infra.db.database import async_session_factory
 from infra.db.user_repository import UserRepository
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
+# Адреса API (не меняются во время работы бота)
+_ASK_URL = f"{settings.api_base_url}/ask"
+_SOURCE_URL = f"{settings.api_base_url}/source"
+_UPLOAD_URL = f"{settings.api_base_url}/upload"
+_GENERATE_URL = f"{settings.api_base_url}/generate"
+_GENERATE_PDF_URL = f"{settings.api_base_url}/generate/pdf"
+
+# Таймауты запросов к API (по умолчанию действует таймаут общей сессии)
+_SOURCE_TIMEOUT = aiohttp.ClientTimeout(total=15)
+_GENERATE_TIMEOUT = aiohttp.ClientTimeout(total=120)
+_UPLOAD_TIMEOUT = aiohttp.ClientTimeout(total=3600, sock_read=600)
+
+# Повторные попытки запросов к API
+_MAX_ATTEMPTS = 3
+# Ответы шлюза: запрос не дошёл до API, его безопасно повторить
+_RETRY_STATUSES = frozenset({502, 503, 504})
+
 # ============================================================================
 # Поддерживаемые форматы файлов
 # ============================================================================
@@ -45,56 +75,89 @@ ARCHIVE_EXTENSIONS = frozenset({".zip", ".tar", ".tgz", ".tbz2", ".txz", ".tar.g
 SUPPORTED_EXTENSIONS = DOCUMENT_EXTENSIONS | ARCHIVE_EXTENSIONS
 
 
+_EXTENSION_CATEGORY = {
+    **{ext: "document" for ext in DOCUMENT_EXTENSIONS},
+    **{ext: "archive" for ext in ARCHIVE_EXTENSIONS},
+}
+
+# Длинные расширения идут первыми, чтобы ".tar.gz" не проигрывал ".tar"
+_EXTENSION_RE = re.compile(
+    "(?:" + "|".join(re.escape(ext) for ext in sorted(_EXTENSION_CATEGORY, key=len, reverse=True)) + ")$",
+    re.IGNORECASE,
+)
+
+
 def is_supported_file(filename: str | None, mime_type: str | None) -> tuple[bool, str]:
     """Проверить, поддерживается ли файл."""
     if filename:
-        filename_lower = filename.lower()
-        for ext in {".tar.gz", ".tar.bz2", ".tar.xz"}:
-            if filename_lower.endswith(ext):
-                return True, "archive"
-        for ext in ARCHIVE_EXTENSIONS:
-            if filename_lower.endswith(ext):
-                return True, "archive"
-        for ext in DOCUMENT_EXTENSIONS:
-            if filename_lower.endswith(ext):
-                return True, "document"
-
-    if mime_type:
-        if mime_type in ARCHIVE_MIME_TYPES:
-            return True, "archive"
-        if mime_type in DOCUMENT_MIME_TYPES:
-            return True, "document"
+        m = _EXTENSION_RE.search(filename)
+        if m:
+            return True, _EXTENSION_CATEGORY[m.group(0).lower()]
+
+    if mime_type in ARCHIVE_MIME_TYPES:
+        return True, "archive"
+    if mime_type in DOCUMENT_MIME_TYPES:
+        return True, "document"
 
     return False, "unsupported"
 
 
+_SUPPORTED_FORMATS_TEXT = (
+    f" Документы: {', '.join(sorted(DOCUMENT_EXTENSIONS))}\n"
+    f" Архивы: {', '.join(sorted(ARCHIVE_EXTENSIONS))}"
+)
+
+
 def get_supported_formats_text() -> str:
     """Получить текст с поддерживаемыми форматами"""
-    docs = ", ".join(sorted(DOCUMENT_EXTENSIONS))
-    archives = ", ".join(sorted(ARCHIVE_EXTENSIONS))
-    return f" Документы: {docs}\n Архивы: {archives}"
+    return _SUPPORTED_FORMATS_TEXT
+
+
+# Ограничение количества кнопок-источников (Telegram limit)
+MAX_SOURCE_BUTTONS = 8
+
+
+@dataclass(slots=True)
+class Source:
+    """Источник ответа, полученный от API"""
+    filename: str
+    page: int | None = None
+    archive: str | None = None
+
+
+def _dedup_sources(sources: list[dict], limit: int = MAX_SOURCE_BUTTONS) -> list[Source]:
+    """Разобрать источники из ответа API, убрать повторы (файл, страница) и ограничить их число"""
+    unique = []
+    seen = set()
+
+    for src in sources:
+        source = Source(src.get("filename", "?"), src.get("page"), src.get("archive"))
+        key = (source.filename, source.page)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(source)
+        if len(unique) >= limit:
+            break
 
+    return unique
 
-def create_sources_keyboard(sources: list[dict]) -> InlineKeyboardMarkup | None:
+
+def create_sources_keyboard(sources: list[Source]) -> InlineKeyboardMarkup | None:
     """
     Создать inline-клавиатуру с кнопками-источниками.
+
+    Источники должны быть заранее очищены через _dedup_sources:
+    кнопки строятся один к одному с индексами в state.
     """
     if not sources:
         return None
 
     buttons = []
-    seen = set()
 
     for i, src in enumerate(sources):
-        filename = src.get("filename", "?")
-        page = src.get("page")
-        archive = src.get("archive")
-
-        # Ключ для дедупликации
-        key = (filename, page)
-        if key in seen:
-            continue
-        seen.add(key)
+        filename = src.filename
+        page = src.page
 
         # Текст кнопки (сокращаем если длинный)
         if len(filename) > 25:
@@ -116,12 +179,6 @@ def create_sources_keyboard(sources: list[dict]) -> InlineKeyboardMarkup | None:
             callback_data=callback_data
         )])
 
-    if not buttons:
-        return None
-
-    # Ограничиваем количество кнопок (Telegram limit)
-    buttons = buttons[:8]
-
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
@@ -138,9 +195,7 @@ class BotStates(StatesGroup):
 
 @router.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext):
-    async for session in get_session():
-        repo = UserRepository(session)
-        existing = await repo.get_by_telegram_id(message.from_user.id)
+    existing = await get_user_cached(message.from_user.id)
     if not existing:
         await state.set_state(BotStates.auth_token)
         await message.answer("Твой секретный токен?")
@@ -148,52 +203,69 @@ async def cmd_start(message: Message, state: FSMContext):
     await message.answer("Сол Гудман у аппарата. Зачем позвонил?", reply_markup=mode_keyboard)
 
 
+# Токен доступа -> роль (admin перекрывает user при совпадении токенов)
+_TOKEN_ROLES = {
+    settings.user_token.encode(): "user",
+    settings.admin_token.encode(): "admin",
+}
+
+
+def _resolve_role(token: str) -> str | None:
+    """Определить роль по токену (сравнение за постоянное время)"""
+    token_bytes = token.encode()
+    role = None
+    for expected, candidate in _TOKEN_ROLES.items():
+        if hmac.compare_digest(expected, token_bytes):
+            role = candidate
+    return role
+
+
 @router.message(BotStates.auth_token, F.text)
 async def handle_auth_token(message: Message, state: FSMContext):
-    token = message.text.strip()
-    role = None
-    if token == settings.admin_token:
-        role = "admin"
-    elif token == settings.user_token:
-        role = "user"
+    role = _resolve_role(message.text.strip())
 
     if role is None:
         await message.answer("Ты в чс. Лучше не звони Солу.")
         return
 
-    async for session in get_session():
+    async with async_session_factory() as session:
         repo = UserRepository(session)
         await repo.upsert(message.from_user.id, role)
+    invalidate_user(message.from_user.id)
     await state.clear()
     await message.answer("Верный токен.\nСол Гудман у аппарата. Зачем позвонил?", reply_markup=mode_keyboard)
 
 
+HELP_TEXT = (
+    "Задай вопрос, и я найду ответ в документах с ссылками на источники.\n\n"
+    "После ответа нажми на кнопку источника, чтобы увидеть полный текст фрагмента.\n\n"
+    f"Поддерживаемые форматы для загрузки:\n{_SUPPORTED_FORMATS_TEXT}"
+)
+
+FORMATS_TEXT = (
+    f" Поддерживаемые форматы:\n\n{_SUPPORTED_FORMATS_TEXT}\n\n"
+    "Архивы могут содержать вложенные архивы (до 3 уровней)."
+)
+
+
 @router.message(Command("help"))
 async def cmd_help(message: Message):
-    help_text = (
-        "Задай вопрос, и я найду ответ в документах с ссылками на источники.\n\n"
-        "После ответа нажми на кнопку источника, чтобы увидеть полный текст фрагмента.\n\n"
-        f"Поддерживаемые форматы для загрузки:\n{get_supported_formats_text()}"
-    )
-    await message.answer(help_text, reply_markup=mode_keyboard)
+    await message.answer(HELP_TEXT, reply_markup=mode_keyboard)
 
 
 @router.message(Command("reauth"))
 async def cmd_reauth(message: Message, state: FSMContext):
-    async for session in get_session():
+    async with async_session_factory() as session:
         repo = UserRepository(session)
         await repo.delete_by_telegram_id(message.from_user.id)
+    invalidate_user(message.from_user.id)
     await state.set_state(BotStates.auth_token)
     await message.answer("Права сброшены, назови токен доступа.")
 
 
 @router.message(Command("formats"))
 async def cmd_formats(message: Message):
-    await message.answer(
-        f" Поддерживаемые форматы:\n\n{get_supported_formats_text()}\n\n"
-        "Архивы могут содержать вложенные архивы (до 3 уровней).",
-        reply_markup=mode_keyboard
-    )
+    await message.answer(FORMATS_TEXT, reply_markup=mode_keyboard)
 
 
 # Генерация документов
@@ -216,9 +288,7 @@ DOCUMENT_TYPES_TEXT = """📋 *Типы документов:*
 
 @router.message(F.text == "Создать документ")
 async def select_generate_mode(message: Message, state: FSMContext):
-    async for session in get_session():
-        repo = UserRepository(session)
-        user = await repo.get_by_telegram_id(message.from_user.id)
+    user = await get_user_cached(message.from_user.id)
     if not user:
         await state.set_state(BotStates.auth_token)
         await message.answer("Сначала токен доступа.")
@@ -240,9 +310,7 @@ async def handle_generate(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
     # Проверка авторизации
-    async for session in get_session():
-        repo = UserRepository(session)
-        user = await repo.get_by_telegram_id(user_id)
+    user = await get_user_cached(user_id)
     if not user:
         await message.answer("Сначала токен доступа.")
         return
@@ -261,81 +329,82 @@ async def handle_generate(message: Message, state: FSMContext):
     )
 
     try:
-        timeout = aiohttp.ClientTimeout(total=120)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            # Запрос на генерацию PDF
-            async with session.post(
-                    f"{settings.api_base_url}/generate/pdf",
-                    json={
-                        "request": request_text,
-                        "user_id": user_id,
-                        "use_rag": True,
-                    }
-            ) as resp:
-                if resp.status == 200:
-                    # Получаем PDF
-                    pdf_bytes = await resp.read()
-
-                    # Получаем имя файла из заголовка
-                    content_disp = resp.headers.get("Content-Disposition", "")
-                    filename = "document.pdf"
-                    if "filename=" in content_disp:
-                        try:
-                            filename = content_disp.split("filename=")[1].strip('"')
-                        except:
-                            pass
-
-                    # Удаляем статусное сообщение
-                    await status_msg.delete()
-
-                    # Отправляем PDF файл
-                    pdf_file = BufferedInputFile(
-                        file=pdf_bytes,
-                        filename=filename
-                    )
+        http = await get_http_session()
+        # Запрос на генерацию PDF
+        async with http.post(
+                _GENERATE_PDF_URL,
+                json={
+                    "request": request_text,
+                    "user_id": user_id,
+                    "use_rag": True,
+                },
+                timeout=_GENERATE_TIMEOUT,
+        ) as resp:
+            if resp.status == 200:
+                # Получаем PDF
+                pdf_bytes = await resp.read()
+
+                # Получаем имя файла из заголовка
+                content_disp = resp.headers.get("Content-Disposition", "")
+                filename = "document.pdf"
+                if "filename=" in content_disp:
+                    try:
+                        filename = content_disp.split("filename=")[1].strip('"')
+                    except IndexError:
+                        pass
+
+                # Удаляем статусное сообщение
+                await status_msg.delete()
+
+                # Отправляем PDF файл
+                pdf_file = BufferedInputFile(
+                    file=pdf_bytes,
+                    filename=filename
+                )
 
-                    await message.answer_document(
-                        document=pdf_file,
-                        caption=(
-                            f"Документ сгенерирован!\n\n"
-                            f"_FOR REFERENCE ONLY — перед использованием "
-                            f"рекомендуется консультация с юристом._"
-                        ),
-                        parse_mode="Markdown",
-                        reply_markup=mode_keyboard
-                    )
+                await message.answer_document(
+                    document=pdf_file,
+                    caption=(
+                        f"Документ сгенерирован!\n\n"
+                        f"_FOR REFERENCE ONLY — перед использованием "
+                        f"рекомендуется консультация с юристом._"
+                    ),
+                    parse_mode="Markdown",
+                    reply_markup=mode_keyboard
+                )
 
-                    # Также отправляем Markdown версию (опционально)
-                    async with session.post(
-                            f"{settings.api_base_url}/generate",
-                            json={
-                                "request": request_text,
-                                "user_id": user_id,
-                                "use_rag": False,  # Уже использовали
-                            }
-                    ) as md_resp:
-                        if md_resp.status == 200:
-                            md_data = await md_resp.json()
-                            markdown_content = md_data.get("markdown", "")
-
-                            # Отправляем как текстовый файл для редактирования
-                            if len(markdown_content) > 100:
-                                md_file = BufferedInputFile(
-                                    file=markdown_content.encode("utf-8"),
-                                    filename=filename.replace(".pdf", ".md")
-                                )
-                                await message.answer_document(
-                                    document=md_file,
-                                    caption="Markdown версия для редактирования",
-                                    reply_markup=mode_keyboard
-                                )
-                else:
-                    await status_msg.delete()
-                    error_text = await resp.text()
-                    await message.answer(
-                        f"Ошибка генерации: {error_text[:200]}",
-                        reply_markup=mode_keyboard
-                    )
+                # Также отправляем Markdown версию (опционально)
+                async with http.post(
+                        _GENERATE_URL,
+                        json={
+                            "request": request_text,
+                            "user_id": user_id,
+                            "use_rag": False,  # Уже использовали
+                        },
+                        timeout=_GENERATE_TIMEOUT,
+                ) as md_resp:
+                    if md_resp.status == 200:
+                        md_data = await md_resp.json(loads=orjson.loads)
+                        markdown_content = md_data.get("markdown", "")
+
+                        # Отправляем как текстовый файл для редактирования
+                        if len(markdown_content) > 100:
+                            md_file = BufferedInputFile(
+                                file=markdown_content.encode("utf-8"),
+                                filename=filename.replace(".pdf", ".md")
+                            )
+                            await message.answer_document(
+                                document=md_file,
+                                caption="Markdown версия для редактирования",
+                                reply_markup=mode_keyboard
+                            )
+            else:
+                await status_msg.delete()
+                error_text = await resp.text()
+                await message.answer(
+                    f"Ошибка генерации: {error_text[:200]}",
+                    reply_markup=mode_keyboard
+                )
 
     except asyncio.TimeoutError:
         await status_msg.delete()
@@ -343,10 +412,11 @@ async def handle_generate(message: Message, state: FSMContext):
             "Превышено время ожидания. Попробуй упростить запрос.",
             reply_markup=mode_keyboard
         )
-    except Exception as e:
+    except aiohttp.ClientError:
+        logger.exception("Ошибка запроса генерации документа")
         await status_msg.delete()
         await message.answer(
-            f"Ошибка: {str(e)[:100]}",
+            "Ошибка подключения к серверу.",
             reply_markup=mode_keyboard
         )
 
@@ -361,9 +431,7 @@ async def handle_generate_document(message: Message):
 
 @router.message(F.text == "Задать вопрос")
 async def select_ask_mode(message: Message, state: FSMContext):
-    async for session in get_session():
-        repo = UserRepository(session)
-        user = await repo.get_by_telegram_id(message.from_user.id)
+    user = await get_user_cached(message.from_user.id)
     if not user:
         await state.set_state(BotStates.auth_token)
         await message.answer("Сначала токен доступа.")
@@ -374,9 +442,7 @@ async def select_ask_mode(message: Message, state: FSMContext):
 
 @router.message(F.text == "Загрузить документ")
 async def select_upload_mode(message: Message, state: FSMContext):
-    async for session in get_session():
-        repo = UserRepository(session)
-        user = await repo.get_by_telegram_id(message.from_user.id)
+    user = await get_user_cached(message.from_user.id)
     if not user:
         await state.set_state(BotStates.auth_token)
         await message.answer("Сначала токен доступа.")
@@ -393,6 +459,26 @@ async def select_upload_mode(message: Message, state: FSMContext):
 
 
 # Обработка вопросов
+async def _post_ask(question: str, user_id: int) -> dict | None:
+    """Отправить вопрос в API; None, если сервер ответил ошибкой"""
+    http = await get_http_session()
+    async with http.post(
+            _ASK_URL,
+            json={"query": question, "user_id": user_id}
+    ) as resp:
+        if resp.status != 200:
+            return None
+        return await resp.json(loads=orjson.loads)
+
+
+def _discard_task(task: asyncio.Task) -> None:
+    """Отменить ненужную задачу, не теряя её исключение"""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+
 @router.message(BotStates.ask_mode, F.text)
 async def handle_ask(message: Message, state: FSMContext):
     question = message.text
@@ -402,52 +488,123 @@ async def handle_ask(message: Message, state: FSMContext):
     if question in ["Задать вопрос", "Загрузить документ", "Создать документ"]:
         return
 
-    async for session in get_session():
-        repo = UserRepository(session)
-        user = await repo.get_by_telegram_id(user_id)
-    if not user:
-        await message.answer("Сначала токен доступа.")
-        return
+    ask_task = None
+    try:
+        user = peek_cached_user(user_id)
+        if user is None:
+            # Запись в кэше устарела: пока идёт запрос в БД, вопрос уже
+            # отправляется в API. Только для пользователей, которые проходили
+            # проверку, и только если ответа нет в кэше вопросов
+            seen = last_seen_user(user_id)
+            if seen is not None and not ask_cache.has(seen.role, question):
+                ask_task = asyncio.create_task(_post_ask(question, user_id))
+            user = await get_user_cached(user_id)
+        if not user:
+            await message.answer("Сначала токен доступа.")
+            return
+
+        # Отправляем индикатор "печатает..."
+        await message.bot.send_chat_action(message.chat.id, "typing")
+
+        try:
+            # Повторные и перефразированные вопросы отдаём из кэша
+            data = await ask_cache.get(user.role, question)
+            if data is None:
+                data = await (ask_task if ask_task is not None else _post_ask(question, user_id))
+                if data is None or not data.get("answer"):
+                    await message.answer("Ошибка при обработке запроса.", reply_markup=mode_keyboard)
+                    return
+                await ask_cache.set(user.role, question, data)
+
+            answer = data.get("answer")
+            sources = _dedup_sources(data.get("sources", []))
+
+            # Сохраняем источники в state только если они есть
+            if sources:
+                await state.update_data(last_sources=[asdict(src) for src in sources])
+
+            # Формируем текст ответа
+            parts = [answer]
+
+            # Создаём inline-кнопки только если есть источники
+            keyboard = None
+            if sources:
+                parts.append("\n*Источники* (нажми для просмотра):")
+                keyboard = create_sources_keyboard(sources)
+
+            await message.answer(
+                "\n".join(parts),
+                reply_markup=keyboard if keyboard else mode_keyboard,
+                parse_mode="Markdown"
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            logger.exception("Ошибка запроса /ask")
+            await message.answer("Произошла ошибка при подключении к серверу.", reply_markup=mode_keyboard)
+    finally:
+        # Заранее отправленный запрос не нужен (нет прав, ответ из кэша, ошибка)
+        # или уже получен; в обоих случаях задача не остаётся висеть
+        if ask_task is not None:
+            _discard_task(ask_task)
 
-    # Отправляем индикатор "печатает..."
-    await message.bot.send_chat_action(message.chat.id, "typing")
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                    f"{settings.api_base_url}/ask",
-                    json={"query": question, "user_id": user_id}
+# Callback-обработчик для источников
+async def _fetch_source_chunks(filename: str, page: int, limit: int) -> list[dict] | None:
+    """Получить фрагменты источника (из кэша или API); None при ошибке API"""
+    chunks = await source_cache.get(filename, page, limit)
+    if chunks is not None:
+        return chunks
+
+    http = await get_http_session()
+
+    # Чтение идемпотентно: повторяем при любой ошибке сервера или соединения
+    for attempt in range(_MAX_ATTEMPTS):
+        last = attempt == _MAX_ATTEMPTS - 1
+        try:
+            async with http.post(
+                    _SOURCE_URL,
+                    json={"filename": filename, "page": page, "limit": limit},
+                    timeout=_SOURCE_TIMEOUT,
             ) as resp:
                 if resp.status == 200:
-                    data = await resp.json()
-                    answer = data["answer"]
-                    sources = data.get("sources", [])
-
-                    # Сохраняем источники в state только если они есть
-                    if sources:
-                        await state.update_data(last_sources=sources)
-
-                    # Формируем текст ответа
-                    response_text = answer
-
-                    # Создаём inline-кнопки только если есть источники
-                    keyboard = None
-                    if sources:
-                        response_text += "\n\n*Источники* (нажми для просмотра):"
-                        keyboard = create_sources_keyboard(sources)
-
-                    await message.answer(
-                        response_text,
-                        reply_markup=keyboard if keyboard else mode_keyboard,
-                        parse_mode="Markdown"
-                    )
-                else:
-                    await message.answer("Ошибка при обработке запроса.", reply_markup=mode_keyboard)
-    except Exception as e:
-        await message.answer(f"Произошла ошибка при подключении к серверу.", reply_markup=mode_keyboard)
+                    data = await resp.json(loads=orjson.loads)
+                    break
+                if resp.status < 500 or last:
+                    return None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if last:
+                raise
+        await asyncio.sleep(2 ** attempt)
+
+    chunks = data.get("chunks", [])
+    if chunks:
+        await source_cache.set(filename, page, limit, chunks)
+    return chunks
+
+
+# Ограничение длины текста фрагментов (Telegram limit 4096 символов)
+MAX_SOURCE_TEXT_LEN = 3500
+_CHUNK_SEPARATOR = "\n\n---\n\n"
+
+
+def _join_chunks(chunks: list[dict], suffix: str, limit: int = MAX_SOURCE_TEXT_LEN) -> str:
+    """
+    Склеить тексты фрагментов, обрезав результат до limit символов.
+
+    Фрагменты, которые всё равно не попадут в сообщение, не склеиваются.
+    """
+    parts = []
+    length = 0
+    for chunk in chunks:
+        if parts:
+            length += len(_CHUNK_SEPARATOR)
+        text = chunk.get("text", "")
+        parts.append(text)
+        length += len(text)
+        if length > limit:
+            return _CHUNK_SEPARATOR.join(parts)[:limit] + suffix
+    return _CHUNK_SEPARATOR.join(parts)
 
 
-# Callback-обработчик для источников
 @router.callback_query(F.data.startswith("src:"))
 async def handle_source_callback(callback: CallbackQuery, state: FSMContext):
     """
@@ -488,60 +645,50 @@ async def handle_source_callback(callback: CallbackQuery, state: FSMContext):
 
     # Запрашиваем текст источника
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                    f"{settings.api_base_url}/source",
-                    json={"filename": filename, "page": page or 1, "limit": 3}
-            ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    chunks = data.get("chunks", [])
-
-                    if not chunks:
-                        await callback.message.answer(
-                            f"Текст для `{filename}` (стр. {page}) не найден в базе.",
-                            parse_mode="Markdown"
-                        )
-                        return
-
-                    # Собираем текст из чанков
-                    content = "\n\n---\n\n".join(
-                        chunk.get("text", "") for chunk in chunks
-                    )
-
-                    # Формируем заголовок
-                    if archive:
-                        header = f" *{filename}*\nАрхив: `{archive}`"
-                    else:
-                        header = f" *{filename}*"
-
-                    if page:
-                        header += f"\n Страница: {page}"
-
-                    # Ограничиваем длину (Telegram limit 4096 символов)
-                    max_content_len = 3500
-                    if len(content) > max_content_len:
-                        content = content[:max_content_len] + "\n\n... _(текст сокращён)_"
-
-                    full_message = f"{header}\n\n{content}"
-
-                    await callback.message.answer(
-                        full_message,
-                        parse_mode="Markdown"
-                    )
-                else:
-                    await callback.message.answer(
-                        "Ошибка при получении источника.",
-                        reply_markup=mode_keyboard
-                    )
-    except Exception as e:
+        chunks = await _fetch_source_chunks(filename, page or 1, limit=3)
+        if chunks is None:
+            await callback.message.answer(
+                "Ошибка при получении источника.",
+                reply_markup=mode_keyboard
+            )
+            return
+
+        if not chunks:
+            await callback.message.answer(
+                f"Текст для `{filename}` (стр. {page}) не найден в базе.",
+                parse_mode="Markdown"
+            )
+            return
+
+        # Собираем текст из чанков
+        content = _join_chunks(chunks, "\n\n... (текст сокращён)")
+
+        # Формируем заголовок
+        header_lines = [f" *{filename}*"]
+        if archive:
+            header_lines.append(f"Архив: `{archive}`")
+        if page:
+            header_lines.append(f" Страница: {page}")
+        header = "\n".join(header_lines)
+
+        # Заголовок в Markdown, текст фрагмента без разметки:
+        # его не нужно экранировать и Telegram не разбирает его
+        await callback.message.answer(header, parse_mode="Markdown")
+        await callback.message.answer(content)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        logger.exception("Ошибка запроса /source")
         await callback.message.answer(
-            f"Ошибка подключения: {str(e)[:100]}",
+            "Ошибка подключения к серверу.",
             reply_markup=mode_keyboard
         )
 
 
 # Чтение источников
+# Имя файла и необязательный номер страницы после него:
+# "документ.pdf (стр. 2)", "Источник 1: документ.pdf, стр 2", "документ.pdf"
+_READ_SOURCE_RE = re.compile(r"([^,\s]+\.(?:pdf|docx|doc|txt|md))(?:\D*(\d+))?", re.IGNORECASE)
+
+
 @router.message(BotStates.read_mode, F.text)
 async def handle_read_source(message: Message, state: FSMContext):
     text = message.text.strip()
@@ -549,21 +696,10 @@ async def handle_read_source(message: Message, state: FSMContext):
     filename = None
     page = None
 
-    patterns = [
-        r"(?i)(?:источник\s*\d+\s*:\s*)?([^,\s]+\.(pdf|docx|doc|txt|md))[^\d]*(?:стр\.?\s*)(\d+)",
-        r"(?i)([^,\s]+\.(pdf|docx|doc|txt|md))[^\d]*(\d+)",
-        r"(?i)([^,\s]+\.(pdf|docx|doc|txt|md))",  # Без страницы
-    ]
-
-    for pat in patterns:
-        m = re.search(pat, text)
-        if m:
-            filename = m.group(1)
-            try:
-                page = int(m.group(3)) if m.lastindex >= 3 else 1
-            except (ValueError, TypeError):
-                page = 1
-            break
+    m = _READ_SOURCE_RE.search(text)
+    if m:
+        filename = m.group(1)
+        page = int(m.group(2)) if m.group(2) else 1
 
     if not filename:
         await message.answer(
@@ -578,44 +714,33 @@ async def handle_read_source(message: Message, state: FSMContext):
     await message.bot.send_chat_action(message.chat.id, "typing")
 
     try:
-        async with aiohttp.ClientSession() as http:
-            async with http.post(
-                    f"{settings.api_base_url}/source",
-                    json={"filename": filename, "page": page, "limit": 5},
-            ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    chunks = data.get("chunks", [])
-
-                    if not chunks:
-                        await message.answer(
-                            f"Текст для `{filename}` (стр. {page}) не найден.",
-                            reply_markup=mode_keyboard,
-                            parse_mode="Markdown"
-                        )
-                        return
-
-                    content = "\n\n---\n\n".join(
-                        chunk.get("text", "") for chunk in chunks
-                    )
-
-                    # Ограничение длины
-                    if len(content) > 3500:
-                        content = content[:3500] + "\n\n... _(текст сокращён)_"
+        chunks = await _fetch_source_chunks(filename, page, limit=5)
+        if chunks is None:
+            await message.answer(
+                "Ошибка при получении источника.",
+                reply_markup=mode_keyboard
+            )
+            return
+
+        if not chunks:
+            await message.answer(
+                f"Текст для `{filename}` (стр. {page}) не найден.",
+                reply_markup=mode_keyboard,
+                parse_mode="Markdown"
+            )
+            return
+
+        content = _join_chunks(chunks, "\n\n... _(текст сокращён)_")
+
+        header = f"*{filename}*, стр. {page}\n\n"
 
-                    header = f"*{filename}*, стр. {page}\n\n"
-
-                    await message.answer(
-                        header + content,
-                        reply_markup=mode_keyboard,
-                        parse_mode="Markdown"
-                    )
-                else:
-                    await message.answer(
-                        "Ошибка при получении источника.",
-                        reply_markup=mode_keyboard
-                    )
-    except Exception:
+        await message.answer(
+            header + content,
+            reply_markup=mode_keyboard,
+            parse_mode="Markdown"
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        logger.exception("Ошибка запроса /source")
         await message.answer(
             "Произошла ошибка при подключении к серверу.",
             reply_markup=mode_keyboard
@@ -623,6 +748,14 @@ async def handle_read_source(message: Message, state: FSMContext):
 
 
 # Загрузка файлов
+def _remove_temp_file(path: str) -> None:
+    """Удалить временный файл загрузки"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
 @router.message(BotStates.ask_mode, F.document)
 async def handle_ask_document(message: Message):
     await message.answer(
@@ -633,9 +766,7 @@ async def handle_ask_document(message: Message):
 
 @router.message(BotStates.upload_mode, F.document)
 async def handle_upload(message: Message):
-    async for session in get_session():
-        repo = UserRepository(session)
-        user = await repo.get_by_telegram_id(message.from_user.id)
+    user = await get_user_cached(message.from_user.id)
     if not user or user.role != "admin":
         await message.answer("Загрузка запрещена: требуется токен администратора.")
         return
@@ -653,7 +784,8 @@ async def handle_upload(message: Message):
         )
         return
 
-    file_size_mb = message.document.file_size / (1024 * 1024)
+    # file_size в Telegram необязателен; без него размер ограничит сам Bot API
+    file_size_mb = (message.document.file_size or 0) / (1024 * 1024)
     if file_size_mb > 50:
         await message.answer(
             f"Файл слишком большой ({file_size_mb:.1f} MB). Максимум 50 MB.",
@@ -661,89 +793,183 @@ async def handle_upload(message: Message):
         )
         return
 
+    # Скачиваем во временный файл, чтобы не держать документ в памяти целиком
+    fd, temp_path = tempfile.mkstemp(prefix="tg_upload_")
+    os.close(fd)
     try:
-        file_content = await message.bot.download(message.document)
-    except Exception as e:
+        await message.bot.download(message.document, destination=temp_path)
+    except (TelegramAPIError, aiohttp.ClientError, asyncio.TimeoutError, OSError):
+        logger.exception(f"Не удалось скачать файл {filename}")
+        _remove_temp_file(temp_path)
         await message.answer("Произошла ошибка при загрузке файла.", reply_markup=mode_keyboard)
         return
 
+    job = UploadJob(message=message, temp_path=temp_path, filename=filename, file_type=file_type)
     try:
-        timeout = aiohttp.ClientTimeout(total=3600)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            data = aiohttp.FormData()
-            data.add_field('file', file_content, filename=filename)
-            data.add_field('user_id', str(message.from_user.id))
+        ahead = await upload_queue.submit(job)
+    except asyncio.QueueFull:
+        _remove_temp_file(temp_path)
+        await message.answer(
+            "Слишком много файлов в обработке. Попробуй позже.",
+            reply_markup=mode_keyboard
+        )
+        return
 
-            if file_type == "archive":
-                await message.answer(
-                    f"Начал обработку архива `{filename}`.\n"
-                    "Это может занять значительное время...",
-                    reply_markup=mode_keyboard,
-                    parse_mode="Markdown"
-                )
-            else:
-                await message.answer(
-                    f"Начал обработку файла `{filename}`...",
-                    reply_markup=mode_keyboard,
-                    parse_mode="Markdown"
-                )
+    if ahead:
+        await message.answer(
+            f"Файл `{filename}` поставлен в очередь (перед ним: {ahead}).",
+            reply_markup=mode_keyboard,
+            parse_mode="Markdown"
+        )
 
-            async with session.post(
-                    f"{settings.api_base_url}/upload",
-                    data=data
+
+async def _send_upload(
+        http: aiohttp.ClientSession, job: UploadJob, last: bool
+) -> tuple[int, dict | None, str] | None:
+    """
+    Одна попытка отправки файла в API.
+
+    Returns:
+        Результат для _post_upload или None, если запрос стоит повторить
+        (на последней попытке ошибка соединения пробрасывается)
+    """
+    # FormData одноразовая: на каждую попытку файл открывается заново
+    with open(job.temp_path, "rb") as file_obj:
+        # aiohttp читает файл частями при отправке multipart
+        data = aiohttp.FormData()
+        data.add_field('file', file_obj, filename=job.filename, content_type="application/octet-stream")
+        data.add_field('user_id', str(job.message.from_user.id))
+
+        try:
+            async with http.post(
+                    _UPLOAD_URL,
+                    data=data,
+                    timeout=_UPLOAD_TIMEOUT,
             ) as resp:
                 if resp.status == 200:
-                    response_data = await resp.json()
-                    chunks_added = response_data.get("chunks_added", 0)
-                    files_processed = response_data.get("files_processed", 0)
-                    processed_files = response_data.get("processed_files", [])
-                    errors = response_data.get("errors", [])
-
-                    if file_type == "archive":
-                        success_msg = (
-                            f"Архив `{filename}` успешно обработан!\n\n"
-                            f"Статистика:\n"
-                            f"- Файлов обработано: {files_processed}\n"
-                            f"- Всего чанков: {chunks_added}\n"
-                        )
-
-                        if processed_files:
-                            success_msg += f"\nОбработанные файлы:\n"
-                            files_to_show = processed_files[:15]
-                            for f in files_to_show:
-                                fname = f.get("filename", "?")
-                                fchunks = f.get("chunks", 0)
-                                success_msg += f"• `{fname}` ({fchunks} чанков)\n"
-
-                            if len(processed_files) > 15:
-                                success_msg += f"• ... и ещё {len(processed_files) - 15} файлов\n"
-
-                        if errors:
-                            success_msg += f"\nОшибки ({len(errors)}):\n"
-                            for err in errors[:3]:
-                                success_msg += f"• {err[:50]}...\n" if len(err) > 50 else f"• {err}\n"
-                            if len(errors) > 3:
-                                success_msg += f"• ... и ещё {len(errors) - 3}\n"
-                    else:
-                        success_msg = (
-                            f"Документ `{filename}` успешно обработан!\n"
-                            f"Добавлено чанков: {chunks_added}"
-                        )
-
-                    await message.answer(success_msg, reply_markup=mode_keyboard, parse_mode="Markdown")
-
-                elif resp.status == 403:
-                    await message.answer("Доступ запрещён.", reply_markup=mode_keyboard)
-                else:
-                    error_text = await resp.text()
-                    await message.answer(
-                        f"Ошибка при обработке файла: {error_text[:200]}",
-                        reply_markup=mode_keyboard
+                    return resp.status, await resp.json(loads=orjson.loads), ""
+                if resp.status not in _RETRY_STATUSES or last:
+                    return resp.status, None, await resp.text()
+        except aiohttp.ClientConnectorError:
+            if last:
+                raise
+    return None
+
+
+async def _post_upload(job: UploadJob) -> tuple[int, dict | None, str]:
+    """
+    Отправить файл в API с повторными попытками.
+
+    Повторяются только запросы, не дошедшие до API (ошибка соединения или
+    ответ шлюза), чтобы один документ не проиндексировался дважды.
+
+    Returns:
+        (HTTP-статус, JSON ответа при статусе 200, текст ошибки иначе)
+    """
+    http = await get_http_session()
+
+    for attempt in range(_MAX_ATTEMPTS - 1):
+        result = await _send_upload(http, job, last=False)
+        if result is not None:
+            return result
+        logger.warning(f"Повтор загрузки {job.filename} (попытка {attempt + 2})")
+        await asyncio.sleep(2 ** attempt)
+
+    # Последняя попытка всегда даёт результат или исключение
+    return await _send_upload(http, job, last=True)
+
+
+async def _process_upload(job: UploadJob) -> None:
+    """Отправить скачанный документ в API и сообщить результат"""
+    message = job.message
+    filename = job.filename
+    file_type = job.file_type
+
+    try:
+        if file_type == "archive":
+            await message.answer(
+                f"Начал обработку архива `{filename}`.\n"
+                "Это может занять значительное время...",
+                reply_markup=mode_keyboard,
+                parse_mode="Markdown"
+            )
+        else:
+            await message.answer(
+                f"Начал обработку файла `{filename}`...",
+                reply_markup=mode_keyboard,
+                parse_mode="Markdown"
+            )
+
+        status, response_data, error_text = await _post_upload(job)
+
+        if status == 200 and response_data.get("duplicate"):
+            await message.answer(
+                f"Файл `{filename}` уже был загружен ранее, повторная индексация не нужна.",
+                reply_markup=mode_keyboard,
+                parse_mode="Markdown"
+            )
+
+        elif status == 200:
+            # База знаний изменилась: сбрасываем закэшированные ответы и фрагменты
+            source_cache.clear()
+            ask_cache.clear()
+            chunks_added = response_data.get("chunks_added", 0)
+            files_processed = response_data.get("files_processed", 0)
+            processed_files = response_data.get("processed_files", [])
+            errors = response_data.get("errors", [])
+
+            if file_type == "archive":
+                parts = [
+                    f"Архив `{filename}` успешно обработан!\n\n"
+                    f"Статистика:\n"
+                    f"- Файлов обработано: {files_processed}\n"
+                    f"- Всего чанков: {chunks_added}\n"
+                ]
+
+                if processed_files:
+                    parts.append("\nОбработанные файлы:\n")
+                    parts.extend(
+                        f"• `{f.get('filename', '?')}` ({f.get('chunks', 0)} чанков)\n"
+                        for f in processed_files[:15]
                     )
+                    if len(processed_files) > 15:
+                        parts.append(f"• ... и ещё {len(processed_files) - 15} файлов\n")
+
+                if errors:
+                    parts.append(f"\nОшибки ({len(errors)}):\n")
+                    parts.extend(
+                        f"• {err[:50]}...\n" if len(err) > 50 else f"• {err}\n"
+                        for err in errors[:3]
+                    )
+                    if len(errors) > 3:
+                        parts.append(f"• ... и ещё {len(errors) - 3}\n")
+
+                success_msg = "".join(parts)
+            else:
+                success_msg = (
+                    f"Документ `{filename}` успешно обработан!\n"
+                    f"Добавлено чанков: {chunks_added}"
+                )
+
+            await message.answer(success_msg, reply_markup=mode_keyboard, parse_mode="Markdown")
+
+        elif status == 403:
+            await message.answer("Доступ запрещён.", reply_markup=mode_keyboard)
+        else:
+            await message.answer(
+                f"Ошибка при обработке файла: {error_text[:200]}",
+                reply_markup=mode_keyboard
+            )
     except asyncio.TimeoutError:
         await message.answer("Превышено время ожидания.", reply_markup=mode_keyboard)
-    except Exception as e:
-        await message.answer(f"Произошла ошибка: {str(e)[:100]}", reply_markup=mode_keyboard)
+    except aiohttp.ClientError:
+        logger.exception(f"Ошибка загрузки {filename} в API")
+        await message.answer("Ошибка подключения к серверу.", reply_markup=mode_keyboard)
+    finally:
+        _remove_temp_file(job.temp_path)
+
+
+upload_queue = UploadQueue(_process_upload)
 
 
 @router.message(BotStates.upload_mode, F.text)
@@ -0,0 +1,33 @@
+"""Общая HTTP-сессия бота для запросов к API"""
+
+import aiohttp
+
+_session: aiohttp.ClientSession | None = None
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Ленивая инициализация общей сессии (keep-alive пул соединений)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=1800),
+            connector=aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=32,
+                keepalive_timeout=75,
+            ),
+        )
+    return _session
+
+
+async def open_http_session() -> None:
+    """Создать общую сессию при запуске бота"""
+    await get_http_session()
+
+
+async def close_http_session() -> None:
+    """Закрыть общую сессию"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
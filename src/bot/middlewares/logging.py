@@ -4,6 +4,8 @@ from typing import Any, Awaitable, Callable, Dict
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 
+logger = logging.getLogger(__name__)
+
 
 class LoggingMiddleware(BaseMiddleware):
     async def __call__(
@@ -12,5 +14,7 @@ class LoggingMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        logging.info(f"Received event: {event}")
+        # Строковое представление события дорогое: строим его только если INFO включён
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Received event: %s", event)
         return await handler(event, data)
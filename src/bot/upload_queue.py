@@ -0,0 +1,87 @@
+"""Фоновая очередь загрузки документов в API"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UploadJob:
+    """Скачанный документ, ожидающий отправки в API"""
+    message: Message
+    temp_path: str
+    filename: str
+    file_type: str  # "document" или "archive"
+
+
+class UploadQueue:
+    """
+    Очередь загрузок с фиксированным числом воркеров.
+
+    Ограничивает число одновременных тяжёлых загрузок в API. Пока воркеры
+    не запущены (например, в тестах), задания обрабатываются сразу.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[UploadJob], Awaitable[None]],
+        workers: int = 4,
+        maxsize: int = 50,
+    ):
+        self._process = process
+        self._workers_count = workers
+        self._queue: asyncio.Queue[UploadJob] = asyncio.Queue(maxsize=maxsize)
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """Запустить воркеры"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"upload-worker-{i}")
+            for i in range(self._workers_count)
+        ]
+        logger.info("Очередь загрузок запущена: %s воркеров", self._workers_count)
+
+    async def stop(self) -> None:
+        """Остановить воркеры"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, job: UploadJob) -> int:
+        """
+        Поставить задание в очередь.
+
+        Returns:
+            Количество заданий, ожидающих перед этим
+
+        Raises:
+            asyncio.QueueFull: если очередь переполнена
+        """
+        if not self._workers:
+            await self._process(job)
+            return 0
+        ahead = self._queue.qsize()
+        self._queue.put_nowait(job)
+        return ahead
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception:
+                logger.exception("Ошибка фоновой загрузки %s", job.filename)
+            finally:
+                self._queue.task_done()
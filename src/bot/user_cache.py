@@ -0,0 +1,65 @@
+"""In-process кэш пользователей бота по telegram id"""
+
+import time
+from collections import OrderedDict
+
+from infra.db.database import async_session_factory
+from infra.db.models import User
+from infra.db.user_repository import UserRepository
+
+# Роль меняется только через /reauth и ввод токена, которые сбрасывают запись,
+# поэтому TTL может быть большим
+USER_CACHE_TTL = 300.0
+USER_CACHE_MAXSIZE = 1024
+
+_USER_CACHE: OrderedDict[int, tuple[float, User]] = OrderedDict()
+
+
+async def get_user_cached(tg_id: int) -> User | None:
+    """Получить пользователя, обращаясь к БД не чаще раза в USER_CACHE_TTL"""
+    user = peek_cached_user(tg_id)
+    if user is not None:
+        return user
+
+    async with async_session_factory() as session:
+        repo = UserRepository(session)
+        user = await repo.get_by_telegram_id(tg_id)
+
+    if user:
+        _USER_CACHE[tg_id] = (time.monotonic(), user)
+        _USER_CACHE.move_to_end(tg_id)
+        if len(_USER_CACHE) > USER_CACHE_MAXSIZE:
+            _USER_CACHE.popitem(last=False)
+    else:
+        _USER_CACHE.pop(tg_id, None)
+    return user
+
+
+def peek_cached_user(tg_id: int) -> User | None:
+    """Вернуть пользователя из кэша без обращения к БД"""
+    hit = _USER_CACHE.get(tg_id)
+    if hit and time.monotonic() - hit[0] < USER_CACHE_TTL:
+        _USER_CACHE.move_to_end(tg_id)
+        return hit[1]
+    return None
+
+
+def last_seen_user(tg_id: int) -> User | None:
+    """
+    Вернуть пользователя из кэша, даже если запись устарела по TTL
+
+    Годится только для догадок (например, стоит ли заранее отправлять
+    запрос); права проверяются по get_user_cached.
+    """
+    hit = _USER_CACHE.get(tg_id)
+    return hit[1] if hit else None
+
+
+def invalidate_user(tg_id: int) -> None:
+    """Сбросить закэшированного пользователя (после смены прав)"""
+    _USER_CACHE.pop(tg_id, None)
+
+
+def clear_user_cache() -> None:
+    """Очистить кэш пользователей"""
+    _USER_CACHE.clear()
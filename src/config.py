@@ -1,3 +1,4 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -23,6 +24,10 @@ class Settings(BaseSettings):
     db_port: int = 5432
     db_name: str = "legal_rag"
     database_url: str | None = None
+    # Пул соединений: бот и API работают в одном процессе и делят один engine
+    db_pool_size: int = 20
+    db_max_overflow: int = 40
+    db_pool_recycle: int = 1800
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -30,8 +35,8 @@ class Settings(BaseSettings):
         protected_namespaces=(),
     )
 
-    def __init__(self, **data):
-        super().__init__(**data)
+    @model_validator(mode="after")
+    def _fill_database_url(self) -> "Settings":
         if not self.database_url:
             self.database_url = _build_db_url(
                 self.db_user,
@@ -40,6 +45,7 @@ class Settings(BaseSettings):
                 self.db_port,
                 self.db_name,
             )
+        return self
 
 
 settings = Settings()
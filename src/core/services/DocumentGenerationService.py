@@ -1,10 +1,14 @@
 """Сервис генерации юридических документов"""
 
+import asyncio
 import io
 import logging
+import re
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 import markdown
@@ -19,8 +23,16 @@ from infra.llm.prompts import (
 )
 from infra.llm.yandex_gpt import YandexGPTMessage
 
+from .workers import default_workers
+
 logger = logging.getLogger(__name__)
 
+# Системное сообщение не меняется между запросами и создаётся один раз
+_GENERATION_SYSTEM_MESSAGE = YandexGPTMessage(role="system", text=DOCUMENT_GENERATION_SYSTEM_PROMPT)
+
+# Первый заголовок первого уровня: "# Заголовок"
+_H1_RE = re.compile(r"^[ \t]*# +(\S.*?)\s*$", re.MULTILINE)
+
 
 # CSS для PDF документа
 DOCUMENT_CSS = """
@@ -169,6 +181,28 @@ hr {
 """
 
 
+@lru_cache(maxsize=1)
+def _get_stylesheet() -> tuple[FontConfiguration, CSS]:
+    """Разобрать DOCUMENT_CSS один раз на процесс"""
+    font_config = FontConfiguration()
+    return font_config, CSS(string=DOCUMENT_CSS, font_config=font_config)
+
+
+def _write_pdf(html_content: str) -> bytes:
+    """
+    Отрендерить HTML в PDF.
+
+    Функция модульного уровня, чтобы её можно было выполнить в процессе-воркере:
+    FontConfiguration не сериализуется, поэтому стили разбираются в каждом процессе.
+    """
+    font_config, css = _get_stylesheet()
+
+    return HTML(string=html_content).write_pdf(
+        stylesheets=[css],
+        font_config=font_config
+    )
+
+
 # Модели данных
 @dataclass
 class GeneratedDocument:
@@ -184,9 +218,30 @@ class GeneratedDocument:
 class DocumentGenerationService:
     """Сервис для генерации юридических документов"""
 
-    def __init__(self, agent: LegalRAGAgent | None = None):
+    def __init__(self, agent: LegalRAGAgent | None = None, pdf_workers: int | None = None):
+        """
+        Args:
+            agent: RAG-агент
+            pdf_workers: Число процессов для рендеринга PDF
+                (None - по числу CPU, 0 - рендеринг в потоке текущего процесса)
+        """
         self.agent = agent
-        self._font_config = FontConfiguration()
+        # Расширения для лучшего форматирования; конвертер создаётся один раз
+        self._md = markdown.Markdown(
+            extensions=[
+                'tables',
+                'fenced_code',
+                'codehilite',
+                'toc',
+                'nl2br',
+                'sane_lists',
+            ],
+            output_format='html5'
+        )
+        if pdf_workers is None:
+            pdf_workers = default_workers()
+        # WeasyPrint держит GIL, поэтому рендеринг выносится в отдельные процессы
+        self._pdf_pool = ProcessPoolExecutor(max_workers=pdf_workers) if pdf_workers > 0 else None
 
     def _detect_document_type(self, request: str) -> str | None:
         """Определить тип документа по запросу"""
@@ -200,14 +255,8 @@ class DocumentGenerationService:
 
     def _extract_title(self, markdown_content: str) -> str:
         """Извлечь заголовок из Markdown"""
-        lines = markdown_content.strip().split('\n')
-
-        for line in lines:
-            line = line.strip()
-            if line.startswith('# '):
-                return line[2:].strip()
-
-        return "Документ"
+        m = _H1_RE.search(markdown_content)
+        return m.group(1) if m else "Документ"
 
     def _add_disclaimer(self, markdown_content: str) -> str:
         """Добавить дисклеймер в конец документа"""
@@ -226,21 +275,7 @@ class DocumentGenerationService:
 
     def _markdown_to_html(self, markdown_content: str) -> str:
         """Конвертировать Markdown в HTML"""
-        # Расширения для лучшего форматирования
-        extensions = [
-            'tables',
-            'fenced_code',
-            'codehilite',
-            'toc',
-            'nl2br',
-            'sane_lists',
-        ]
-
-        html_body = markdown.markdown(
-            markdown_content,
-            extensions=extensions,
-            output_format='html5'
-        )
+        html_body = self._md.reset().convert(markdown_content)
 
         # Оборачиваем в полный HTML документ
         html = f"""<!DOCTYPE html>
@@ -259,16 +294,24 @@ class DocumentGenerationService:
 
     def _html_to_pdf(self, html_content: str) -> bytes:
         """Конвертировать HTML в PDF"""
-        css = CSS(string=DOCUMENT_CSS, font_config=self._font_config)
+        return _write_pdf(html_content)
 
-        html_doc = HTML(string=html_content)
+    async def _render_pdf(self, markdown_content: str) -> bytes:
+        """Markdown -> HTML -> PDF вне event loop"""
+        # Конвертер Markdown не потокобезопасен, поэтому HTML собирается в event loop
+        html_content = self._markdown_to_html(markdown_content)
 
-        pdf_bytes = html_doc.write_pdf(
-            stylesheets=[css],
-            font_config=self._font_config
-        )
+        loop = asyncio.get_running_loop()
+
+        if self._pdf_pool is None:
+            return await loop.run_in_executor(None, self._html_to_pdf, html_content)
+        return await loop.run_in_executor(self._pdf_pool, _write_pdf, html_content)
 
-        return pdf_bytes
+    async def close(self) -> None:
+        """Остановить процессы рендеринга"""
+        if self._pdf_pool is not None:
+            self._pdf_pool.shutdown(wait=False, cancel_futures=True)
+            self._pdf_pool = None
 
     async def generate(
             self,
@@ -325,7 +368,7 @@ class DocumentGenerationService:
         )
 
         messages = [
-            YandexGPTMessage(role="system", text=DOCUMENT_GENERATION_SYSTEM_PROMPT),
+            _GENERATION_SYSTEM_MESSAGE,
             YandexGPTMessage(role="user", text=prompt),
         ]
 
@@ -344,9 +387,8 @@ class DocumentGenerationService:
         # Извлекаем заголовок
         title = self._extract_title(markdown_content)
 
-        # Конвертируем в PDF
-        html_content = self._markdown_to_html(markdown_with_disclaimer)
-        pdf_bytes = self._html_to_pdf(html_content)
+        # Конвертируем в PDF вне event loop
+        pdf_bytes = await self._render_pdf(markdown_with_disclaimer)
 
         logger.info(f"Документ сгенерирован: {title} ({len(pdf_bytes)} bytes)")
 
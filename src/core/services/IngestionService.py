@@ -1,23 +1,51 @@
+import asyncio
+import hashlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 import os
+import shutil
 import tempfile
 import logging
 from dataclasses import dataclass, asdict
+from typing import Iterator
 
 import aiofiles
 from fastapi import UploadFile
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from infra.db.document_repository import DocumentRepository
+from infra.db.models import Document
+from infra.db.uow import UnitOfWork
 
 from infra.llm import LegalRAGAgent
 from infra.llm.document_loader import (
     ArchiveHandler,
+    LegalDocumentLoader,
     SUPPORTED_EXTENSIONS,
     ARCHIVE_EXTENSIONS,
     COMPOUND_ARCHIVE_EXTENSIONS,
     ArchiveProcessingStats,
 )
 
+from .workers import default_workers
+
 logger = logging.getLogger(__name__)
 
+# Размер блока при сохранении загруженного файла
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Тип файла по расширению (архивные расширения имеют приоритет)
+_FILE_TYPE_BY_EXTENSION = {
+    **{ext: "document" for ext in SUPPORTED_EXTENSIONS},
+    **{ext: "archive" for ext in ARCHIVE_EXTENSIONS},
+}
+
+# Сколько документов архива читается и разбивается за раз
+ARCHIVE_DOCUMENTS_BATCH = 100
+
 
 @dataclass
 class IngestionResult:
@@ -27,33 +55,176 @@ class IngestionResult:
     file_type: str  # "document" или "archive"
     processed_files: list[dict]  # Список обработанных файлов
     errors: list[str] = None
+    duplicate: bool = False  # Файл уже был проиндексирован ранее
 
     def __post_init__(self):
         if self.errors is None:
             self.errors = []
 
 
+def _next_batch(iterator: Iterator, size: int) -> list:
+    """Взять до size элементов итератора (выполняется в потоке)"""
+    return list(islice(iterator, size))
+
+
+def _load_and_split(loader: LegalDocumentLoader, splitter, file_path: Path) -> list:
+    """Загрузить документ и разбить на чанки"""
+    documents = loader.load_file(file_path)
+    if not documents:
+        return []
+    return splitter.split_documents(documents)
+
+
+# Загрузчик и сплиттер процесса пула разбора (задаются в _init_parse_worker)
+_worker_loader: LegalDocumentLoader | None = None
+_worker_splitter = None
+
+
+def _init_parse_worker(loader: LegalDocumentLoader, splitter) -> None:
+    """Запомнить загрузчик и сплиттер при запуске процесса пула"""
+    global _worker_loader, _worker_splitter
+    _worker_loader = loader
+    _worker_splitter = splitter
+
+
+def _load_and_split_in_worker(file_path: Path) -> list:
+    """Загрузить документ и разбить на чанки (выполняется в процессе пула)"""
+    return _load_and_split(_worker_loader, _worker_splitter, file_path)
+
+
+def _new_file_hasher():
+    """Хешер содержимого файла для поиска повторных загрузок"""
+    # Криптостойкость не нужна, важна скорость; 32 байта помещаются в Document.file_hash
+    return hashlib.blake2b(digest_size=32)
+
+
+def _copy_file_range(src_fd: int, dest_fd: int) -> bool:
+    """
+    Скопировать файл средствами ядра (copy_file_range), без буферов Python.
+
+    Returns:
+        False, если системный вызов недоступен и нужно копировать вручную
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+    remaining = os.fstat(src_fd).st_size
+    offset = 0
+    try:
+        while remaining > 0:
+            copied = os.copy_file_range(src_fd, dest_fd, remaining, offset, offset)
+            if copied == 0:
+                break
+            offset += copied
+            remaining -= copied
+    except OSError:
+        # Разные файловые системы или старое ядро: докопируем обычным способом
+        if offset:
+            raise
+        return False
+    return True
+
+
+def _copy_to_file(src: io.IOBase, dest_path: str, hasher=None) -> None:
+    """
+    Скопировать содержимое файлового объекта на диск (выполняется в потоке)
+
+    Если передан hasher, он обновляется каждым скопированным блоком,
+    чтобы не перечитывать файл ради хеша.
+    """
+    src.seek(0)
+    with open(dest_path, 'wb') as out_file:
+        if hasher is not None:
+            while block := src.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(block)
+                out_file.write(block)
+            return
+        # SpooledTemporaryFile, уже сброшенный на диск, копируем внутри ядра;
+        # fileno() у файла в памяти не вызываем, иначе он сам сбросится на диск
+        if getattr(src, "_rolled", False) and _copy_file_range(src.fileno(), out_file.fileno()):
+            return
+        shutil.copyfileobj(src, out_file, UPLOAD_CHUNK_SIZE)
+
+
 class IngestionService:
     """Сервис для загрузки и индексации документов"""
 
-    def __init__(self, agent: LegalRAGAgent | None = None):
+    def __init__(
+        self,
+        agent: LegalRAGAgent | None = None,
+        max_concurrent_ingestions: int | None = None,
+        parse_workers: int | None = None,
+        scratch_root: str | None = None,
+        session_factory: async_sessionmaker[AsyncSession] | None = None,
+    ):
+        """
+        Args:
+            agent: RAG-агент
+            max_concurrent_ingestions: Сколько файлов обрабатывается одновременно
+                (по умолчанию min(4, число CPU)); остальные загрузки ждут очереди
+            parse_workers: Число процессов для разбора и разбиения документов
+                (None - по числу CPU, 0 - разбор в потоке текущего процесса)
+            scratch_root: Где хранить загруженные файлы на время разбора
+                (по умолчанию INGEST_SCRATCH_DIR или системный temp; например, /dev/shm)
+            session_factory: Фабрика сессий БД; если задана, уже проиндексированные
+                файлы распознаются по хешу и повторно не обрабатываются
+        """
         self.agent = agent
+        self._session_factory = session_factory
+        if max_concurrent_ingestions is None:
+            max_concurrent_ingestions = default_workers()
+        self._semaphore = asyncio.Semaphore(max_concurrent_ingestions)
+
+        # Каталоги для загрузок создаются один раз: по одному на каждую
+        # одновременную обработку, чтобы одноимённые файлы не пересекались
+        # и исходное имя сохранялось для метаданных документа
+        self._scratch_dir = Path(tempfile.mkdtemp(
+            prefix="legal_upload_",
+            dir=scratch_root or os.environ.get("INGEST_SCRATCH_DIR"),
+        ))
+        self._free_slots: asyncio.Queue[Path] = asyncio.Queue()
+        for i in range(max_concurrent_ingestions):
+            slot = self._scratch_dir / str(i)
+            slot.mkdir()
+            self._free_slots.put_nowait(slot)
+
+        if parse_workers is None:
+            parse_workers = default_workers()
+        # Разбор PDF/DOCX и разбиение на чанки держат GIL, поэтому
+        # одновременные загрузки обрабатываются в отдельных процессах.
+        # Загрузчик и сплиттер передаются в процесс один раз при запуске,
+        # а не с каждой задачей: так кэш разбиения сохраняется между файлами.
+        # Пул создаётся при первом разборе, чтобы не держать его без загрузок
+        self._parse_workers = parse_workers
+        self._parse_pool: ProcessPoolExecutor | None = None
+
+    def _get_parse_pool(self) -> ProcessPoolExecutor | None:
+        """Пул процессов разбора; None, если разбор идёт в текущем процессе"""
+        if self._parse_pool is None and self._parse_workers > 0:
+            self._parse_pool = ProcessPoolExecutor(
+                max_workers=self._parse_workers,
+                initializer=_init_parse_worker,
+                initargs=(self.agent.document_loader, self.agent.text_splitter),
+            )
+        return self._parse_pool
+
+    async def close(self) -> None:
+        """Остановить процессы разбора документов и удалить временные каталоги"""
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False, cancel_futures=True)
+            self._parse_pool = None
+        shutil.rmtree(self._scratch_dir, ignore_errors=True)
 
     def _get_file_type(self, filename: str) -> str:
         """Определить тип файла"""
-        filename_lower = filename.lower()
-
-        for ext in COMPOUND_ARCHIVE_EXTENSIONS:
-            if filename_lower.endswith(ext):
-                return "archive"
+        head, dot, ext = filename.lower().rpartition(".")
+        if not dot:
+            return "unknown"
 
-        if any(filename_lower.endswith(ext) for ext in ARCHIVE_EXTENSIONS):
+        # Составные расширения (.tar.gz): смотрим на предпоследний суффикс
+        if f".{head.rpartition('.')[2]}.{ext}" in COMPOUND_ARCHIVE_EXTENSIONS:
             return "archive"
 
-        if any(filename_lower.endswith(ext) for ext in SUPPORTED_EXTENSIONS):
-            return "document"
-
-        return "unknown"
+        return _FILE_TYPE_BY_EXTENSION.get(f".{ext}", "unknown")
 
     async def processFile(self, file: UploadFile) -> IngestionResult:
         """
@@ -71,59 +242,149 @@ class IngestionService:
         if file_type == "unknown":
             raise ValueError(f"Неподдерживаемый формат файла: {filename}")
 
-        temp_dir = tempfile.mkdtemp(prefix="legal_upload_")
-        temp_path = os.path.join(temp_dir, filename)
+        # Ограничиваем число одновременных тяжёлых обработок
+        async with self._semaphore:
+            return await self._save_and_process(file, filename, file_type)
 
-        try:
-            # Сохраняем файл
-            logger.info(f"Сохранение файла: {filename} ({file_type})")
+    async def _save_and_process(self, file: UploadFile, filename: str, file_type: str) -> IngestionResult:
+        """Сохранить файл во временный каталог и проиндексировать"""
+        slot = await self._free_slots.get()
+        # Берём только базовое имя, чтобы "../" в имени не вывело за пределы каталога
+        temp_path = os.path.join(slot, Path(filename).name or "upload")
 
-            async with aiofiles.open(temp_path, 'wb') as out_file:
-                while True:
-                    chunk = await file.read(8192)
-                    if not chunk:
-                        break
-                    await out_file.write(chunk)
+        try:
+            # Сохраняем файл; хеш для поиска повторных загрузок считается при копировании
+            logger.info("Сохранение файла: %s (%s)", filename, file_type)
+            hasher = _new_file_hasher() if self._session_factory is not None else None
+
+            if isinstance(file.file, io.IOBase):
+                # Копируем целиком в одном потоке, без переключений event loop на каждый блок
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, _copy_to_file, file.file, temp_path, hasher)
+            else:
+                async with aiofiles.open(temp_path, 'wb') as out_file:
+                    while True:
+                        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        if hasher is not None:
+                            hasher.update(chunk)
+                        await out_file.write(chunk)
 
             file_size = os.path.getsize(temp_path)
-            logger.info(f"Файл сохранён: {filename}, размер: {file_size / 1024 / 1024:.2f} MB")
+            logger.info("Файл сохранён: %s, размер: %.2f MB", filename, file_size / 1024 / 1024)
+
+            # Повторная загрузка того же файла: эмбеддинги и запись в Qdrant не нужны
+            file_hash = None
+            if hasher is not None:
+                file_hash = hasher.hexdigest()
+                indexed = await self._find_indexed(file_hash)
+                # Запись в БД переживает очистку коллекции, поэтому
+                # наличие точек файла проверяется в самом Qdrant
+                if indexed is not None and await self.agent.vector_store.has_upload(file_hash):
+                    logger.info("Файл %s уже проиндексирован, пропускаем", filename)
+                    return IngestionResult(
+                        chunks_count=indexed.chunks_count,
+                        files_processed=0,
+                        file_type=file_type,
+                        processed_files=[],
+                        duplicate=True,
+                    )
+                if indexed is not None:
+                    logger.info("Файл %s есть в БД, но не в коллекции: индексируем заново", filename)
 
             # Обработка в зависимости от типа
             if file_type == "archive":
-                return await self._process_archive(Path(temp_path))
+                result = await self._process_archive(Path(temp_path), file_hash)
             else:
-                return await self._process_document(Path(temp_path), filename)
+                result = await self._process_document(Path(temp_path), filename, file_hash)
+
+            if file_hash is not None and result.chunks_count:
+                await self._record_indexed(filename, file_hash, result.chunks_count)
+            return result
 
-        except Exception as e:
-            logger.exception(f"Ошибка обработки файла {filename}")
+        except Exception:
+            logger.exception("Ошибка обработки файла %s", filename)
             raise
 
         finally:
-            # Очищаем временные файлы
+            # Очищаем временный файл и освобождаем каталог
             try:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                if os.path.exists(temp_dir):
-                    os.rmdir(temp_dir)
-            except Exception as e:
-                logger.warning(f"Ошибка очистки временных файлов: {e}")
-
-    async def _process_document(self, file_path: Path, filename: str) -> IngestionResult:
-        """Обработка одного документа"""
-        import asyncio
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Ошибка очистки временных файлов: %s", e)
+            self._free_slots.put_nowait(slot)
+
+    async def _find_indexed(self, file_hash: str) -> Document | None:
+        """Найти запись о ранее проиндексированном файле с тем же содержимым"""
+        try:
+            async with self._session_factory() as session:
+                document = await DocumentRepository(session).get_by_hash(file_hash)
+        except SQLAlchemyError:
+            logger.warning("Не удалось проверить повторную загрузку", exc_info=True)
+            return None
+        if document is not None and document.status == "indexed":
+            return document
+        return None
+
+    async def _record_indexed(self, filename: str, file_hash: str, chunks_count: int) -> None:
+        """
+        Запомнить проиндексированный файл
 
+        Поиск записи и её создание или обновление идут в одной транзакции,
+        чтобы одновременные загрузки одного файла не создали две записи.
+        """
+        try:
+            async with UnitOfWork(self._session_factory) as uow:
+                document = await uow.documents.get_by_hash(file_hash)
+                if document is not None:
+                    # Запись осталась от индексации до очистки коллекции
+                    await uow.documents.mark_indexed(document.id, chunks_count)
+                    return
+                await uow.documents.create(
+                    filename=filename,
+                    file_path=filename,
+                    file_hash=file_hash,
+                    status="indexed",
+                    chunks_count=chunks_count,
+                )
+        except SQLAlchemyError:
+            logger.warning("Не удалось сохранить запись о файле %s", filename, exc_info=True)
+
+    async def _index_upload(self, chunks: list, upload_hash: str | None) -> int:
+        """Проиндексировать чанки загрузки, пометив их хешем загруженного файла"""
+        if upload_hash is not None:
+            for chunk in chunks:
+                chunk.metadata["upload_hash"] = upload_hash
+        return await self.agent.index_chunks(chunks)
+
+    def _split_next_batch(self, documents: Iterator) -> list | None:
+        """Прочитать и разбить следующую порцию документов архива (выполняется в потоке)"""
+        batch = _next_batch(documents, ARCHIVE_DOCUMENTS_BATCH)
+        if not batch:
+            return None
+        return self.agent.text_splitter.split_documents(batch)
+
+    async def _process_document(
+        self, file_path: Path, filename: str, upload_hash: str | None = None
+    ) -> IngestionResult:
+        """Обработка одного документа"""
         loop = asyncio.get_running_loop()
-        documents = await loop.run_in_executor(
-            None,
-            lambda: self.agent.document_loader.load_file(file_path)
-        )
-
-        if documents:
-            chunks = self.agent.text_splitter.split_documents(documents)
-            await self.agent.vector_store.add_documents(chunks)
-            chunks_count = len(chunks)
+        parse_pool = self._get_parse_pool()
+        if parse_pool is not None:
+            chunks = await loop.run_in_executor(parse_pool, _load_and_split_in_worker, file_path)
         else:
-            chunks_count = 0
+            chunks = await loop.run_in_executor(
+                None,
+                _load_and_split,
+                self.agent.document_loader,
+                self.agent.text_splitter,
+                file_path,
+            )
+
+        chunks_count = await self._index_upload(chunks, upload_hash)
 
         return IngestionResult(
             chunks_count=chunks_count,
@@ -135,28 +396,48 @@ class IngestionService:
             }]
         )
 
-    async def _process_archive(self, archive_path: Path) -> IngestionResult:
+    async def _process_archive(self, archive_path: Path, upload_hash: str | None = None) -> IngestionResult:
         """Обработка архива с детальной статистикой"""
-        import asyncio
-
         loop = asyncio.get_running_loop()
+        stats = ArchiveProcessingStats()
 
-        # Загружаем архив с статистикой
-        documents, stats = await loop.run_in_executor(
-            None,
-            lambda: self.agent.document_loader.load_archive(archive_path)
-        )
-
-        chunks_count = 0
-        if documents:
-            chunks = self.agent.text_splitter.split_documents(documents)
+        # Читаем архив порциями, чтобы не держать в памяти все документы сразу.
+        # Следующая порция разбивается в потоке, пока предыдущая индексируется.
+        documents = self.agent.document_loader.iter_archive(archive_path, stats)
+        queue: asyncio.Queue[list | None] = asyncio.Queue(maxsize=2)
+        splitting: asyncio.Future | None = None
 
-            # Батчевая индексация
-            batch_size = 50
-            for i in range(0, len(chunks), batch_size):
-                await self.agent.vector_store.add_documents(chunks[i:i + batch_size])
-
-            chunks_count = len(chunks)
+        async def produce() -> None:
+            nonlocal splitting
+            try:
+                while True:
+                    splitting = loop.run_in_executor(None, self._split_next_batch, documents)
+                    chunks = await asyncio.shield(splitting)
+                    if chunks is None:
+                        break
+                    await queue.put(chunks)
+            except Exception:
+                await queue.put(None)
+                raise
+            await queue.put(None)
+
+        async def consume() -> int:
+            count = 0
+            while (chunks := await queue.get()) is not None:
+                count += await self._index_upload(chunks, upload_hash)
+            return count
+
+        producer = asyncio.create_task(produce())
+        try:
+            chunks_count, _ = await asyncio.gather(consume(), producer)
+        finally:
+            producer.cancel()
+            await asyncio.wait([producer])
+            # Итератор нельзя закрывать, пока поток ещё читает из него
+            if splitting is not None:
+                await asyncio.wait([splitting])
+            # Закрытие итератора удаляет временную распаковку архива
+            await loop.run_in_executor(None, documents.close)
 
         # Формируем список обработанных файлов
         processed_files = []
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator
 
 from infra.llm import (
     LegalRAGAgent,
@@ -41,10 +41,20 @@ class RAGService:
         """Асинхронно добавить документ в индекс"""
         return await self._agent.add_document(file_path)
 
+    async def add_document_stream(self, file_path: str | Path) -> AsyncIterator[int]:
+        """Добавить документ, отдавая число чанков по мере индексации"""
+        async for count in self._agent.add_document_stream(file_path):
+            yield count
+
     async def index_all(self, force: bool = False) -> int:
         """Асинхронно индексировать все документы"""
         return await self._agent.index_documents(force_reindex=force)
 
+    async def index_all_stream(self, force: bool = False) -> AsyncIterator[int]:
+        """Индексировать все документы, отдавая число чанков по мере индексации"""
+        async for count in self._agent.index_documents_stream(force_reindex=force):
+            yield count
+
     async def get_stats(self) -> dict[str, Any]:
         """Статистика системы"""
         return await self._agent.get_stats()
@@ -0,0 +1,20 @@
+"""Размер пулов воркеров по числу доступных процессу ядер"""
+
+import os
+
+
+def available_cpus() -> int:
+    """
+    Число ядер, на которых процессу разрешено выполняться.
+
+    В контейнерах с cpuset и при taskset это меньше os.cpu_count(),
+    который возвращает все ядра машины.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def default_workers(limit: int = 4) -> int:
+    """Число воркеров пула по умолчанию: по ядру на воркер, не больше limit"""
+    return min(limit, available_cpus())
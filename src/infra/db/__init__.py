@@ -3,6 +3,8 @@ from .models import User, Document, ChatHistory
 from .user_repository import UserRepository
 from .document_repository import DocumentRepository
 from .chat_history_repository import ChatHistoryRepository
+from .uow import UnitOfWork
+from .schema import upgrade_schema
 
 __all__ = [
     # Database
@@ -10,6 +12,7 @@ __all__ = [
     "engine",
     "async_session_factory",
     "get_session",
+    "upgrade_schema",
     # Models
     "User",
     "Document",
@@ -18,4 +21,6 @@ __all__ = [
     "UserRepository",
     "DocumentRepository",
     "ChatHistoryRepository",
+    # Unit of Work
+    "UnitOfWork",
 ]
\ No newline at end of file
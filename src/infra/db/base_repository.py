@@ -0,0 +1,14 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class BaseRepository:
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
+        self.session = session
+        self.autocommit = autocommit
+
+    async def _commit(self) -> None:
+        # Внутри UnitOfWork транзакцию фиксирует он сам, здесь только flush
+        if self.autocommit:
+            await self.session.commit()
+        else:
+            await self.session.flush()
@@ -1,15 +1,12 @@
 from typing import Optional, List
 
 from sqlalchemy import select, delete, func
-from sqlalchemy.ext.asyncio import AsyncSession
 
+from .base_repository import BaseRepository
 from .models import ChatHistory
 
 
-class ChatHistoryRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
-
+class ChatHistoryRepository(BaseRepository):
     async def create(
         self,
         user_id: int,
@@ -24,8 +21,7 @@ class ChatHistoryRepository:
             used_sources=used_sources,
         )
         self.session.add(message)
-        await self.session.commit()
-        await self.session.refresh(message)
+        await self._commit()
         return message
 
     async def get_by_id(self, message_id: int) -> Optional[ChatHistory]:
@@ -59,15 +55,20 @@ class ChatHistoryRepository:
         return list(result.scalars().all())
 
     async def count_by_user(self, user_id: int) -> int:
+        # count(*) по user_id считается по индексу (user_id, created_at)
         result = await self.session.execute(
-            select(func.count(ChatHistory.id))
+            select(func.count())
+            .select_from(ChatHistory)
             .where(ChatHistory.user_id == user_id)
         )
         return result.scalar() or 0
 
     async def delete_by_user(self, user_id: int) -> int:
+        # Загруженные в сессию сообщения не ищем: после удаления они не используются
         result = await self.session.execute(
-            delete(ChatHistory).where(ChatHistory.user_id == user_id)
+            delete(ChatHistory)
+            .where(ChatHistory.user_id == user_id)
+            .execution_options(synchronize_session=False)
         )
-        await self.session.commit()
+        await self._commit()
         return result.rowcount
\ No newline at end of file
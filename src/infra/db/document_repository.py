@@ -1,15 +1,12 @@
 from typing import Optional, List
 
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 
+from .base_repository import BaseRepository
 from .models import Document
 
 
-class DocumentRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
-
+class DocumentRepository(BaseRepository):
     async def create(
         self,
         filename: str,
@@ -17,6 +14,7 @@ class DocumentRepository:
         file_hash: str,
         uploaded_by: Optional[int] = None,
         status: str = "processing",
+        chunks_count: int = 0,
     ) -> Document:
         document = Document(
             filename=filename,
@@ -24,10 +22,10 @@ class DocumentRepository:
             file_hash=file_hash,
             uploaded_by=uploaded_by,
             status=status,
+            chunks_count=chunks_count,
         )
         self.session.add(document)
-        await self.session.commit()
-        await self.session.refresh(document)
+        await self._commit()
         return document
 
     async def get_by_id(self, doc_id: int) -> Optional[Document]:
@@ -63,14 +61,23 @@ class DocumentRepository:
         document = await self.get_by_id(doc_id)
         if document:
             document.status = status
-            await self.session.commit()
-            await self.session.refresh(document)
+            await self._commit()
+        return document
+
+    async def mark_indexed(
+        self, doc_id: int, chunks_count: int
+    ) -> Optional[Document]:
+        document = await self.get_by_id(doc_id)
+        if document:
+            document.status = "indexed"
+            document.chunks_count = chunks_count
+            await self._commit()
         return document
 
     async def delete(self, doc_id: int) -> bool:
         document = await self.get_by_id(doc_id)
         if document:
             await self.session.delete(document)
-            await self.session.commit()
+            await self._commit()
             return True
         return False
\ No newline at end of file
@@ -1,42 +1,52 @@
 from datetime import datetime
 from typing import Optional, List
 
-from sqlalchemy import BigInteger, String, Text, DateTime, ForeignKey
+from sqlalchemy import BigInteger, Integer, String, Text, DateTime, ForeignKey, Index, func
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
 
 
+def _utc_now():
+    """Текущее время UTC на стороне БД (timestamp without time zone)"""
+    return func.timezone("utc", func.now())
+
+
 class User(Base):
     __tablename__ = "users"
+    # Значения по умолчанию из БД возвращаются тем же INSERT ... RETURNING
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     telegram_user_id: Mapped[int] = mapped_column(BigInteger, index=True, unique=True)
     username: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     role: Mapped[str] = mapped_column(String(16))  # "admin" or "user"
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, default=datetime.utcnow, nullable=False
+        DateTime, server_default=_utc_now(), nullable=False
     )
 
     # Relationships
+    # Не загружаются вместе с пользователем: при необходимости - selectinload(...).
+    # Удаление связанных строк выполняет сама БД (ondelete в ForeignKey)
     documents: Mapped[List["Document"]] = relationship(
-        "Document", back_populates="uploader", lazy="selectin"
+        "Document", back_populates="uploader", lazy="raise", passive_deletes=True
     )
     chat_history: Mapped[List["ChatHistory"]] = relationship(
-        "ChatHistory", back_populates="user", lazy="selectin"
+        "ChatHistory", back_populates="user", lazy="raise", passive_deletes=True
     )
 
 
 class Document(Base):
     __tablename__ = "documents"
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     filename: Mapped[str] = mapped_column(String(512), nullable=False)
     file_path: Mapped[str] = mapped_column(String(1024), nullable=False)
     file_hash: Mapped[str] = mapped_column(String(64), index=True, nullable=False)
     uploaded_at: Mapped[datetime] = mapped_column(
-        DateTime, default=datetime.utcnow, nullable=False
+        DateTime, server_default=_utc_now(), nullable=False
     )
     uploaded_by: Mapped[Optional[int]] = mapped_column(
         ForeignKey("users.id", ondelete="SET NULL"), nullable=True
@@ -44,6 +54,9 @@ class Document(Base):
     status: Mapped[str] = mapped_column(
         String(32), default="processing", nullable=False
     )
+    chunks_count: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
 
     # Relationships
     uploader: Mapped[Optional["User"]] = relationship(
@@ -53,17 +66,23 @@ class Document(Base):
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
     query: Mapped[str] = mapped_column(Text, nullable=False)
     answer: Mapped[str] = mapped_column(Text, nullable=False)
     used_sources: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, default=datetime.utcnow, nullable=False
+        DateTime, server_default=_utc_now(), nullable=False
     )
 
     # Relationships
-    user: Mapped["User"] = relationship("User", back_populates="chat_history")
\ No newline at end of file
+    user: Mapped["User"] = relationship("User", back_populates="chat_history")
+
+
+# Последние сообщения пользователя читаются по индексу без сортировки;
+# индекс покрывает и поиск по одному user_id
+Index("ix_chat_history_user_created", ChatHistory.user_id, ChatHistory.created_at.desc())
@@ -0,0 +1,25 @@
+"""Обновление схемы уже существующей базы"""
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# create_all создаёт только отсутствующие таблицы и не меняет существующие,
+# поэтому изменения схемы доводятся до старых баз этими шагами.
+# Каждый шаг идемпотентен и выполняется при каждом запуске после create_all.
+SCHEMA_UPGRADES: tuple[str, ...] = (
+    # Время создания заполняет БД (server_default), а не приложение
+    "ALTER TABLE users ALTER COLUMN created_at SET DEFAULT timezone('utc', now())",
+    "ALTER TABLE documents ALTER COLUMN uploaded_at SET DEFAULT timezone('utc', now())",
+    "ALTER TABLE chat_history ALTER COLUMN created_at SET DEFAULT timezone('utc', now())",
+    # Число чанков проиндексированного файла (ответ на повторную загрузку)
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunks_count integer NOT NULL DEFAULT 0",
+    # Индекс по user_id заменён составным (user_id, created_at DESC) под выборку истории
+    "DROP INDEX IF EXISTS ix_chat_history_user_id",
+    "CREATE INDEX IF NOT EXISTS ix_chat_history_user_created ON chat_history (user_id, created_at DESC)",
+)
+
+
+async def upgrade_schema(conn: AsyncConnection) -> None:
+    """Применить SCHEMA_UPGRADES в текущей транзакции"""
+    for statement in SCHEMA_UPGRADES:
+        await conn.execute(text(statement))
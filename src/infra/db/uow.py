@@ -0,0 +1,34 @@
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .chat_history_repository import ChatHistoryRepository
+from .database import async_session_factory
+from .document_repository import DocumentRepository
+from .user_repository import UserRepository
+
+
+class UnitOfWork:
+    """
+    Одна транзакция на несколько операций с репозиториями.
+
+    Репозитории внутри UnitOfWork не фиксируют изменения сами: commit
+    выполняется один раз при выходе из блока, при исключении - rollback.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession] = async_session_factory):
+        self._session_factory = session_factory
+
+    async def __aenter__(self) -> "UnitOfWork":
+        self.session = self._session_factory()
+        self.users = UserRepository(self.session, autocommit=False)
+        self.documents = DocumentRepository(self.session, autocommit=False)
+        self.chat_history = ChatHistoryRepository(self.session, autocommit=False)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                await self.session.commit()
+            else:
+                await self.session.rollback()
+        finally:
+            await self.session.close()
@@ -1,15 +1,12 @@
 from typing import Optional
 
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 
+from .base_repository import BaseRepository
 from .models import User
 
 
-class UserRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
-
+class UserRepository(BaseRepository):
     async def get_by_telegram_id(self, tg_id: int) -> Optional[User]:
         result = await self.session.execute(
             select(User).where(User.telegram_user_id == tg_id)
@@ -40,14 +37,13 @@ class UserRepository:
             user.role = role
             if username is not None:
                 user.username = username
-        await self.session.commit()
-        await self.session.refresh(user)
+        await self._commit()
         return user
 
     async def delete_by_telegram_id(self, tg_id: int) -> bool:
         user = await self.get_by_telegram_id(tg_id)
         if user:
             await self.session.delete(user)
-            await self.session.commit()
+            await self._commit()
             return True
         return False
\ No newline at end of file
@@ -3,17 +3,20 @@
 import asyncio
 import logging
 import re
-from dataclasses import dataclass, field
+import time
+from dataclasses import dataclass, field, replace
+from itertools import chain
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator, Iterable, Iterator
 
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from .config import RAGConfig, YandexGPTConfig, QdrantConfig
 from .document_loader import LegalDocumentLoader
 from .embeddings import YandexEmbeddings
 from .prompts import LEGAL_SYSTEM_PROMPT, RAG_PROMPT_TEMPLATE, CONVERSATIONAL_SYSTEM_PROMPT
+from .semantic_cache import SemanticCache
+from .text_splitter import CachingTextSplitter
 from .vector_store import QdrantVectorStore
 from .yandex_gpt import YandexGPTClient, YandexGPTMessage, YandexGPTError
 
@@ -41,6 +44,35 @@ CONVERSATIONAL_PATTERNS = [
     r'^help$',
     r'^start$',
 ]
+# Все паттерны одним регулярным выражением: один проход вместо цикла по списку
+_CONVERSATIONAL_RE = re.compile("|".join(f"(?:{p})" for p in CONVERSATIONAL_PATTERNS))
+
+# Признаки юридического вопроса (ищутся как начало слова: основы вроде
+# 'трудов' или 'санкц' совпадают с любым окончанием)
+LEGAL_KEYWORDS = (
+    'закон', 'право', 'статья', 'пункт', 'договор', 'контракт',
+    'суд', 'иск', 'истец', 'ответчик', 'заявление', 'жалоба',
+    'ответственность', 'штраф', 'наказание', 'санкц',
+    'увольнение', 'трудов', 'работодатель', 'работник',
+    'налог', 'ндфл', 'ндс', 'взнос',
+    'собственность', 'имущество', 'наследств',
+    'развод', 'алимент', 'опека', 'брак',
+    'аренд', 'найм', 'лицензи', 'разрешени',
+    'регистрац', 'документ', 'справк',
+    'обязан', 'должен', 'можно ли', 'имею ли право',
+    'как оформить', 'как составить', 'как подать',
+    'какие документы', 'какой срок', 'какой порядок',
+    'что делать если', 'что грозит', 'что будет',
+    'гк рф', 'тк рф', 'ук рф', 'коап', 'конституц',
+)
+# Все ключевые слова ищутся за один проход по строке
+_LEGAL_KEYWORDS_RE = re.compile(
+    r"\b(?:" + "|".join(map(re.escape, LEGAL_KEYWORDS)) + ")",
+    re.IGNORECASE,
+)
+
+# Слова вопроса для точного ключа кэша ответов (числа входят в ключ)
+_WORD_RE = re.compile(r"\w+")
 
 # Минимальный score для считания источника релевантным
 MIN_RELEVANCE_SCORE = 0.25
@@ -48,6 +80,52 @@ MIN_RELEVANCE_SCORE = 0.25
 # Минимальная длина вопроса для RAG
 MIN_QUESTION_LENGTH = 10
 
+# Сколько чанков индексируется за один вызов add_documents
+INDEX_BATCH_SIZE = 50
+
+# Фразы, по которым видно, что ответ не опирается на найденные документы
+NO_INFO_PHRASES = (
+    "в предоставленном контексте нет",
+    "в документах не найдено",
+    "информация отсутствует",
+    "не содержит информации",
+    "нет данных по этому вопросу",
+)
+_NO_INFO_RE = re.compile("|".join(map(re.escape, NO_INFO_PHRASES)), re.IGNORECASE)
+
+# Время жизни закэшированных результатов get_stats и health_check, секунды
+STATS_CACHE_TTL = 30.0
+HEALTH_CACHE_TTL = 10.0
+
+# Разделитель фрагментов в контексте промпта
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# Шаблон RAG-промпта разбивается один раз, сборка — простая конкатенация
+_RAG_PROMPT_PREFIX, _RAG_PROMPT_REST = RAG_PROMPT_TEMPLATE.split("{context}")
+_RAG_PROMPT_MIDDLE, _RAG_PROMPT_SUFFIX = _RAG_PROMPT_REST.split("{question}")
+
+
+# Системные сообщения не меняются между запросами и создаются один раз
+_LEGAL_SYSTEM_MESSAGE = YandexGPTMessage(role="system", text=LEGAL_SYSTEM_PROMPT)
+_CONVERSATIONAL_SYSTEM_MESSAGE = YandexGPTMessage(role="system", text=CONVERSATIONAL_SYSTEM_PROMPT)
+_HEALTH_CHECK_MESSAGES = [YandexGPTMessage(role="user", text="Ответь: OK")]
+
+
+async def _in_batches(chunks: list[Document]) -> AsyncIterator[list[Document]]:
+    """Отдать готовые чанки батчами по INDEX_BATCH_SIZE"""
+    for i in range(0, len(chunks), INDEX_BATCH_SIZE):
+        yield chunks[i:i + INDEX_BATCH_SIZE]
+
+
+def _response_cache_key(question_lower: str) -> str:
+    """Ключ кэша ответов: слова вопроса без учёта порядка и пунктуации"""
+    return " ".join(sorted(_WORD_RE.findall(question_lower)))
+
+
+def build_rag_prompt(context: str, question: str) -> str:
+    """Подставить контекст и вопрос в RAG_PROMPT_TEMPLATE"""
+    return "".join((_RAG_PROMPT_PREFIX, context, _RAG_PROMPT_MIDDLE, question, _RAG_PROMPT_SUFFIX))
+
 
 @dataclass
 class RAGResponse:
@@ -78,13 +156,23 @@ class LegalRAGAgent:
         self._vector_store: QdrantVectorStore | None = None
 
         self.document_loader = LegalDocumentLoader(self.config.documents_dir)
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        self.text_splitter = CachingTextSplitter(
             chunk_size=self.config.chunking.chunk_size,
             chunk_overlap=self.config.chunking.chunk_overlap,
             separators=self.config.chunking.separators,
         )
 
-        logger.info(f"LegalRAGAgent: {self.yandex_config.model_uri}")
+        # Ответы на перефразированные вопросы без поиска и генерации
+        self._response_cache: SemanticCache[RAGResponse] = SemanticCache(
+            maxsize=self.config.response_cache_size,
+            ttl=self.config.response_cache_ttl,
+            threshold=self.config.response_cache_threshold,
+        )
+        # (время истечения, результат)
+        self._stats_cache: tuple[float, dict[str, Any]] | None = None
+        self._health_cache: tuple[float, bool] | None = None
+
+        logger.info("LegalRAGAgent: %s", self.yandex_config.model_uri)
 
     @property
     def gpt_client(self) -> YandexGPTClient:
@@ -104,28 +192,31 @@ class LegalRAGAgent:
             self._vector_store = QdrantVectorStore(self.qdrant_config, self.embeddings)
         return self._vector_store
 
-    def _is_conversational(self, question: str) -> bool:
+    def _is_conversational(self, question: str, question_lower: str | None = None) -> bool:
         """
         Определить, является ли вопрос разговорным (не требует поиска в документах).
 
+        Args:
+            question: Текст вопроса
+            question_lower: Уже приведённый к нижнему регистру и обрезанный вопрос
+
         Returns:
             True если вопрос разговорный, False если требуется RAG
         """
-        question_lower = question.lower().strip()
+        if question_lower is None:
+            question_lower = question.lower().strip()
 
         # Проверяем паттерны разговорных фраз
-        for pattern in CONVERSATIONAL_PATTERNS:
-            if re.match(pattern, question_lower):
-                logger.debug(f"Conversational pattern matched: {pattern}")
-                return True
+        match = _CONVERSATIONAL_RE.match(question_lower)
+        if match:
+            logger.debug("Conversational pattern matched: %s", match.group(0))
+            return True
 
         # Очень короткие вопросы без вопросительных слов часто разговорные
         words = question_lower.split()
-        if len(words) <= 2 and '?' not in question:
+        if len(words) <= 2 and '?' not in question_lower:
             # Но проверяем, не содержит ли юридических терминов
-            legal_keywords = ['закон', 'право', 'статья', 'договор', 'суд', 'иск',
-                            'ответственность', 'штраф', 'увольнение', 'трудов']
-            if not any(kw in question_lower for kw in legal_keywords):
+            if not _LEGAL_KEYWORDS_RE.search(question_lower):
                 return True
 
         return False
@@ -134,124 +225,199 @@ class LegalRAGAgent:
         """
         Определить, является ли вопрос юридическим/правовым.
         """
-        question_lower = question.lower()
-
-        legal_keywords = [
-            'закон', 'право', 'статья', 'пункт', 'договор', 'контракт',
-            'суд', 'иск', 'истец', 'ответчик', 'заявление', 'жалоба',
-            'ответственность', 'штраф', 'наказание', 'санкц',
-            'увольнение', 'трудов', 'работодатель', 'работник',
-            'налог', 'ндфл', 'ндс', 'взнос',
-            'собственность', 'имущество', 'наследств',
-            'развод', 'алимент', 'опека', 'брак',
-            'аренд', 'найм', 'лицензи', 'разрешени',
-            'регистрац', 'документ', 'справк',
-            'обязан', 'должен', 'можно ли', 'имею ли право',
-            'как оформить', 'как составить', 'как подать',
-            'какие документы', 'какой срок', 'какой порядок',
-            'что делать если', 'что грозит', 'что будет',
-            'гк рф', 'тк рф', 'ук рф', 'коап', 'конституц',
-        ]
-
-        return any(kw in question_lower for kw in legal_keywords)
+        return _LEGAL_KEYWORDS_RE.search(question) is not None
+
+    async def index_documents_stream(self, force_reindex: bool = False) -> AsyncIterator[int]:
+        """Индексировать документы из директории, отдавая число чанков каждого батча"""
+        loop = asyncio.get_running_loop()
+        # Документы читаются по мере разбиения, а не собираются в список заранее;
+        # генератор создаётся здесь, но читает файлы только в потоке пула
+        documents = self.document_loader.load_directory(self.config.load_workers)
+        try:
+            first = await loop.run_in_executor(None, next, documents, None)
+
+            if first is None:
+                logger.warning("Документы не найдены")
+                return
+
+            if force_reindex:
+                await self.vector_store.clear_collection()
+                self.invalidate_caches()
+
+            # Индекс строится после загрузки, а не на каждом промежуточном состоянии
+            async with self.vector_store.bulk_upload_mode():
+                indexed = 0
+                batches = self._split_stream(chain((first,), documents))
+                async for count in self._index_chunks_stream(batches):
+                    indexed += count
+                    logger.info("Проиндексировано %d чанков", indexed)
+                    yield count
+        finally:
+            # Генератор держит пул процессов загрузчика: закрываем его явно,
+            # в потоке, так как остановка пула ждёт завершения воркеров
+            await loop.run_in_executor(None, documents.close)
+
+    def _split_next(self, documents: Iterator[Document]) -> list[Document] | None:
+        """Прочитать и разбить следующий документ (None - документы закончились)"""
+        document = next(documents, None)
+        if document is None:
+            return None
+        return self.text_splitter.split_documents([document])
+
+    async def _split_stream(self, documents: Iterable[Document]) -> AsyncIterator[list[Document]]:
+        """
+        Разбивать документы по одному, отдавая батчи по INDEX_BATCH_SIZE чанков
 
-    def _filter_relevant_sources(
+        Документы запрашиваются из итератора по одному в потоке пула, поэтому
+        в памяти находятся только текущий документ, его чанки и недобранный
+        батч, а не весь корпус.
+        """
+        loop = asyncio.get_running_loop()
+        documents = iter(documents)
+        batch: list[Document] = []
+        while (chunks := await loop.run_in_executor(None, self._split_next, documents)) is not None:
+            batch.extend(chunks)
+            while len(batch) >= INDEX_BATCH_SIZE:
+                yield batch[:INDEX_BATCH_SIZE]
+                batch = batch[INDEX_BATCH_SIZE:]
+        if batch:
+            yield batch
+
+    async def _index_chunks_stream(
         self,
-        docs: list[Document],
-        min_score: float = MIN_RELEVANCE_SCORE
-    ) -> list[Document]:
+        batches: AsyncIterator[list[Document]],
+        wait: bool = True,
+    ) -> AsyncIterator[int]:
         """
-        Фильтрация документов по релевантности.
-        Возвращает только документы с достаточно высоким score.
+        Параллельно индексировать батчи чанков по мере их появления
+
+        Одновременно выполняется не больше config.index_concurrency батчей;
+        следующий батч не запрашивается, пока нет свободного места.
+        Число чанков отдаётся по мере завершения батчей.
+        При wait=False записи применяются в фоне: вызывающий делает flush().
         """
-        relevant = []
-        for doc in docs:
-            score = doc.metadata.get("score")
-            if score is not None and score >= min_score:
-                relevant.append(doc)
-            elif score is None:
-                # Если score нет, включаем документ (на всякий случай)
-                relevant.append(doc)
+        semaphore = asyncio.Semaphore(self.config.index_concurrency)
+        pending: set[asyncio.Task] = set()
 
-        logger.debug(f"Filtered {len(docs)} docs to {len(relevant)} relevant")
-        return relevant
+        async def push(batch: list[Document]) -> int:
+            try:
+                await self.vector_store.add_documents(batch, wait=wait)
+            finally:
+                semaphore.release()
+            return len(batch)
 
-    async def index_documents(self, force_reindex: bool = False) -> int:
-        """Асинхронно индексировать документы из директории"""
-        loop = asyncio.get_event_loop()
-        documents = await loop.run_in_executor(
-            None,
-            lambda: list(self.document_loader.load_directory())
-        )
+        try:
+            async for batch in batches:
+                await semaphore.acquire()
+                pending.add(asyncio.create_task(push(batch)))
+
+                done = {task for task in pending if task.done()}
+                pending -= done
+                for task in done:
+                    count = task.result()
+                    self.invalidate_caches()
+                    yield count
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    count = task.result()
+                    self.invalidate_caches()
+                    yield count
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def invalidate_caches(self) -> None:
+        """
+        Сбросить кэши, зависящие от содержимого коллекции
 
-        if not documents:
-            logger.warning("Документы не найдены")
-            return 0
+        Вызывается после любого изменения коллекции: индексации, очистки.
+        """
+        self._response_cache.clear()
+        self._stats_cache = None
 
-        chunks = self.text_splitter.split_documents(documents)
-        logger.info(f"Создано {len(chunks)} чанков из {len(documents)} документов")
+    async def index_chunks(self, chunks: list[Document]) -> int:
+        """
+        Проиндексировать уже разбитые на чанки документы
+
+        Батчи пишутся так же, как при индексации директории, но без ожидания
+        применения каждой записи: в конце один flush(), после которого
+        кэши, зависящие от коллекции, сбрасываются.
 
-        if force_reindex:
-            await self.vector_store.clear_collection()
+        Returns:
+            Число проиндексированных чанков
+        """
+        if not chunks:
+            return 0
+        try:
+            count = 0
+            async for n in self._index_chunks_stream(_in_batches(chunks), wait=False):
+                count += n
+            await self.vector_store.flush()
+        finally:
+            # Часть батчей могла записаться и при ошибке
+            self.invalidate_caches()
+        return count
 
-        for i in range(0, len(chunks), 50):
-            await self.vector_store.add_documents(chunks[i:i + 50])
-            logger.info(f"Проиндексировано {min(i + 50, len(chunks))}/{len(chunks)}")
+    async def index_documents(self, force_reindex: bool = False) -> int:
+        """Асинхронно индексировать документы из директории"""
+        return sum([n async for n in self.index_documents_stream(force_reindex)])
 
-        return len(chunks)
+    async def add_document_stream(self, file_path: str | Path) -> AsyncIterator[int]:
+        """Добавить один документ, отдавая число чанков каждого проиндексированного батча"""
+        loop = asyncio.get_running_loop()
+        documents = await loop.run_in_executor(None, self.document_loader.load_file, Path(file_path))
+        async for count in self._index_chunks_stream(self._split_stream(documents)):
+            yield count
 
     async def add_document(self, file_path: str | Path) -> int:
         """Асинхронно добавить один документ"""
-        loop = asyncio.get_event_loop()
-        documents = await loop.run_in_executor(
-            None,
-            lambda: self.document_loader.load_file(Path(file_path))
-        )
-        chunks = self.text_splitter.split_documents(documents)
-        await self.vector_store.add_documents(chunks)
-        logger.info(f"Добавлен {file_path}: {len(chunks)} чанков")
-        return len(chunks)
+        count = sum([n async for n in self.add_document_stream(file_path)])
+        logger.info("Добавлен %s: %d чанков", file_path, count)
+        return count
 
     def _format_context(self, docs: list[Document]) -> str:
         """Форматировать документы для контекста"""
-        parts = []
-        for i, doc in enumerate(docs, 1):
-            source = doc.metadata.get("filename", "?")
-            page = doc.metadata.get("page", "?")
-            parts.append(f"[Источник {i}: {source}, стр. {page}]\n{doc.page_content}")
-        return "\n\n---\n\n".join(parts)
+        return CONTEXT_SEPARATOR.join([
+            f"[Источник {i}: {doc.metadata.get('filename', '?')}, "
+            f"стр. {doc.metadata.get('page', '?')}]\n{doc.page_content}"
+            for i, doc in enumerate(docs, 1)
+        ])
 
     def _extract_sources(self, docs: list[Document]) -> list[dict]:
         """Извлечь уникальные источники"""
-        seen = set()
-        sources = []
+        # dict сохраняет порядок вставки, поэтому отдельный set не нужен
+        sources: dict[tuple, dict] = {}
 
         for doc in docs:
-            filename = doc.metadata.get("filename", "")
-            page = doc.metadata.get("page", 0)
-            archive = doc.metadata.get("archive_source")
+            metadata = doc.metadata
+            filename = metadata.get("filename", "")
+            page = metadata.get("page", 0)
+            archive = metadata.get("archive_source")
 
             key = (filename, page, archive)
-            if key not in seen:
-                seen.add(key)
-                source_info = {
-                    "filename": filename or "Неизвестно",
-                    "page": page,
-                    "score": doc.metadata.get("score"),
-                }
-                if archive:
-                    source_info["archive"] = archive
+            if key in sources:
+                continue
 
-                sources.append(source_info)
+            source_info = {
+                "filename": filename or "Неизвестно",
+                "page": page,
+                "score": metadata.get("score"),
+            }
+            if archive:
+                source_info["archive"] = archive
+            sources[key] = source_info
 
-        return sources
+        return list(sources.values())
 
     async def _answer_conversational(self, question: str) -> RAGResponse:
         """
         Ответить на разговорный вопрос без RAG.
         """
         messages = [
-            YandexGPTMessage(role="system", text=CONVERSATIONAL_SYSTEM_PROMPT),
+            _CONVERSATIONAL_SYSTEM_MESSAGE,
             YandexGPTMessage(role="user", text=question),
         ]
 
@@ -265,7 +431,7 @@ class LegalRAGAgent:
                 used_rag=False,
             )
         except YandexGPTError as e:
-            logger.error(f"Ошибка GPT: {e}")
+            logger.error("Ошибка GPT: %s", e)
             return RAGResponse(
                 answer="Извините, произошла ошибка. Попробуйте ещё раз.",
                 query=question,
@@ -280,28 +446,45 @@ class LegalRAGAgent:
         - Разговорные вопросы обрабатываются без RAG
         - Юридические вопросы обрабатываются с поиском по документам
         """
-        logger.info(f"Запрос: {question[:50]}...")
+        logger.info("Запрос: %.50s...", question)
+
+        # Нижний регистр считается один раз для всех проверок
+        question_lower = question.lower().strip()
 
         # Проверяем, разговорный ли вопрос
-        if self._is_conversational(question):
+        if self._is_conversational(question, question_lower):
             logger.info("Detected conversational question, skipping RAG")
             return await self._answer_conversational(question)
 
         # Проверяем минимальную длину для RAG
-        if len(question.strip()) < MIN_QUESTION_LENGTH and not self._is_legal_question(question):
+        is_legal = self._is_legal_question(question)
+        if len(question_lower) < MIN_QUESTION_LENGTH and not is_legal:
             logger.info("Question too short for RAG, using conversational mode")
             return await self._answer_conversational(question)
 
-        # Поиск релевантных документов
-        docs = await self.vector_store.search(question, k)
-
-        # Фильтруем по релевантности
-        relevant_docs = self._filter_relevant_sources(docs)
+        # Эмбеддинг считается один раз: для кэша и для поиска
+        query_vector = await self.embeddings.aembed_query(question)
+
+        # Кэш хранит ответы, полученные с числом источников по умолчанию
+        use_cache = k is None or k == self.qdrant_config.search_k
+        # Близкие эмбеддинги не отличают "статья 81" от "статья 82",
+        # поэтому ответ берётся только для вопроса с теми же словами
+        cache_key = _response_cache_key(question_lower)
+        if use_cache:
+            cached = self._response_cache.lookup(query_vector, cache_key)
+            if cached is not None:
+                logger.info("Ответ найден в семантическом кэше")
+                return replace(cached, query=question)
+
+        # Поиск релевантных документов: нерелевантные отсекает сам Qdrant
+        relevant_docs = await self.vector_store.search_by_vector(
+            query_vector, k, score_threshold=MIN_RELEVANCE_SCORE,
+        )
 
         # Если нет релевантных документов
         if not relevant_docs:
             # Для юридических вопросов сообщаем об отсутствии информации
-            if self._is_legal_question(question):
+            if is_legal:
                 return RAGResponse(
                     answer="К сожалению, в моей базе знаний нет информации по этому вопросу. "
                            "Рекомендую обратиться к профильному юристу.",
@@ -315,10 +498,10 @@ class LegalRAGAgent:
 
         # Генерация ответа с контекстом
         context = self._format_context(relevant_docs)
-        prompt = RAG_PROMPT_TEMPLATE.format(context=context, question=question)
+        prompt = build_rag_prompt(context, question)
 
         messages = [
-            YandexGPTMessage(role="system", text=LEGAL_SYSTEM_PROMPT),
+            _LEGAL_SYSTEM_MESSAGE,
             YandexGPTMessage(role="user", text=prompt),
         ]
 
@@ -329,27 +512,21 @@ class LegalRAGAgent:
             sources = self._extract_sources(relevant_docs)
 
             # Если в ответе явно указано, что информации нет - не показываем источники
-            no_info_phrases = [
-                "в предоставленном контексте нет",
-                "в документах не найдено",
-                "информация отсутствует",
-                "не содержит информации",
-                "нет данных по этому вопросу",
-            ]
-
-            answer_lower = response.text.lower()
-            if any(phrase in answer_lower for phrase in no_info_phrases):
+            if _NO_INFO_RE.search(response.text):
                 sources = []
 
-            return RAGResponse(
+            result = RAGResponse(
                 answer=response.text,
                 sources=sources,
                 query=question,
                 tokens_used=response.total_tokens,
                 used_rag=True,
             )
+            if use_cache:
+                self._response_cache.set(query_vector, result, cache_key)
+            return result
         except YandexGPTError as e:
-            logger.error(f"Ошибка GPT: {e}")
+            logger.error("Ошибка GPT: %s", e)
             return RAGResponse(
                 answer=f"Ошибка генерации: {e}",
                 sources=self._extract_sources(relevant_docs),
@@ -357,19 +534,43 @@ class LegalRAGAgent:
                 used_rag=True,
             )
 
-    async def get_stats(self) -> dict[str, Any]:
-        """Статистика системы"""
-        info = await self.vector_store.get_info()
-        return {
+    async def get_stats(self, refresh: bool = False) -> dict[str, Any]:
+        """
+        Статистика системы (кэшируется на STATS_CACHE_TTL секунд)
+
+        refresh=True заново запрашивает информацию о коллекции в Qdrant.
+        """
+        now = time.monotonic()
+        if not refresh and self._stats_cache is not None and self._stats_cache[0] > now:
+            return self._stats_cache[1]
+
+        info = await self.vector_store.get_info(refresh=refresh)
+        stats = {
             "total_chunks": info["points_count"],
             "collection": info["name"],
             "status": info["status"],
             "model": self.yandex_config.model_uri,
             "documents_dir": str(self.config.documents_dir),
         }
+        self._stats_cache = (now + STATS_CACHE_TTL, stats)
+        return stats
 
     async def health_check(self) -> bool:
-        """Асинхронная проверка работоспособности"""
+        """
+        Асинхронная проверка работоспособности
+
+        Проверка обращается к Qdrant, эмбеддингам и платной генерации,
+        поэтому результат кэшируется на HEALTH_CACHE_TTL секунд.
+        """
+        now = time.monotonic()
+        if self._health_cache is not None and self._health_cache[0] > now:
+            return self._health_cache[1]
+
+        healthy = await self._check_health()
+        self._health_cache = (now + HEALTH_CACHE_TTL, healthy)
+        return healthy
+
+    async def _check_health(self) -> bool:
         try:
             await self.vector_store.count()
             logger.info("✓ Qdrant OK")
@@ -377,14 +578,12 @@ class LegalRAGAgent:
             await self.embeddings.aembed_query("тест")
             logger.info("✓ Embeddings OK")
 
-            response = await self.gpt_client.complete([
-                YandexGPTMessage(role="user", text="Ответь: OK")
-            ])
+            response = await self.gpt_client.complete(_HEALTH_CHECK_MESSAGES)
             logger.info("✓ GPT OK")
             
             return len(response.text) > 0
         except Exception as e:
-            logger.error(f"Health check failed: {e}")
+            logger.error("Health check failed: %s", e)
             return False
 
     async def close(self):
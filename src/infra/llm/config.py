@@ -2,6 +2,7 @@
 
 from enum import Enum
 from pathlib import Path
+from typing import Literal
 
 from pydantic import BaseModel, Field, SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -37,6 +38,12 @@ class YandexGPTConfig(BaseSettings):
     embeddings_url: str = "https://llm.api.cloud.yandex.net/foundationModels/v1/textEmbedding"
     timeout: int = 60
     max_retries: int = 3
+    # Одновременных запросов генерации (остальные ждут своей очереди)
+    max_concurrency: int = 8
+    # Одновременных запросов эмбеддингов при векторизации одного батча документов
+    embeddings_concurrency: int = 10
+    # Сколько эмбеддингов поисковых запросов хранить в LRU-кэше
+    query_embeddings_cache_size: int = 4096
 
     @property
     def model_uri(self) -> str:
@@ -70,6 +77,25 @@ class QdrantConfig(BaseSettings):
     
     # Поиск
     search_k: int = 5
+    # Точность HNSW при поиске (None - настройка коллекции)
+    search_hnsw_ef: int | None = None
+    # Квантизация векторов новой коллекции: scalar - int8 (в 4 раза меньше памяти),
+    # binary - 1 бит на измерение; None - без квантизации
+    quantization: Literal["scalar", "binary"] | None = None
+    # Поиск по квантованным векторам с пересчётом score по исходным
+    search_rescore: bool = True
+    search_oversampling: float = 2.0
+    # Одновременные запросы поиска объединяются в один batch-запрос
+    search_batch_size: int = 32
+    # Сколько ждать попутные запросы перед отправкой батча, секунды
+    search_batch_wait: float = 0.01
+
+    # Количество точек в одном запросе upsert
+    upsert_batch_size: int = 256
+    # Порог построения HNSW-индекса, восстанавливаемый после массовой загрузки
+    indexing_threshold: int = 20000
+    # Как часто перечитывать информацию о коллекции для get_info, секунды
+    info_refresh_interval: float = 60.0
 
 
 class ChunkingConfig(BaseModel):
@@ -82,4 +108,14 @@ class ChunkingConfig(BaseModel):
 class RAGConfig(BaseModel):
     """Общая конфигурация RAG"""
     documents_dir: Path = Path("./data/documents")
-    chunking: ChunkingConfig = Field(default_factory=ChunkingConfig)
\ No newline at end of file
+    chunking: ChunkingConfig = Field(default_factory=ChunkingConfig)
+    # Одновременно индексируемых батчей (ограничение API эмбеддингов)
+    index_concurrency: int = 4
+    # Процессов для разбора файлов при индексации директории (0 - без пула)
+    load_workers: int = 4
+
+    # Семантический кэш ответов
+    response_cache_size: int = 1024
+    response_cache_ttl: float = 3600.0
+    # Минимальная косинусная близость вопросов для ответа из кэша
+    response_cache_threshold: float = 0.92
\ No newline at end of file
@@ -8,7 +8,9 @@ import shutil
 import tarfile
 import tempfile
 import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
 from typing import Iterator
 
@@ -77,11 +79,9 @@ class ArchiveError(Exception):
 
 def compute_file_hash(file_path: Path) -> str:
     """Вычислить MD5-хеш файла"""
-    hasher = hashlib.md5()
+    # file_digest читает файл в C без цикла на Python
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+        return hashlib.file_digest(f, "md5").hexdigest()
 
 
 class ArchiveHandler:
@@ -219,6 +219,11 @@ class ArchiveHandler:
                 yield path
 
 
+def _load_path(loader: "LegalDocumentLoader", file_path: Path) -> list[Document]:
+    """Загрузить файл или архив в процессе пула"""
+    return loader.load_file(file_path)
+
+
 class LegalDocumentLoader:
     """Загрузчик юридических документов с поддержкой архивов"""
 
@@ -226,8 +231,14 @@ class LegalDocumentLoader:
         self.documents_dir = Path(documents_dir)
         self.documents_dir.mkdir(parents=True, exist_ok=True)
 
-    def load_directory(self) -> Iterator[Document]:
-        """Загрузить все документы из директории"""
+    def load_directory(self, workers: int = 0) -> Iterator[Document]:
+        """
+        Загрузить все документы из директории
+
+        Args:
+            workers: Число процессов для параллельного разбора файлов;
+                0 - разбирать последовательно в текущем процессе
+        """
         regular_files: list[Path] = []
         archive_files: list[Path] = []
 
@@ -241,6 +252,10 @@ class LegalDocumentLoader:
 
         logger.info(f"Найдено: {len(regular_files)} документов, {len(archive_files)} архивов")
 
+        if workers > 0:
+            yield from self._load_parallel(regular_files + archive_files, workers)
+            return
+
         for file_path in regular_files:
             try:
                 yield from self._load_single_file(file_path)
@@ -253,6 +268,39 @@ class LegalDocumentLoader:
             except Exception as e:
                 logger.error(f"Ошибка архива {archive_path.name}: {e}")
 
+    def _load_parallel(self, paths: list[Path], workers: int) -> Iterator[Document]:
+        """
+        Разобрать файлы в пуле процессов, отдавая документы по мере готовности
+
+        В работе не больше workers * 2 файлов: следующий файл отправляется
+        в пул, только когда результат предыдущего забран, поэтому в памяти
+        не копятся разобранные, но ещё не обработанные документы.
+        """
+        if not paths:
+            return
+        remaining = iter(paths)
+        pending: dict[Future, Path] = {}
+        # PDF и DOCX разбираются на Python и держат GIL, поэтому нужны процессы
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            for path in islice(remaining, workers * 2):
+                pending[pool.submit(_load_path, self, path)] = path
+            while pending:
+                # Готовые future забираются по одному: остальные остаются в pending
+                future = wait(pending, return_when=FIRST_COMPLETED).done.pop()
+                path = pending.pop(future)
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending[pool.submit(_load_path, self, next_path)] = next_path
+                try:
+                    documents = future.result()
+                except Exception as e:
+                    logger.error(f"Пропущен {path.name}: {e}")
+                    continue
+                finally:
+                    # Документы не должны жить в future, пока их обрабатывают
+                    del future
+                yield from documents
+
     def load_file(self, file_path: Path | str) -> list[Document]:
         """Загрузить один файл или архив"""
         file_path = Path(file_path)
@@ -265,23 +313,30 @@ class LegalDocumentLoader:
 
     def load_archive(self, archive_path: Path | str) -> tuple[list[Document], ArchiveProcessingStats]:
         """Загрузить архив с детальной статистикой"""
+        stats = ArchiveProcessingStats()
+        documents = list(self.iter_archive(archive_path, stats))
+        return documents, stats
+
+    def iter_archive(self, archive_path: Path | str, stats: ArchiveProcessingStats) -> Iterator[Document]:
+        """
+        Загружать документы архива по одному файлу.
+
+        В памяти одновременно находятся только документы текущего файла;
+        stats заполняется по мере чтения. Временная распаковка удаляется,
+        когда итератор исчерпан или закрыт.
+        """
         archive_path = Path(archive_path)
         if not archive_path.exists():
             raise FileNotFoundError(f"Архив не найден: {archive_path}")
         if not ArchiveHandler.is_archive(archive_path):
             raise ValueError(f"Неподдерживаемый формат: {archive_path.suffix}")
 
-        stats = ArchiveProcessingStats()
-        documents: list[Document] = []
-
-        for doc in self._process_archive_recursive(archive_path, stats=stats):
-            documents.append(doc)
+        yield from self._process_archive_recursive(archive_path, stats=stats)
 
         logger.info(
             f"Архив {archive_path.name}: "
             f"обработано={stats.files_processed}, пропущено={stats.files_skipped}, ошибок={stats.files_failed}"
         )
-        return documents, stats
 
     def _load_single_file(self, file_path: Path, archive_chain: list[str] | None = None) -> list[Document]:
         """Загрузить один документ"""
@@ -2,6 +2,7 @@
 
 import logging
 import asyncio
+from collections import OrderedDict
 from typing import List
 
 import httpx
@@ -22,6 +23,10 @@ class YandexEmbeddings(Embeddings):
     def __init__(self, config: YandexGPTConfig):
         self.config = config
         self._client: httpx.AsyncClient | None = None
+        # Повторяющиеся вопросы не отправляются в API повторно
+        self._query_cache: OrderedDict[str, tuple[float, ...]] = OrderedDict()
+        self._query_cache_hits = 0
+        self._query_cache_misses = 0
         logger.info("YandexEmbeddings инициализированы")
 
     async def _get_client(self) -> httpx.AsyncClient:
@@ -69,21 +74,44 @@ class YandexEmbeddings(Embeddings):
         raise RuntimeError("Превышено количество попыток")
 
     async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Асинхронные эмбеддинги для документов"""
-        embeddings = []
-        for i, text in enumerate(texts):
+        """
+        Асинхронные эмбеддинги для документов
+
+        API принимает один текст за запрос, поэтому тексты векторизуются
+        параллельно, не более config.embeddings_concurrency одновременно.
+        """
+        semaphore = asyncio.Semaphore(self.config.embeddings_concurrency)
+
+        async def embed(text: str) -> List[float]:
             if not text.strip():
-                embeddings.append([0.0] * 256)
-                continue
-            embedding = await self._embed_async(text, self.DOC_MODEL)
-            embeddings.append(embedding)
-            if (i + 1) % 10 == 0:
-                logger.debug(f"Embedded {i + 1}/{len(texts)}")
-        return embeddings
+                return [0.0] * 256
+            async with semaphore:
+                return await self._embed_async(text, self.DOC_MODEL)
+
+        embeddings = await asyncio.gather(*(embed(text) for text in texts))
+        logger.debug(f"Embedded {len(texts)} texts")
+        return list(embeddings)
 
     async def aembed_query(self, text: str) -> List[float]:
-        """Асинхронный эмбеддинг для поискового запроса"""
-        return await self._embed_async(text, self.QUERY_MODEL)
+        """Асинхронный эмбеддинг для поискового запроса (с LRU-кэшем по тексту)"""
+        cached = self._query_cache.get(text)
+        if cached is not None:
+            self._query_cache.move_to_end(text)
+            self._query_cache_hits += 1
+            logger.debug(
+                "Query embedding cache hit (%d hits / %d misses)",
+                self._query_cache_hits, self._query_cache_misses,
+            )
+            return list(cached)
+
+        self._query_cache_misses += 1
+        embedding = await self._embed_async(text, self.QUERY_MODEL)
+
+        if self.config.query_embeddings_cache_size > 0:
+            self._query_cache[text] = tuple(embedding)
+            if len(self._query_cache) > self.config.query_embeddings_cache_size:
+                self._query_cache.popitem(last=False)
+        return embedding
 
     # Синхронные методы для совместимости с LangChain (вызываются через asyncio.run если нужно)
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
@@ -0,0 +1,106 @@
+"""Семантический кэш ответов по эмбеддингу вопроса"""
+
+import time
+from typing import Generic, Hashable, Sequence, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+class SemanticCache(Generic[T]):
+    """
+    Кэш ответов с поиском по косинусной близости эмбеддингов.
+
+    Векторы хранятся нормированными в одной матрице (maxsize, dim), поэтому
+    поиск ближайшего вопроса — одно матричное умножение. Запись живёт ttl
+    секунд; при переполнении вытесняется давно не использованная.
+
+    Если при записи и поиске передан key, ответ отдаётся только для записи
+    с тем же ключом: близость эмбеддингов лишь дополнительная проверка.
+    Так вопросы, различающиеся одним числом ("статья 81" и "статья 82"),
+    не получают ответы друг друга, хотя их эмбеддинги почти совпадают.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0, threshold: float = 0.92):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._vectors: np.ndarray | None = None
+        self._expires_at = np.zeros(maxsize)
+        self._last_used = np.zeros(maxsize)
+        self._values: list[T | None] = [None] * maxsize
+        self._keys: list[Hashable | None] = [None] * maxsize
+        self._index_by_key: dict[Hashable, int] = {}
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray | None:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        if not norm:
+            return None
+        return array / norm
+
+    def lookup(self, vector: Sequence[float], key: Hashable | None = None) -> T | None:
+        """Найти ответ на достаточно близкий вопрос (с тем же key, если задан)"""
+        query = self._normalize(vector)
+        if self._vectors is None or query is None or query.shape[0] != self._vectors.shape[1]:
+            return None
+
+        now = time.monotonic()
+        if key is not None:
+            index = self._index_by_key.get(key)
+            if index is None or self._expires_at[index] <= now:
+                return None
+            if float(self._vectors[index] @ query) < self.threshold:
+                return None
+            self._last_used[index] = now
+            return self._values[index]
+
+        similarities = self._vectors @ query
+        similarities[self._expires_at <= now] = -np.inf
+        index = int(np.argmax(similarities))
+        if similarities[index] < self.threshold:
+            return None
+
+        self._last_used[index] = now
+        return self._values[index]
+
+    def set(self, vector: Sequence[float], value: T, key: Hashable | None = None) -> None:
+        """Сохранить ответ (key - точный ключ вопроса для lookup)"""
+        normalized = self._normalize(vector)
+        if normalized is None or self.maxsize <= 0:
+            return
+        if self._vectors is None or normalized.shape[0] != self._vectors.shape[1]:
+            self._vectors = np.zeros((self.maxsize, normalized.shape[0]), dtype=np.float32)
+            self.clear()
+
+        now = time.monotonic()
+        index = self._index_by_key.get(key) if key is not None else None
+        if index is None:
+            expired = np.flatnonzero(self._expires_at <= now)
+            index = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+
+        # Вытесняемая запись больше не находится по своему ключу
+        old_key = self._keys[index]
+        if old_key is not None and self._index_by_key.get(old_key) == index:
+            del self._index_by_key[old_key]
+        self._keys[index] = key
+        if key is not None:
+            self._index_by_key[key] = index
+
+        self._vectors[index] = normalized
+        self._expires_at[index] = now + self.ttl
+        self._last_used[index] = now
+        self._values[index] = value
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        self._expires_at[:] = 0
+        self._last_used[:] = 0
+        self._values = [None] * self.maxsize
+        self._keys = [None] * self.maxsize
+        self._index_by_key.clear()
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires_at > time.monotonic()))
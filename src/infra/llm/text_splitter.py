@@ -0,0 +1,58 @@
+"""Разбиение документов на чанки с кэшированием повторяющегося текста"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+class CachingTextSplitter(RecursiveCharacterTextSplitter):
+    """
+    RecursiveCharacterTextSplitter с LRU-кэшем результатов split_text.
+
+    В архивах часто повторяются титульные листы, блоки подписей и оговорки,
+    поэтому одинаковый текст разбивается один раз. Ключ кэша — хэш текста;
+    метаданные документов в кэш не попадают и проставляются для каждого
+    документа заново.
+    """
+
+    def __init__(self, cache_size: int = 4096, **kwargs):
+        super().__init__(**kwargs)
+        self._cache_size = cache_size
+        self._cache: OrderedDict[bytes, list[str]] = OrderedDict()
+        # split_documents вызывается из потоков пула
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # В процессы пула передаются только настройки, без кэша и блокировки
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_cache"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def split_text(self, text: str) -> list[str]:
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+        with self._lock:
+            chunks = self._cache.get(key)
+            if chunks is not None:
+                self._cache.move_to_end(key)
+                return list(chunks)
+
+        chunks = super().split_text(text)
+
+        with self._lock:
+            self._cache[key] = chunks
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return list(chunks)
+
+    def clear_cache(self) -> None:
+        """Очистить кэш"""
+        with self._lock:
+            self._cache.clear()
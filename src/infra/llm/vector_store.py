@@ -1,18 +1,30 @@
 """Асинхронное векторное хранилище на базе Qdrant"""
 
+import asyncio
 import logging
+import time
 import uuid
-from typing import List, Any
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Any, Sequence
 
 from langchain_core.documents import Document
 from qdrant_client import AsyncQdrantClient
 from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
     Distance,
     VectorParams,
     PointStruct,
     Filter,
     FieldCondition,
     MatchValue,
+    OptimizersConfigDiff,
+    QuantizationSearchParams,
+    QueryRequest,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
 )
 
 from .config import QdrantConfig
@@ -20,6 +32,85 @@ from .embeddings import YandexEmbeddings
 
 logger = logging.getLogger(__name__)
 
+# Пространство имён для детерминированных id точек (uuid5)
+_POINT_ID_NAMESPACE = uuid.UUID("5f1c4a52-8d0e-4c1b-9f3a-2b7d6e0a9c41")
+
+
+class _SearchCoalescer:
+    """
+    Объединяет одновременные поисковые запросы в батчи.
+
+    Запросы, пришедшие в пределах max_wait секунд, уходят одним
+    вызовом run_batch (не более max_batch за раз).
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[
+            [list[tuple[Sequence[float], int, float | None]]], Awaitable[list[List[Document]]]
+        ],
+        max_batch: int = 32,
+        max_wait: float = 0.01,
+    ):
+        self._run_batch = run_batch
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._queue: asyncio.Queue[
+            tuple[Sequence[float], int, float | None, asyncio.Future]
+        ] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    async def submit(
+        self,
+        query_vector: Sequence[float],
+        k: int,
+        score_threshold: float | None = None,
+    ) -> List[Document]:
+        """Поставить запрос в очередь и дождаться его результатов"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((query_vector, k, score_threshold, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._worker(), name="qdrant-search-batcher")
+        return await future
+
+    async def _drain(self) -> list[tuple[Sequence[float], int, float | None, asyncio.Future]]:
+        """Дождаться первого запроса и добрать попутные"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_wait
+        while len(batch) < self._max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self) -> None:
+        while True:
+            batch = [item for item in await self._drain() if not item[-1].done()]
+            if not batch:
+                continue
+            try:
+                results = await self._run_batch([item[:-1] for item in batch])
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), documents in zip(batch, results):
+                if not future.done():
+                    future.set_result(documents)
+
+    async def close(self) -> None:
+        """Остановить фоновую задачу"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
 
 class QdrantVectorStore:
     """Асинхронное векторное хранилище Qdrant"""
@@ -29,13 +120,52 @@ class QdrantVectorStore:
         self.embeddings = embeddings
         self._client: AsyncQdrantClient | None = None
         self._initialized = False
-        logger.info(f"Qdrant config: {config.host}:{config.port}")
+        # Последняя точка, записанная без ожидания применения
+        self._unflushed_point: PointStruct | None = None
+        # Информация о коллекции; points_count ведётся локально между обновлениями
+        self._info: dict[str, Any] | None = None
+        self._info_expires_at = 0.0
+        # Неизменные параметры поиска собираются один раз
+        self._search_kwargs = {
+            "collection_name": config.collection_name,
+            "with_payload": True,
+            "search_params": self._build_search_params(config),
+        }
+        self._search_coalescer = _SearchCoalescer(
+            self._search_batch,
+            max_batch=config.search_batch_size,
+            max_wait=config.search_batch_wait,
+        )
+        logger.info("Qdrant config: %s:%s", config.host, config.port)
+
+    @staticmethod
+    def _build_search_params(config: QdrantConfig) -> SearchParams | None:
+        """Параметры поиска из конфигурации (None - настройки коллекции)"""
+        quantization = None
+        if config.quantization:
+            quantization = QuantizationSearchParams(
+                rescore=config.search_rescore,
+                oversampling=config.search_oversampling,
+            )
+        if not config.search_hnsw_ef and quantization is None:
+            return None
+        return SearchParams(hnsw_ef=config.search_hnsw_ef, quantization=quantization)
+
+    def _build_quantization_config(self) -> ScalarQuantization | BinaryQuantization | None:
+        """Квантизация для новой коллекции"""
+        if self.config.quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True),
+            )
+        if self.config.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
 
     async def _get_client(self) -> AsyncQdrantClient:
         """Ленивая инициализация клиента"""
         if self._client is None:
             self._client = AsyncQdrantClient(host=self.config.host, port=self.config.port)
-            logger.info(f"Qdrant connected: {self.config.host}:{self.config.port}")
+            logger.info("Qdrant connected: %s:%s", self.config.host, self.config.port)
         
         if not self._initialized:
             await self._ensure_collection()
@@ -56,27 +186,60 @@ class QdrantVectorStore:
                     size=self.config.embedding_dim,
                     distance=Distance.COSINE,
                 ),
+                quantization_config=self._build_quantization_config(),
             )
-            logger.info(f"Создана коллекция: {self.config.collection_name}")
+            logger.info("Создана коллекция: %s", self.config.collection_name)
+
+    @staticmethod
+    def _point_id(doc: Document) -> str:
+        """
+        Детерминированный id точки по файлу, странице и тексту чанка
+
+        Повторная загрузка того же файла даёт те же id, поэтому точки
+        перезаписываются, а не дублируются.
+        """
+        metadata = doc.metadata
+        name = f"{metadata.get('file_hash', '')}:{metadata.get('page')}:{doc.page_content}"
+        return str(uuid.uuid5(_POINT_ID_NAMESPACE, name))
+
+    async def add_documents(self, documents: List[Document], wait: bool = True) -> List[str]:
+        """
+        Асинхронно добавить документы
+
+        Чанки, которые уже есть в коллекции, повторно не векторизуются.
+        При wait=False Qdrant отвечает, не дожидаясь применения записи;
+        чтобы документы гарантированно появились в поиске, нужно вызвать flush().
 
-    async def add_documents(self, documents: List[Document]) -> List[str]:
-        """Асинхронно добавить документы"""
+        Returns:
+            id точек всех переданных документов
+        """
         if not documents:
             return []
         
         client = await self._get_client()
-        
-        texts = [doc.page_content for doc in documents]
+
+        ids = [self._point_id(doc) for doc in documents]
+        # Одинаковые чанки внутри батча записываются один раз
+        new_documents = dict(zip(ids, documents))
+
+        existing = await client.retrieve(
+            collection_name=self.config.collection_name,
+            ids=list(new_documents),
+            with_payload=False,
+            with_vectors=False,
+        )
+        for record in existing:
+            new_documents.pop(str(record.id), None)
+
+        if not new_documents:
+            logger.info("Все %s документов уже проиндексированы", len(documents))
+            return ids
+
+        texts = [doc.page_content for doc in new_documents.values()]
         embeddings = await self.embeddings.aembed_documents(texts)
         
-        points = []
-        ids = []
-        
-        for doc, embedding in zip(documents, embeddings):
-            point_id = str(uuid.uuid4())
-            ids.append(point_id)
-            
-            points.append(PointStruct(
+        points = [
+            PointStruct(
                 id=point_id,
                 vector=embedding,
                 payload={
@@ -85,19 +248,76 @@ class QdrantVectorStore:
                     "source": doc.metadata.get("source", ""),
                     "page": doc.metadata.get("page"),
                     "file_hash": doc.metadata.get("file_hash", ""),
+                    # Хеш файла, загруженного через API (архив - один на все файлы)
+                    "upload_hash": doc.metadata.get("upload_hash", ""),
                 },
-            ))
+            )
+            for (point_id, doc), embedding in zip(new_documents.items(), embeddings)
+        ]
         
         # Загрузка батчами
-        for i in range(0, len(points), 100):
+        batch_size = self.config.upsert_batch_size
+        for i in range(0, len(points), batch_size):
             await client.upsert(
                 collection_name=self.config.collection_name,
-                points=points[i:i + 100],
+                points=points[i:i + batch_size],
+                wait=wait,
             )
+        if not wait:
+            self._unflushed_point = points[-1]
+        if self._info is not None:
+            self._info["points_count"] += len(points)
         
-        logger.info(f"Добавлено {len(points)} документов")
+        logger.info("Добавлено %s документов", len(points))
         return ids
 
+    @asynccontextmanager
+    async def bulk_upload_mode(self) -> AsyncIterator[None]:
+        """
+        Отключить построение HNSW-индекса на время массовой загрузки
+
+        Индекс строится один раз после загрузки вместо постоянной
+        перестройки на промежуточных данных. На выходе восстанавливается
+        порог, действовавший в коллекции до входа.
+        """
+        client = await self._get_client()
+        info = await client.get_collection(self.config.collection_name)
+        previous_threshold = info.config.optimizer_config.indexing_threshold
+        if previous_threshold is None:
+            # None в OptimizersConfigDiff означает «не менять» и оставил бы 0
+            previous_threshold = self.config.indexing_threshold
+        await client.update_collection(
+            collection_name=self.config.collection_name,
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+        )
+        try:
+            yield
+        finally:
+            await client.update_collection(
+                collection_name=self.config.collection_name,
+                optimizers_config=OptimizersConfigDiff(
+                    indexing_threshold=previous_threshold,
+                ),
+            )
+            logger.info("Индексация коллекции снова включена")
+
+    async def flush(self) -> None:
+        """Дождаться применения записей, сделанных с wait=False"""
+        point = self._unflushed_point
+        if point is None:
+            return
+
+        client = await self._get_client()
+        # Повторная запись той же точки ничего не меняет, а с wait=True
+        # Qdrant отвечает только после применения всех предыдущих операций
+        await client.upsert(
+            collection_name=self.config.collection_name,
+            points=[point],
+            wait=True,
+        )
+        if self._unflushed_point is point:
+            self._unflushed_point = None
+
     def _points_to_documents(self, points) -> List[Document]:
         """Преобразовать точки Qdrant в документы"""
         documents = []
@@ -120,37 +340,93 @@ class QdrantVectorStore:
         query: str,
         k: int | None = None,
         filter_dict: dict | None = None,
+        score_threshold: float | None = None,
     ) -> List[Document]:
-        """Асинхронный поиск по сходству"""
-        k = k or self.config.search_k
-        client = await self._get_client()
-        
+        """
+        Асинхронный поиск по сходству
+
+        Запросы без фильтра, выполняемые одновременно, объединяются
+        в один batch-запрос к Qdrant. Точки со score ниже score_threshold
+        отбрасываются на стороне Qdrant.
+        """
         query_vector = await self.embeddings.aembed_query(query)
+        if not filter_dict:
+            return await self.search_by_vector(query_vector, k, score_threshold)
+
+        client = await self._get_client()
         
-        qdrant_filter = None
-        if filter_dict:
-            qdrant_filter = Filter(must=[
-                FieldCondition(key=key, match=MatchValue(value=value))
-                for key, value in filter_dict.items()
-            ])
+        qdrant_filter = Filter(must=[
+            FieldCondition(key=key, match=MatchValue(value=value))
+            for key, value in filter_dict.items()
+        ])
 
         results = await client.query_points(
-            collection_name=self.config.collection_name,
             query=query_vector,
-            limit=k,
+            limit=k or self.config.search_k,
             query_filter=qdrant_filter,
-            with_payload=True,
+            score_threshold=score_threshold,
+            **self._search_kwargs,
         )
 
         return self._points_to_documents(results.points)
 
+    async def search_by_vector(
+        self,
+        query_vector: Sequence[float],
+        k: int | None = None,
+        score_threshold: float | None = None,
+    ) -> List[Document]:
+        """Поиск по готовому эмбеддингу запроса"""
+        return await self._search_coalescer.submit(
+            query_vector, k or self.config.search_k, score_threshold,
+        )
+
+    async def _search_batch(
+        self,
+        queries: list[tuple[Sequence[float], int, float | None]],
+    ) -> list[List[Document]]:
+        """Поиск по нескольким запросам за один вызов Qdrant"""
+        client = await self._get_client()
+
+        responses = await client.query_batch_points(
+            collection_name=self.config.collection_name,
+            requests=[
+                QueryRequest(
+                    query=vector,
+                    limit=k,
+                    score_threshold=score_threshold,
+                    with_payload=True,
+                    params=self._search_kwargs["search_params"],
+                )
+                for vector, k, score_threshold in queries
+            ],
+        )
+
+        return [self._points_to_documents(response.points) for response in responses]
+
     async def clear_collection(self) -> None:
         """Очистить коллекцию"""
         client = await self._get_client()
         await client.delete_collection(self.config.collection_name)
         self._initialized = False
         await self._ensure_collection()
-        logger.info(f"Коллекция очищена: {self.config.collection_name}")
+        if self._info is not None:
+            self._info["points_count"] = 0
+        logger.info("Коллекция очищена: %s", self.config.collection_name)
+
+    async def has_upload(self, upload_hash: str) -> bool:
+        """Есть ли в коллекции точки файла, загруженного с этим хешем"""
+        client = await self._get_client()
+        points, _ = await client.scroll(
+            collection_name=self.config.collection_name,
+            scroll_filter=Filter(must=[
+                FieldCondition(key="upload_hash", match=MatchValue(value=upload_hash)),
+            ]),
+            limit=1,
+            with_payload=False,
+            with_vectors=False,
+        )
+        return bool(points)
 
     async def count(self) -> int:
         """Количество документов"""
@@ -158,17 +434,30 @@ class QdrantVectorStore:
         info = await client.get_collection(self.config.collection_name)
         return info.points_count
 
-    async def get_info(self) -> dict[str, Any]:
-        """Информация о коллекции"""
+    async def get_info(self, refresh: bool = False) -> dict[str, Any]:
+        """
+        Информация о коллекции
+
+        Qdrant опрашивается не чаще раза в config.info_refresh_interval секунд;
+        в промежутке points_count учитывает записи и очистки этого экземпляра.
+        refresh=True запрашивает актуальные данные сразу.
+        """
+        now = time.monotonic()
+        if not refresh and self._info is not None and now < self._info_expires_at:
+            return dict(self._info)
+
         client = await self._get_client()
         info = await client.get_collection(self.config.collection_name)
-        return {
+        self._info = {
             "name": self.config.collection_name,
             "points_count": info.points_count,
             "status": info.status.value,
         }
+        self._info_expires_at = now + self.config.info_refresh_interval
+        return dict(self._info)
 
     async def close(self) -> None:
+        await self._search_coalescer.close()
         if self._client:
             await self._client.close()
             self._client = None
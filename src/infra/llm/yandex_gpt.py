@@ -45,6 +45,12 @@ class YandexGPTClient:
     def __init__(self, config: YandexGPTConfig):
         self.config = config
         self._client: httpx.AsyncClient | None = None
+        # Ограничение параллельных запросов: при наплыве пользователей
+        # запросы ждут здесь, а не получают 429 от API
+        self._semaphore = asyncio.Semaphore(config.max_concurrency)
+        # Неизменные части тела запроса собираются один раз
+        self._model_uri = config.model_uri
+        self._default_options = self._completion_options(config.temperature, config.max_tokens)
         logger.info(f"YandexGPT: {config.model_uri}")
 
     async def _get_client(self) -> httpx.AsyncClient:
@@ -59,6 +65,14 @@ class YandexGPTClient:
             )
         return self._client
 
+    @staticmethod
+    def _completion_options(temperature: float, max_tokens: int) -> dict:
+        return {
+            "stream": False,
+            "temperature": temperature,
+            "maxTokens": str(max_tokens),
+        }
+
     async def complete(
         self,
         messages: list[YandexGPTMessage],
@@ -66,13 +80,16 @@ class YandexGPTClient:
         max_tokens: int | None = None,
     ) -> YandexGPTResponse:
         """Асинхронная генерация ответа"""
+        if temperature or max_tokens:
+            options = self._completion_options(
+                temperature or self.config.temperature,
+                max_tokens or self.config.max_tokens,
+            )
+        else:
+            options = self._default_options
         body = {
-            "modelUri": self.config.model_uri,
-            "completionOptions": {
-                "stream": False,
-                "temperature": temperature or self.config.temperature,
-                "maxTokens": str(max_tokens or self.config.max_tokens),
-            },
+            "modelUri": self._model_uri,
+            "completionOptions": options,
             "messages": [{"role": m.role, "text": m.text} for m in messages],
         }
 
@@ -80,7 +97,8 @@ class YandexGPTClient:
 
         for attempt in range(self.config.max_retries):
             try:
-                response = await client.post(self.config.api_url, json=body)
+                async with self._semaphore:
+                    response = await client.post(self.config.api_url, json=body)
                 response.raise_for_status()
                 
                 result = response.json()["result"]
@@ -4,9 +4,12 @@ import logging
 import uvicorn
 from aiogram import Bot, Dispatcher
 from infra.db.database import engine, Base
+from infra.db.schema import upgrade_schema
 
 from config import settings
 from bot.handlers import router
+from bot.handlers.handlers import upload_queue
+from bot.http import close_http_session, open_http_session
 from bot.middlewares import LoggingMiddleware
 from web import app
 
@@ -16,12 +19,17 @@ async def main():
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await upgrade_schema(conn)
 
     bot = Bot(token=settings.bot_token)
     dp = Dispatcher()
 
     dp.message.middleware(LoggingMiddleware())
     dp.include_router(router)
+    dp.startup.register(open_http_session)
+    dp.startup.register(upload_queue.start)
+    dp.shutdown.register(upload_queue.stop)
+    dp.shutdown.register(close_http_session)
 
     config = uvicorn.Config(app, host="127.0.0.1", port=8000, log_level="info")
     server = uvicorn.Server(config)
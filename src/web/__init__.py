@@ -1,6 +1,7 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
+from infra.db.database import async_session_factory
 from infra.llm import LegalRAGAgent
 from core.services import RAGService, IngestionService, DocumentGenerationService
 
@@ -18,7 +19,7 @@ async def lifespan(app: FastAPI):
     # Startup
     agent = LegalRAGAgent()
     rag_service = RAGService(agent=agent)
-    ingestion_service = IngestionService(agent=agent)
+    ingestion_service = IngestionService(agent=agent, session_factory=async_session_factory)
     doc_generation_service = DocumentGenerationService(agent=agent)
 
     yield
@@ -26,6 +27,10 @@ async def lifespan(app: FastAPI):
     # Shutdown
     if rag_service:
         await rag_service.close()
+    if ingestion_service:
+        await ingestion_service.close()
+    if doc_generation_service:
+        await doc_generation_service.close()
 
 
 app = FastAPI(
@@ -62,6 +62,8 @@ async def generate_document(
     user = await repo.get_by_telegram_id(request.user_id)
     if not user:
         raise HTTPException(status_code=403, detail="Unauthorized")
+    # Соединение больше не нужно: возвращаем его в пул до генерации
+    await session.close()
 
     try:
         result = await doc_service.generate(
@@ -90,6 +92,8 @@ async def generate_document_pdf(
     user = await repo.get_by_telegram_id(request.user_id)
     if not user:
         raise HTTPException(status_code=403, detail="Unauthorized")
+    # Соединение больше не нужно: возвращаем его в пул до генерации
+    await session.close()
 
     try:
         result = await doc_service.generate(
@@ -15,6 +15,7 @@ class UploadResponse(BaseModel):
     file_type: str
     files_processed: int
     errors: list[str] = []
+    duplicate: bool = False
 
 
 upload_router = APIRouter()
@@ -47,6 +48,8 @@ async def upload_document(
     user = await repo.get_by_telegram_id(user_id)
     if not user or user.role != "admin":
         raise HTTPException(status_code=403, detail="Forbidden: admin only")
+    # Соединение больше не нужно: возвращаем его в пул до долгой индексации
+    await session.close()
 
     filename = file.filename or "unknown"
     is_valid, file_type = get_file_type(filename)
@@ -57,12 +60,17 @@ async def upload_document(
     try:
         result = await ingestion_service.processFile(file)
 
+        if result.duplicate:
+            message = "Файл уже был загружен ранее"
+        else:
+            message = f"{'Архив' if result.file_type == 'archive' else 'Документ'} обработан"
         return UploadResponse(
-            message=f"{'Архив' if result.file_type == 'archive' else 'Документ'} обработан",
+            message=message,
             chunks_added=result.chunks_count,
             file_type=result.file_type,
             files_processed=result.files_processed,
-            errors=result.errors
+            errors=result.errors,
+            duplicate=result.duplicate,
         )
 
     except ValueError as e:
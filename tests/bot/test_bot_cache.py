@@ -0,0 +1,63 @@
+import pytest
+
+from bot.cache import SmartAskCache, normalize_query
+
+
+def test_normalize_query_collapses_whitespace_and_case():
+    assert normalize_query("  Что   такое\tДОГОВОР? ") == "что такое договор?"
+
+
+@pytest.mark.asyncio
+async def test_cache_exact_hit_and_miss():
+    cache = SmartAskCache()
+    assert await cache.get("user", "вопрос") is None
+
+    await cache.set("user", "вопрос", {"answer": "ответ"})
+
+    assert await cache.get("user", "  ВОПРОС ") == {"answer": "ответ"}
+    assert await cache.get("admin", "вопрос") is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_similar_question_hits():
+    cache = SmartAskCache()
+    await cache.set("user", "какой срок исковой давности по договору", {"answer": "3 года"})
+
+    result = await cache.get("user", "по договору какой срок исковой давности?")
+
+    assert result == {"answer": "3 года"}
+    assert cache.stats.similar_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_question_differing_by_one_word_misses():
+    cache = SmartAskCache()
+    await cache.set("user", "что грозит по статья 81 тк рф", {"answer": "статья 81"})
+
+    assert await cache.get("user", "что грозит по статья 82 тк рф") is None
+    assert cache.stats.similar_hits == 0
+    assert cache.stats.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_expired_entry_is_dropped():
+    cache = SmartAskCache(ttl=0)
+    await cache.set("user", "вопрос", {"answer": "ответ"})
+
+    assert await cache.get("user", "вопрос") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used():
+    cache = SmartAskCache(maxsize=2)
+    await cache.set("user", "первый", {"answer": "1"})
+    await cache.set("user", "второй", {"answer": "2"})
+    await cache.get("user", "первый")
+    await cache.set("user", "третий", {"answer": "3"})
+
+    assert await cache.get("user", "второй") is None
+    assert await cache.get("user", "первый") == {"answer": "1"}
+    assert cache.stats.evictions == 1
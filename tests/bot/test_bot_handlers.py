@@ -1,23 +1,53 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import time
 from types import SimpleNamespace
 from unittest.mock import AsyncMock
 
+import aiohttp
 import pytest
 
 from aiogram.types import InlineKeyboardMarkup
 
 import bot.handlers.handlers as h
+import bot.user_cache as user_cache
 
 
-def _fake_get_session(session_obj: object):
-    def _get_session():
-        async def _gen():
-            yield session_obj
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    h.ask_cache.clear()
+    h.source_cache.clear()
+    user_cache.clear_user_cache()
+    yield
+    h.ask_cache.clear()
+    h.source_cache.clear()
+    user_cache.clear_user_cache()
 
-        return _gen()
 
-    return _get_session
+def _fake_http_session(session_obj: object):
+    async def _get_http_session():
+        return session_obj
+
+    return _get_http_session
+
+
+def _fake_session_factory(session_obj: object):
+    class _SessionContext:
+        async def __aenter__(self):
+            return session_obj
+
+        async def __aexit__(self, exc_type, exc, tb):
+            return False
+
+    return lambda: _SessionContext()
+
+
+def _patch_db(monkeypatch, session_obj: object, repo: object) -> None:
+    for module in (h, user_cache):
+        monkeypatch.setattr(module, "async_session_factory", _fake_session_factory(session_obj))
+        monkeypatch.setattr(module, "UserRepository", lambda session: repo)
 
 
 def _fake_message(
@@ -50,7 +80,7 @@ class _DummyResponse:
         self._text_data = text_data
         self.headers = {}
 
-    async def json(self):
+    async def json(self, **kwargs):
         return self._json_data
 
     async def text(self):
@@ -67,12 +97,6 @@ class _DummyClientSession:
     def __init__(self, responses: list[_DummyResponse]):
         self._responses = list(responses)
 
-    async def __aenter__(self):
-        return self
-
-    async def __aexit__(self, exc_type, exc, tb):
-        return False
-
     def post(self, url: str, **kwargs):
         if not self._responses:
             raise AssertionError(f"Unexpected POST to {url}")
@@ -92,8 +116,7 @@ async def test_cmd_start_asks_token_for_new_user(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=None))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     state = SimpleNamespace(set_state=AsyncMock())
     msg = _fake_message(text="/start")
@@ -110,8 +133,7 @@ async def test_cmd_start_shows_menu_for_existing_user(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     state = SimpleNamespace(set_state=AsyncMock())
     msg = _fake_message(text="/start")
@@ -128,9 +150,8 @@ async def test_handle_auth_token_rejects_invalid_token(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(upsert=AsyncMock())
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
-    monkeypatch.setattr(h, "settings", SimpleNamespace(admin_token="admin", user_token="user"))
+    _patch_db(monkeypatch, session_obj, repo)
+    monkeypatch.setattr(h, "_TOKEN_ROLES", {b"user": "user", b"admin": "admin"})
 
     state = SimpleNamespace(clear=AsyncMock())
     msg = _fake_message(text="nope", user_id=5)
@@ -148,9 +169,8 @@ async def test_handle_auth_token_accepts_admin_token(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(upsert=AsyncMock())
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
-    monkeypatch.setattr(h, "settings", SimpleNamespace(admin_token="admin", user_token="user"))
+    _patch_db(monkeypatch, session_obj, repo)
+    monkeypatch.setattr(h, "_TOKEN_ROLES", {b"user": "user", b"admin": "admin"})
 
     state = SimpleNamespace(clear=AsyncMock())
     msg = _fake_message(text="admin", user_id=7)
@@ -168,8 +188,7 @@ async def test_select_upload_mode_requires_auth(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=None))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     state = SimpleNamespace(set_state=AsyncMock())
     msg = _fake_message(text="Загрузить документ")
@@ -186,8 +205,7 @@ async def test_select_upload_mode_rejects_non_admin(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     state = SimpleNamespace(set_state=AsyncMock())
     msg = _fake_message(text="Загрузить документ")
@@ -204,8 +222,7 @@ async def test_select_upload_mode_sets_state_for_admin(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="admin")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     state = SimpleNamespace(set_state=AsyncMock())
     msg = _fake_message(text="Загрузить документ")
@@ -222,8 +239,7 @@ async def test_handle_ask_skips_menu_commands(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock())
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     state = SimpleNamespace(update_data=AsyncMock())
     msg = _fake_message(text="Задать вопрос")
@@ -239,8 +255,9 @@ async def test_handle_ask_requires_auth(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=None))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
+    monkeypatch.setattr(h, "settings", SimpleNamespace(api_base_url="http://api"))
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession([])))
 
     state = SimpleNamespace(update_data=AsyncMock())
     msg = _fake_message(text="What is this?")
@@ -249,6 +266,64 @@ async def test_handle_ask_requires_auth(monkeypatch):
 
     msg.answer.assert_awaited_once()
     assert "Сначала токен" in msg.answer.await_args.args[0]
+    msg.bot.send_chat_action.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_handle_ask_does_not_send_question_for_unknown_user(monkeypatch):
+    repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=None))
+    _patch_db(monkeypatch, SimpleNamespace(), repo)
+    post_ask = AsyncMock()
+    monkeypatch.setattr(h, "_post_ask", post_ask)
+
+    msg = _fake_message(text="What is this?")
+    await h.handle_ask(msg, SimpleNamespace(update_data=AsyncMock()))
+
+    post_ask.assert_not_called()
+    assert "Сначала токен" in msg.answer.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_handle_ask_cached_answer_skips_speculative_request(monkeypatch):
+    repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
+    _patch_db(monkeypatch, SimpleNamespace(), repo)
+    post_ask = AsyncMock()
+    monkeypatch.setattr(h, "_post_ask", post_ask)
+    # Пользователь уже проходил проверку, но запись устарела
+    user_cache._USER_CACHE[1] = (time.monotonic() - 10 * user_cache.USER_CACHE_TTL, SimpleNamespace(role="user"))
+    await h.ask_cache.set("user", "Что такое договор?", {"answer": "Из кэша", "sources": []})
+
+    msg = _fake_message(text="Что такое договор?")
+    await h.handle_ask(msg, SimpleNamespace(update_data=AsyncMock()))
+
+    post_ask.assert_not_called()
+    assert msg.answer.await_args.args[0] == "Из кэша"
+
+
+@pytest.mark.asyncio
+async def test_handle_ask_discards_speculative_request_when_auth_fails(monkeypatch):
+    cancelled = []
+
+    async def slow_post_ask(question, user_id):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def failing_lookup(tg_id):
+        await asyncio.sleep(0)
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(h, "_post_ask", slow_post_ask)
+    monkeypatch.setattr(h, "get_user_cached", failing_lookup)
+    user_cache._USER_CACHE[1] = (time.monotonic() - 10 * user_cache.USER_CACHE_TTL, SimpleNamespace(role="user"))
+
+    with pytest.raises(RuntimeError, match="db down"):
+        await h.handle_ask(_fake_message(text="Вопрос"), SimpleNamespace(update_data=AsyncMock()))
+    await asyncio.sleep(0)
+
+    assert cancelled == [True]
 
 
 @pytest.mark.asyncio
@@ -256,8 +331,7 @@ async def test_handle_ask_success_with_sources(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
     monkeypatch.setattr(h, "settings", SimpleNamespace(api_base_url="http://api"))
 
     responses = [
@@ -270,7 +344,7 @@ async def test_handle_ask_success_with_sources(monkeypatch):
         )
     ]
 
-    monkeypatch.setattr(h.aiohttp, "ClientSession", lambda *a, **k: _DummyClientSession(responses))
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession(responses)))
 
     state = SimpleNamespace(update_data=AsyncMock())
     msg = _fake_message(text="Question")
@@ -278,20 +352,80 @@ async def test_handle_ask_success_with_sources(monkeypatch):
     await h.handle_ask(msg, state)
 
     msg.bot.send_chat_action.assert_awaited_once_with(msg.chat.id, "typing")
-    state.update_data.assert_awaited_once()
+    state.update_data.assert_awaited_once_with(
+        last_sources=[{"filename": "a.pdf", "page": 1, "archive": None}]
+    )
 
     kwargs = msg.answer.await_args.kwargs
     assert kwargs.get("parse_mode") == "Markdown"
     assert isinstance(kwargs.get("reply_markup"), InlineKeyboardMarkup)
 
 
+@pytest.mark.asyncio
+async def test_handle_ask_repeated_question_served_from_cache(monkeypatch):
+    session_obj = SimpleNamespace()
+    repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
+
+    _patch_db(monkeypatch, session_obj, repo)
+    monkeypatch.setattr(h, "settings", SimpleNamespace(api_base_url="http://api"))
+
+    responses = [_DummyResponse(status=200, json_data={"answer": "Answer", "sources": []})]
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession(responses)))
+
+    state = SimpleNamespace(update_data=AsyncMock())
+    first = _fake_message(text="Что такое договор?")
+    second = _fake_message(text="  что такое   ДОГОВОР? ")
+
+    await h.handle_ask(first, state)
+    await h.handle_ask(second, state)
+
+    assert first.answer.await_args.args[0] == "Answer"
+    assert second.answer.await_args.args[0] == "Answer"
+    assert h.ask_cache.stats.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_user_lookup_is_cached_until_reauth(monkeypatch):
+    session_obj = SimpleNamespace()
+    repo = SimpleNamespace(
+        get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")),
+        delete_by_telegram_id=AsyncMock(),
+    )
+    _patch_db(monkeypatch, session_obj, repo)
+
+    state = SimpleNamespace(set_state=AsyncMock())
+
+    await h.select_ask_mode(_fake_message(text="Задать вопрос", user_id=3), state)
+    await h.select_ask_mode(_fake_message(text="Задать вопрос", user_id=3), state)
+    assert repo.get_by_telegram_id.await_count == 1
+
+    await h.cmd_reauth(_fake_message(text="/reauth", user_id=3), state)
+    await h.select_ask_mode(_fake_message(text="Задать вопрос", user_id=3), state)
+    assert repo.get_by_telegram_id.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_user_cache_evicts_least_recently_used(monkeypatch):
+    repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="admin")))
+    _patch_db(monkeypatch, SimpleNamespace(), repo)
+    monkeypatch.setattr(user_cache, "USER_CACHE_MAXSIZE", 2)
+
+    await user_cache.get_user_cached(1)
+    await user_cache.get_user_cached(2)
+    await user_cache.get_user_cached(1)
+    await user_cache.get_user_cached(3)
+
+    assert user_cache.peek_cached_user(1) is not None
+    assert user_cache.peek_cached_user(2) is None
+    assert repo.get_by_telegram_id.await_count == 3
+
+
 @pytest.mark.asyncio
 async def test_handle_upload_rejects_unsupported(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="admin")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     doc = SimpleNamespace(file_name="bad.exe", mime_type="application/octet-stream", file_size=1024)
     msg = _fake_message(text=None, document=doc)
@@ -308,8 +442,7 @@ async def test_handle_upload_rejects_too_large(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="admin")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     big_size = 51 * 1024 * 1024
     doc = SimpleNamespace(file_name="doc.pdf", mime_type="application/pdf", file_size=big_size)
@@ -349,8 +482,7 @@ async def test_cmd_reauth_deletes_user_and_prompts_token(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(delete_by_telegram_id=AsyncMock())
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     state = SimpleNamespace(set_state=AsyncMock())
     msg = _fake_message(text="/reauth", user_id=42)
@@ -368,8 +500,7 @@ async def test_select_ask_mode_sets_state_for_authed_user(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     state = SimpleNamespace(set_state=AsyncMock())
     msg = _fake_message(text="Задать вопрос")
@@ -386,12 +517,11 @@ async def test_handle_ask_non_200_returns_error_message(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
     monkeypatch.setattr(h, "settings", SimpleNamespace(api_base_url="http://api"))
 
     responses = [_DummyResponse(status=500, text_data="boom")]
-    monkeypatch.setattr(h.aiohttp, "ClientSession", lambda *a, **k: _DummyClientSession(responses))
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession(responses)))
 
     state = SimpleNamespace(update_data=AsyncMock())
     msg = _fake_message(text="Question")
@@ -402,23 +532,40 @@ async def test_handle_ask_non_200_returns_error_message(monkeypatch):
     assert "Ошибка при обработке запроса" in msg.answer.await_args.args[0]
 
 
+@pytest.mark.asyncio
+async def test_handle_ask_response_without_answer_returns_error_message(monkeypatch):
+    session_obj = SimpleNamespace()
+    repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
+
+    _patch_db(monkeypatch, session_obj, repo)
+    monkeypatch.setattr(h, "settings", SimpleNamespace(api_base_url="http://api"))
+
+    responses = [_DummyResponse(status=200, json_data={"sources": []})]
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession(responses)))
+
+    state = SimpleNamespace(update_data=AsyncMock())
+    msg = _fake_message(text="Question without answer")
+
+    await h.handle_ask(msg, state)
+
+    msg.answer.assert_awaited_once()
+    assert "Ошибка при обработке запроса" in msg.answer.await_args.args[0]
+    assert await h.ask_cache.get("user", "Question without answer") is None
+
+
 @pytest.mark.asyncio
 async def test_handle_ask_exception_returns_connection_error(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="user")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
     monkeypatch.setattr(h, "settings", SimpleNamespace(api_base_url="http://api"))
 
     class _ExplodingClientSession:
-        async def __aenter__(self):
-            raise RuntimeError("network down")
-
-        async def __aexit__(self, exc_type, exc, tb):
-            return False
+        def post(self, url: str, **kwargs):
+            raise aiohttp.ClientError("network down")
 
-    monkeypatch.setattr(h.aiohttp, "ClientSession", lambda *a, **k: _ExplodingClientSession())
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_ExplodingClientSession()))
 
     state = SimpleNamespace(update_data=AsyncMock())
     msg = _fake_message(text="Question")
@@ -487,7 +634,7 @@ async def test_handle_source_callback_success_with_no_chunks(monkeypatch):
     state = SimpleNamespace(get_data=AsyncMock(return_value={"last_sources": [{"filename": "a.pdf", "page": 2}]}))
 
     responses = [_DummyResponse(status=200, json_data={"chunks": []})]
-    monkeypatch.setattr(h.aiohttp, "ClientSession", lambda *a, **k: _DummyClientSession(responses))
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession(responses)))
 
     await h.handle_source_callback(cb, state)
 
@@ -505,13 +652,32 @@ async def test_handle_source_callback_success_truncates_long_text(monkeypatch):
 
     long_text = "x" * 4000
     responses = [_DummyResponse(status=200, json_data={"chunks": [{"text": long_text}]})]
-    monkeypatch.setattr(h.aiohttp, "ClientSession", lambda *a, **k: _DummyClientSession(responses))
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession(responses)))
 
     await h.handle_source_callback(cb, state)
 
-    msg.answer.assert_awaited_once()
-    sent = msg.answer.await_args.args[0]
-    assert "текст сокращён" in sent
+    assert msg.answer.await_count == 2
+    header_call, content_call = msg.answer.await_args_list
+    assert "a.pdf" in header_call.args[0]
+    assert header_call.kwargs.get("parse_mode") == "Markdown"
+    assert "текст сокращён" in content_call.args[0]
+    assert content_call.kwargs.get("parse_mode") is None
+
+
+@pytest.mark.asyncio
+async def test_handle_source_callback_repeat_click_uses_cache(monkeypatch):
+    msg = _fake_message(text=None)
+    cb = SimpleNamespace(data="src:0", answer=AsyncMock(), message=msg)
+    state = SimpleNamespace(get_data=AsyncMock(return_value={"last_sources": [{"filename": "a.pdf", "page": 1}]}))
+
+    responses = [_DummyResponse(status=200, json_data={"chunks": [{"text": "Hello"}]})]
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession(responses)))
+
+    await h.handle_source_callback(cb, state)
+    await h.handle_source_callback(cb, state)
+
+    assert msg.answer.await_count == 4
+    assert msg.answer.await_args.args[0] == "Hello"
 
 
 @pytest.mark.asyncio
@@ -532,7 +698,7 @@ async def test_handle_read_source_success(monkeypatch):
     state = SimpleNamespace()
 
     responses = [_DummyResponse(status=200, json_data={"chunks": [{"text": "Hello"}]})]
-    monkeypatch.setattr(h.aiohttp, "ClientSession", lambda *a, **k: _DummyClientSession(responses))
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession(responses)))
 
     await h.handle_read_source(msg, state)
 
@@ -548,12 +714,11 @@ async def test_handle_upload_download_failure(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="admin")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
 
     doc = SimpleNamespace(file_name="doc.pdf", mime_type="application/pdf", file_size=1024)
     msg = _fake_message(text=None, document=doc)
-    msg.bot.download = AsyncMock(side_effect=RuntimeError("boom"))
+    msg.bot.download = AsyncMock(side_effect=aiohttp.ClientError("boom"))
 
     await h.handle_upload(msg)
 
@@ -566,18 +731,17 @@ async def test_handle_upload_success_document(monkeypatch):
     session_obj = SimpleNamespace()
     repo = SimpleNamespace(get_by_telegram_id=AsyncMock(return_value=SimpleNamespace(role="admin")))
 
-    monkeypatch.setattr(h, "get_session", _fake_get_session(session_obj))
-    monkeypatch.setattr(h, "UserRepository", lambda session: repo)
+    _patch_db(monkeypatch, session_obj, repo)
     monkeypatch.setattr(h, "settings", SimpleNamespace(api_base_url="http://api"))
 
     monkeypatch.setattr(h.aiohttp, "FormData", _DummyFormData)
-    monkeypatch.setattr(h.aiohttp, "ClientSession", lambda *a, **k: _DummyClientSession([
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession([
         _DummyResponse(status=200, json_data={"chunks_added": 3, "files_processed": 1, "errors": []})
-    ]))
+    ])))
 
     doc = SimpleNamespace(file_name="doc.pdf", mime_type="application/pdf", file_size=1024)
     msg = _fake_message(text=None, document=doc, user_id=9)
-    msg.bot.download = AsyncMock(return_value=b"data")
+    msg.bot.download = AsyncMock()
 
     await h.handle_upload(msg)
 
@@ -585,3 +749,66 @@ async def test_handle_upload_success_document(monkeypatch):
     final_text = msg.answer.await_args.args[0]
     assert "успешно" in final_text.lower()
     assert "чанков" in final_text.lower()
+
+    temp_path = msg.bot.download.await_args.kwargs["destination"]
+    assert not os.path.exists(temp_path)
+
+
+@pytest.mark.asyncio
+async def test_fetch_source_chunks_retries_server_errors(monkeypatch):
+    sleep = AsyncMock()
+    monkeypatch.setattr(h.asyncio, "sleep", sleep)
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession([
+        _DummyResponse(status=503, text_data="unavailable"),
+        _DummyResponse(status=200, json_data={"chunks": [{"text": "Hello"}]}),
+    ])))
+
+    chunks = await h._fetch_source_chunks("a.pdf", 1, limit=3)
+
+    assert chunks == [{"text": "Hello"}]
+    sleep.assert_awaited_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_upload_retries_only_gateway_errors(monkeypatch, tmp_path):
+    sleep = AsyncMock()
+    monkeypatch.setattr(h.asyncio, "sleep", sleep)
+    monkeypatch.setattr(h.aiohttp, "FormData", _DummyFormData)
+
+    temp_file = tmp_path / "upload"
+    temp_file.write_bytes(b"data")
+    job = h.UploadJob(message=_fake_message(user_id=9), temp_path=str(temp_file),
+                      filename="doc.pdf", file_type="document")
+
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession([
+        _DummyResponse(status=502, text_data="bad gateway"),
+        _DummyResponse(status=500, text_data="boom"),
+    ])))
+
+    status, data, error_text = await h._post_upload(job)
+
+    assert (status, data, error_text) == (500, None, "boom")
+    sleep.assert_awaited_once_with(1)
+
+
+
+@pytest.mark.asyncio
+async def test_upload_returns_last_gateway_error_after_all_attempts(monkeypatch, tmp_path):
+    sleep = AsyncMock()
+    monkeypatch.setattr(h.asyncio, "sleep", sleep)
+    monkeypatch.setattr(h.aiohttp, "FormData", _DummyFormData)
+
+    temp_file = tmp_path / "upload"
+    temp_file.write_bytes(b"data")
+    job = h.UploadJob(message=_fake_message(user_id=9), temp_path=str(temp_file),
+                      filename="doc.pdf", file_type="document")
+
+    monkeypatch.setattr(h, "get_http_session", _fake_http_session(_DummyClientSession([
+        _DummyResponse(status=502, text_data="bad gateway")
+        for _ in range(h._MAX_ATTEMPTS)
+    ])))
+
+    status, data, error_text = await h._post_upload(job)
+
+    assert (status, data, error_text) == (502, None, "bad gateway")
+    assert sleep.await_count == h._MAX_ATTEMPTS - 1
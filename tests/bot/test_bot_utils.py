@@ -5,10 +5,16 @@ import pytest
 from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup
 
 from bot.handlers.handlers import (
+    Source,
+    _READ_SOURCE_RE,
+    _dedup_sources,
+    _join_chunks,
     create_sources_keyboard,
     get_supported_formats_text,
     is_supported_file,
 )
+from bot.http import close_http_session, get_http_session
+from bot.upload_queue import UploadJob, UploadQueue
 from bot.keyboards import mode_keyboard
 from bot.middlewares.logging import LoggingMiddleware
 
@@ -25,6 +31,12 @@ def test_is_supported_file_by_extension_document():
     assert kind == "document"
 
 
+def test_is_supported_file_prefers_last_extension():
+    assert is_supported_file("report.pdf.zip", None) == (True, "archive")
+    assert is_supported_file("BACKUP.TAR.XZ", None) == (True, "archive")
+    assert is_supported_file("draft.docx", None) == (True, "document")
+
+
 def test_is_supported_file_by_mime_type_when_no_filename():
     ok, kind = is_supported_file(None, "application/pdf")
     assert ok is True
@@ -51,23 +63,64 @@ def test_create_sources_keyboard_none_on_empty():
     assert create_sources_keyboard([]) is None
 
 
-def test_create_sources_keyboard_dedup_and_limit():
+def test_dedup_sources_removes_duplicates_and_limits():
     sources = [
         {"filename": "a.pdf", "page": 1},
         {"filename": "a.pdf", "page": 1},
-        {"filename": "b.pdf", "page": 2},
+        {"filename": "b.pdf", "page": 2, "archive": "docs.zip"},
+        {"page": 3},
     ]
 
+    assert _dedup_sources(sources) == [
+        Source("a.pdf", 1),
+        Source("b.pdf", 2, "docs.zip"),
+        Source("?", 3),
+    ]
+
+    many = [{"filename": f"f{i}.pdf", "page": i} for i in range(20)]
+    assert len(_dedup_sources(many)) == 8
+
+
+def test_create_sources_keyboard_one_button_per_source():
+    sources = [Source("a.pdf", 1), Source("b.pdf", 2)]
+
     kb = create_sources_keyboard(sources)
     assert isinstance(kb, InlineKeyboardMarkup)
     assert len(kb.inline_keyboard) == 2
     assert kb.inline_keyboard[0][0].callback_data == "src:0"
-    assert kb.inline_keyboard[1][0].callback_data == "src:2"
+    assert kb.inline_keyboard[1][0].callback_data == "src:1"
 
-    many = [{"filename": f"f{i}.pdf", "page": i} for i in range(20)]
-    kb2 = create_sources_keyboard(many)
-    assert isinstance(kb2, InlineKeyboardMarkup)
-    assert len(kb2.inline_keyboard) == 8
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("doc.pdf (стр. 2)", ("doc.pdf", "2")),
+        ("Источник 1: a.DOCX, стр 15", ("a.DOCX", "15")),
+        ("notes.md", ("notes.md", None)),
+    ],
+)
+def test_read_source_pattern(text, expected):
+    m = _READ_SOURCE_RE.search(text)
+    assert m is not None
+    assert m.groups() == expected
+
+
+def test_read_source_pattern_no_match():
+    assert _READ_SOURCE_RE.search("nonsense") is None
+
+
+def test_join_chunks_short_text_is_not_truncated():
+    chunks = [{"text": "a"}, {"text": "b"}, {}]
+    assert _join_chunks(chunks, "...") == "a\n\n---\n\nb\n\n---\n\n"
+
+
+def test_join_chunks_truncates_and_stops_early():
+    class _Chunk(dict):
+        def get(self, key, default=None):
+            raise AssertionError("chunk after the limit must not be read")
+
+    chunks = [{"text": "x" * 6}, {"text": "y" * 6}, _Chunk()]
+    assert _join_chunks(chunks, "...", limit=10) == "xxxxxx\n\n--..."
 
 
 def test_mode_keyboard_layout_and_texts():
@@ -95,3 +148,57 @@ async def test_logging_middleware_passes_through(caplog):
     assert result["event"] is event
     assert result["data"] == data
     assert any("Received event" in r.message for r in caplog.records)
+
+
+@pytest.mark.asyncio
+async def test_logging_middleware_skips_formatting_when_info_disabled(caplog):
+    mw = LoggingMiddleware()
+
+    class _Event:
+        def __str__(self):
+            raise AssertionError("event must not be formatted")
+
+    async def handler(event, data):
+        return "ok"
+
+    with caplog.at_level("WARNING"):
+        assert await mw(handler, _Event(), {}) == "ok"
+
+    assert not caplog.records
+
+
+@pytest.mark.asyncio
+async def test_http_session_is_shared_and_recreated_after_close():
+    first = await get_http_session()
+    second = await get_http_session()
+    assert first is second
+
+    await close_http_session()
+    assert first.closed
+
+    third = await get_http_session()
+    assert third is not first
+    await close_http_session()
+
+
+@pytest.mark.asyncio
+async def test_upload_queue_processes_jobs_in_background():
+    processed = []
+
+    async def process(job):
+        processed.append(job.filename)
+
+    queue = UploadQueue(process, workers=1, maxsize=2)
+
+    # Без воркеров задание обрабатывается сразу
+    assert await queue.submit(UploadJob(None, "/tmp/x", "a.pdf", "document")) == 0
+    assert processed == ["a.pdf"]
+
+    await queue.start()
+    assert queue.running
+    await queue.submit(UploadJob(None, "/tmp/y", "b.pdf", "document"))
+    await queue._queue.join()
+    assert processed == ["a.pdf", "b.pdf"]
+
+    await queue.stop()
+    assert not queue.running
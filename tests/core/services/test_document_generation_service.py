@@ -4,7 +4,8 @@ from datetime import datetime
 
 from src.core.services.DocumentGenerationService import (
     DocumentGenerationService,
-    GeneratedDocument
+    GeneratedDocument,
+    _get_stylesheet,
 )
 from src.infra.llm.yandex_gpt import YandexGPTResponse, YandexGPTMessage
 
@@ -46,7 +47,7 @@ class TestDocumentGenerationService:
     @pytest.fixture
     def service(self, mock_agent):
         """Create DocumentGenerationService with mocked agent."""
-        return DocumentGenerationService(agent=mock_agent)
+        return DocumentGenerationService(agent=mock_agent, pdf_workers=0)
 
     def test_init_with_agent(self, mock_agent):
         """Test initialization with agent."""
@@ -58,6 +59,15 @@ class TestDocumentGenerationService:
         service = DocumentGenerationService()
         assert service.agent is None
 
+    @pytest.mark.asyncio
+    async def test_close_shuts_down_pdf_pool(self, mock_agent):
+        """Test close() stops the PDF worker pool."""
+        service = DocumentGenerationService(agent=mock_agent, pdf_workers=1)
+        assert service._pdf_pool is not None
+
+        await service.close()
+        assert service._pdf_pool is None
+
     def test_detect_document_type_found(self, service):
         """Test document type detection when type is found."""
         request = "I need a договор for services"
@@ -107,6 +117,15 @@ class TestDocumentGenerationService:
         assert "<strong>bold</strong>" in html
         assert "FOR REFERENCE ONLY" in html
 
+    def test_markdown_to_html_reuses_converter(self, service):
+        """Test the converter state is reset between documents."""
+        first = service._markdown_to_html("# First\n\n| a |\n|---|\n| 1 |")
+        second = service._markdown_to_html("# Second")
+
+        assert "<table>" in first
+        assert '<h1 id="second">Second</h1>' in second
+        assert "First" not in second
+
     @patch('src.core.services.DocumentGenerationService.HTML')
     @patch('src.core.services.DocumentGenerationService.CSS')
     def test_html_to_pdf(self, mock_css, mock_html, service):
@@ -122,6 +141,20 @@ class TestDocumentGenerationService:
         mock_html.assert_called_once_with(string=html)
         mock_pdf_doc.write_pdf.assert_called_once()
 
+    @patch('src.core.services.DocumentGenerationService.HTML')
+    @patch('src.core.services.DocumentGenerationService.CSS')
+    def test_html_to_pdf_parses_css_once(self, mock_css, mock_html, service):
+        """Test the stylesheet is parsed once and reused."""
+        _get_stylesheet.cache_clear()
+        mock_html.return_value.write_pdf.return_value = b"pdf bytes"
+
+        service._html_to_pdf("<html>1</html>")
+        service._html_to_pdf("<html>2</html>")
+
+        mock_css.assert_called_once()
+        assert mock_html.call_count == 2
+        _get_stylesheet.cache_clear()
+
     @pytest.mark.asyncio
     async def test_generate_without_agent(self):
         """Test generate raises error when agent is not initialized."""
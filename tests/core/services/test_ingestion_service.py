@@ -1,11 +1,23 @@
+import asyncio
+import hashlib
+import io
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from pathlib import Path
 import tempfile
-import os
 
-from src.core.services.IngestionService import IngestionService, IngestionResult
-from src.infra.llm.document_loader import ArchiveProcessingStats
+from src.infra.llm.agent import LegalRAGAgent
+from src.infra.llm.config import RAGConfig
+from src.infra.llm.semantic_cache import SemanticCache
+from src.core.services.IngestionService import (
+    ARCHIVE_DOCUMENTS_BATCH,
+    IngestionResult,
+    IngestionService,
+    _copy_to_file,
+    _init_parse_worker,
+    _load_and_split_in_worker,
+)
+from src.core.services import IngestionService as ingestion_module
 
 
 class TestIngestionResult:
@@ -35,6 +47,49 @@ class TestIngestionResult:
         assert result.errors == ["Error 1", "Error 2"]
 
 
+@pytest.mark.parametrize("max_size", [1, 10 ** 6])
+def test_copy_to_file_from_spooled_file(tmp_path, max_size):
+    """Both on-disk and in-memory spooled uploads are copied intact."""
+    with tempfile.SpooledTemporaryFile(max_size=max_size) as src:
+        src.write(b"x" * 100_000)
+        dest = tmp_path / "out"
+
+        _copy_to_file(src, str(dest))
+
+        assert dest.read_bytes() == b"x" * 100_000
+        assert src._rolled is (max_size == 1)
+
+
+def test_parse_worker_reuses_loader_and_splitter(monkeypatch):
+    """The pool worker keeps one loader and splitter for all tasks."""
+    monkeypatch.setattr(ingestion_module, "_worker_loader", None)
+    monkeypatch.setattr(ingestion_module, "_worker_splitter", None)
+    loader = MagicMock()
+    loader.load_file.side_effect = lambda path: [path]
+    splitter = MagicMock()
+    splitter.split_documents.side_effect = lambda docs: docs * 2
+
+    _init_parse_worker(loader, splitter)
+    first = _load_and_split_in_worker(Path("a.pdf"))
+    second = _load_and_split_in_worker(Path("b.pdf"))
+
+    assert first == [Path("a.pdf")] * 2
+    assert second == [Path("b.pdf")] * 2
+    assert splitter.split_documents.call_count == 2
+
+
+def test_copy_to_file_updates_hasher_per_block(tmp_path):
+    """The upload hash is computed from the copied blocks, without a second read."""
+    data = b"y" * (3 * 1024 * 1024 + 17)
+    dest = tmp_path / "out"
+    hasher = hashlib.blake2b(digest_size=32)
+
+    _copy_to_file(io.BytesIO(data), str(dest), hasher)
+
+    assert dest.read_bytes() == data
+    assert hasher.hexdigest() == hashlib.blake2b(data, digest_size=32).hexdigest()
+
+
 class DummyAsyncFile:
     """Helper async context manager mimicking aiofiles open."""
 
@@ -48,6 +103,40 @@ class DummyAsyncFile:
         return False
 
 
+class FakeSessionFactory:
+    """Helper session factory yielding a dummy session."""
+
+    def __init__(self):
+        self.session = MagicMock()
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self.session
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class FakeUnitOfWork:
+    """Helper unit of work exposing the given document repository."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.session_factories = []
+
+    def __call__(self, session_factory):
+        self.session_factories.append(session_factory)
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
 class TestIngestionService:
     @pytest.fixture
     def mock_agent(self):
@@ -56,13 +145,14 @@ class TestIngestionService:
         agent.document_loader = MagicMock()
         agent.text_splitter = MagicMock()
         agent.vector_store = MagicMock()
-        agent.vector_store.add_documents = AsyncMock()
+        agent.index_chunks = AsyncMock(side_effect=lambda chunks: len(chunks))
+        agent.vector_store.has_upload = AsyncMock(return_value=True)
         return agent
 
     @pytest.fixture
-    def service(self, mock_agent):
+    def service(self, mock_agent, tmp_path):
         """Create IngestionService with mocked agent."""
-        return IngestionService(agent=mock_agent)
+        return IngestionService(agent=mock_agent, parse_workers=0, scratch_root=str(tmp_path))
 
     @pytest.fixture
     def mock_upload_file(self):
@@ -82,6 +172,56 @@ class TestIngestionService:
         service = IngestionService()
         assert service.agent is None
 
+    @pytest.mark.asyncio
+    async def test_close_shuts_down_parse_pool(self, mock_agent, tmp_path):
+        """Test close stops the parse process pool and removes the scratch dir."""
+        service = IngestionService(agent=mock_agent, parse_workers=1, scratch_root=str(tmp_path))
+        assert service._parse_pool is None
+        pool = service._get_parse_pool()
+        assert service._get_parse_pool() is pool
+
+        await service.close()
+
+        assert service._parse_pool is None
+        assert not service._scratch_dir.exists()
+        with pytest.raises(RuntimeError):
+            pool.submit(len, [])
+
+    @pytest.mark.asyncio
+    async def test_process_file_reuses_scratch_slots(self, service, mock_upload_file):
+        """Test uploads are saved into long-lived slot dirs that are not recreated."""
+        service.agent.document_loader.load_file.return_value = []
+        slots_before = sorted(service._scratch_dir.iterdir())
+
+        with patch('tempfile.mkdtemp', side_effect=AssertionError("no per-upload dirs")), \
+            patch('os.path.getsize', return_value=1024):
+            for _ in range(2):
+                mock_upload_file.read = AsyncMock(side_effect=[b"test content", b""])
+                await service.processFile(mock_upload_file)
+
+        assert sorted(service._scratch_dir.iterdir()) == slots_before
+        assert not any(service._scratch_dir.rglob("*.pdf"))
+
+    @pytest.mark.asyncio
+    async def test_process_file_limits_concurrency(self, mock_agent):
+        """Test only max_concurrent_ingestions files are processed at once."""
+        service = IngestionService(agent=mock_agent, max_concurrent_ingestions=1)
+        running = 0
+        max_running = 0
+
+        async def fake_process(file, filename, file_type):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0)
+            running -= 1
+
+        uploads = [MagicMock(filename=f"doc{i}.pdf") for i in range(3)]
+        with patch.object(service, "_save_and_process", side_effect=fake_process):
+            await asyncio.gather(*(service.processFile(u) for u in uploads))
+
+        assert max_running == 1
+
     def test_get_file_type_document(self, service):
         """Test file type detection for documents."""
         assert service._get_file_type("document.pdf") == "document"
@@ -116,16 +256,8 @@ class TestIngestionService:
             await service.processFile(mock_upload_file)
 
     @pytest.mark.asyncio
-    @patch('tempfile.mkdtemp')
-    @patch('os.path.exists')
-    @patch('os.remove')
-    @patch('os.rmdir')
-    async def test_process_file_document(self, mock_rmdir, mock_remove, mock_exists,
-                                       mock_mkdtemp, service, mock_agent, mock_upload_file):
+    async def test_process_file_document(self, service, mock_agent, mock_upload_file):
         """Test processing a document file."""
-        mock_mkdtemp.return_value = "/tmp/test"
-        mock_exists.return_value = True
-
         mock_documents = [MagicMock()]
         service.agent.document_loader.load_file.return_value = mock_documents
 
@@ -150,31 +282,64 @@ class TestIngestionService:
 
         service.agent.document_loader.load_file.assert_called_once()
         service.agent.text_splitter.split_documents.assert_called_once_with(mock_documents)
-        service.agent.vector_store.add_documents.assert_called_once_with(mock_chunks)
+        service.agent.index_chunks.assert_awaited_once_with(mock_chunks)
 
     @pytest.mark.asyncio
-    @patch('tempfile.mkdtemp')
-    @patch('os.path.exists')
-    @patch('os.remove')
-    @patch('os.rmdir')
-    async def test_process_file_archive(self, mock_rmdir, mock_remove, mock_exists,
-                                      mock_mkdtemp, service, mock_agent):
-        """Test processing an archive file."""
-        mock_mkdtemp.return_value = "/tmp/test"
-        mock_exists.return_value = True
+    async def test_process_file_strips_directories_from_filename(self, service, mock_upload_file):
+        """Test uploaded file is saved inside the scratch dir regardless of its name."""
+        mock_upload_file.filename = "../../etc/test.pdf"
+        mock_upload_file.read.side_effect = [b"test content", b""]
+        service.agent.document_loader.load_file.return_value = []
+
+        with patch('aiofiles.open', return_value=DummyAsyncFile()) as mock_open, \
+            patch('os.path.getsize', return_value=1024):
+
+            await service.processFile(mock_upload_file)
+
+        saved_path = Path(mock_open.call_args.args[0])
+        assert saved_path.name == "test.pdf"
+        assert saved_path.parent.parent == service._scratch_dir
+
+    @pytest.mark.asyncio
+    async def test_process_file_copies_real_file_in_thread(self, service, tmp_path):
+        """Test a real spooled upload is copied to disk without the async read loop."""
+        upload = MagicMock()
+        upload.filename = "test.pdf"
+        upload.file = io.BytesIO(b"pdf content")
+        upload.read = AsyncMock(side_effect=AssertionError("read loop must not be used"))
+
+        saved = {}
+
+        def load_file(path):
+            saved["content"] = Path(path).read_bytes()
+            return []
 
+        service.agent.document_loader.load_file.side_effect = load_file
+
+        result = await service.processFile(upload)
+
+        assert saved["content"] == b"pdf content"
+        assert result.chunks_count == 0
+        assert not any(service._scratch_dir.rglob("*.pdf"))
+
+    @pytest.mark.asyncio
+    async def test_process_file_archive(self, service, mock_agent):
+        """Test processing an archive file."""
         mock_upload_file = MagicMock()
         mock_upload_file.filename = "test.zip"
         mock_upload_file.read = AsyncMock(side_effect=[b"archive content", b""])
 
         mock_documents = [MagicMock(), MagicMock()]
-        mock_stats = ArchiveProcessingStats()
-        mock_stats.files_processed = 2
-        mock_stats.processed_files = [
-            MagicMock(filename="doc1.pdf", chunks_count=5, archive_path="test.zip"),
-            MagicMock(filename="doc2.pdf", chunks_count=3, archive_path="test.zip")
-        ]
-        service.agent.document_loader.load_archive.return_value = (mock_documents, mock_stats)
+
+        def fake_iter_archive(_path, stats):
+            stats.files_processed = 2
+            stats.processed_files = [
+                MagicMock(filename="doc1.pdf", chunks_count=5, archive_path="test.zip"),
+                MagicMock(filename="doc2.pdf", chunks_count=3, archive_path="test.zip")
+            ]
+            yield from mock_documents
+
+        service.agent.document_loader.iter_archive.side_effect = fake_iter_archive
 
         mock_chunks = [MagicMock()] * 8
         service.agent.text_splitter.split_documents.return_value = mock_chunks
@@ -193,9 +358,9 @@ class TestIngestionService:
         assert result.file_type == "archive"
         assert len(result.processed_files) == 2
 
-        service.agent.document_loader.load_archive.assert_called_once()
+        service.agent.document_loader.iter_archive.assert_called_once()
         service.agent.text_splitter.split_documents.assert_called_once_with(mock_documents)
-        assert service.agent.vector_store.add_documents.call_count == 1
+        service.agent.index_chunks.assert_awaited_once_with(mock_chunks)
 
     @pytest.mark.asyncio
     async def test_process_document_no_documents(self, service, mock_agent):
@@ -208,20 +373,205 @@ class TestIngestionService:
         assert result.chunks_count == 0
         assert result.files_processed == 1
         assert result.file_type == "document"
-        service.agent.vector_store.add_documents.assert_not_called()
+        service.agent.index_chunks.assert_awaited_once_with([])
 
     @pytest.mark.asyncio
     async def test_process_archive_with_errors(self, service, mock_agent):
         """Test processing archive with errors."""
-        mock_stats = ArchiveProcessingStats()
-        mock_stats.files_processed = 1
-        mock_stats.processed_files = [MagicMock(filename="doc.pdf", chunks_count=5)]
-        mock_stats.errors = ["Error 1", "Error 2", "Error 3"]
+        def fake_iter_archive(_path, stats):
+            stats.files_processed = 1
+            stats.processed_files = [MagicMock(filename="doc.pdf", chunks_count=5)]
+            stats.errors = ["Error 1", "Error 2", "Error 3"]
+            yield from ()
 
-        service.agent.document_loader.load_archive.return_value = ([], mock_stats)
+        service.agent.document_loader.iter_archive.side_effect = fake_iter_archive
         service.agent.text_splitter.split_documents.return_value = []
 
         result = await service._process_archive(Path("test.zip"))
 
         assert result.errors == ["Error 1", "Error 2", "Error 3"]
-        assert len(result.errors) == 3
\ No newline at end of file
+        assert len(result.errors) == 3
+
+    @pytest.mark.asyncio
+    async def test_process_archive_streams_documents_in_batches(self, service, mock_agent):
+        """Archive documents are split and indexed batch by batch."""
+        documents = [MagicMock() for _ in range(ARCHIVE_DOCUMENTS_BATCH * 2 + 1)]
+        closed = []
+
+        def fake_iter_archive(_path, _stats):
+            try:
+                yield from documents
+            finally:
+                closed.append(True)
+
+        service.agent.document_loader.iter_archive.side_effect = fake_iter_archive
+        service.agent.text_splitter.split_documents.side_effect = lambda batch: list(batch)
+
+        result = await service._process_archive(Path("test.zip"))
+
+        batch_sizes = [
+            len(call.args[0]) for call in service.agent.text_splitter.split_documents.call_args_list
+        ]
+        assert batch_sizes == [ARCHIVE_DOCUMENTS_BATCH, ARCHIVE_DOCUMENTS_BATCH, 1]
+        assert result.chunks_count == len(documents)
+        assert closed == [True]
+        assert service.agent.index_chunks.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_process_archive_split_error_closes_iterator(self, service, mock_agent):
+        """A splitter failure is raised and the archive iterator is still closed."""
+        closed = []
+
+        def fake_iter_archive(_path, _stats):
+            try:
+                yield from [MagicMock() for _ in range(ARCHIVE_DOCUMENTS_BATCH + 1)]
+            finally:
+                closed.append(True)
+
+        service.agent.document_loader.iter_archive.side_effect = fake_iter_archive
+        service.agent.text_splitter.split_documents.side_effect = [
+            [MagicMock()],
+            RuntimeError("split failed"),
+        ]
+
+        with pytest.raises(RuntimeError, match="split failed"):
+            await service._process_archive(Path("test.zip"))
+
+        assert service.agent.index_chunks.await_count == 1
+        assert closed == [True]
+
+    @pytest.mark.asyncio
+    async def test_process_file_skips_already_indexed_upload(self, mock_agent, tmp_path):
+        """Test a re-upload with a known hash is not parsed or embedded again."""
+        service = IngestionService(
+            agent=mock_agent, parse_workers=0, scratch_root=str(tmp_path),
+            session_factory=FakeSessionFactory(),
+        )
+        upload = MagicMock()
+        upload.filename = "test.pdf"
+        upload.file = io.BytesIO(b"pdf content")
+
+        with patch('src.core.services.IngestionService.DocumentRepository') as repo_cls:
+            repo_cls.return_value.get_by_hash = AsyncMock(
+                return_value=MagicMock(status="indexed", chunks_count=7)
+            )
+            result = await service.processFile(upload)
+
+        assert result.duplicate is True
+        assert result.chunks_count == 7
+        repo_cls.return_value.get_by_hash.assert_awaited_once_with(
+            hashlib.blake2b(b"pdf content", digest_size=32).hexdigest()
+        )
+        mock_agent.document_loader.load_file.assert_not_called()
+        mock_agent.index_chunks.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_process_file_records_indexed_upload(self, mock_agent, tmp_path):
+        """Test a new upload is indexed and recorded by its hash."""
+        service = IngestionService(
+            agent=mock_agent, parse_workers=0, scratch_root=str(tmp_path),
+            session_factory=FakeSessionFactory(),
+        )
+        upload = MagicMock()
+        upload.filename = "test.pdf"
+        upload.file = io.BytesIO(b"pdf content")
+        mock_agent.document_loader.load_file.return_value = [MagicMock()]
+        mock_agent.text_splitter.split_documents.return_value = [MagicMock(), MagicMock()]
+
+        with patch('src.core.services.IngestionService.DocumentRepository') as repo_cls:
+            repo_cls.return_value.get_by_hash = AsyncMock(return_value=None)
+            repo_cls.return_value.create = AsyncMock()
+            uow = FakeUnitOfWork(repo_cls.return_value)
+            with patch('src.core.services.IngestionService.UnitOfWork', uow):
+                result = await service.processFile(upload)
+
+        assert result.duplicate is False
+        repo_cls.return_value.create.assert_awaited_once_with(
+            filename="test.pdf",
+            file_path="test.pdf",
+            file_hash=hashlib.blake2b(b"pdf content", digest_size=32).hexdigest(),
+            status="indexed",
+            chunks_count=2,
+        )
+        # Запись делается в одной транзакции через фабрику сессий сервиса
+        assert uow.session_factories == [service._session_factory]
+
+
+@pytest.mark.asyncio
+async def test_upload_invalidates_agent_caches(tmp_path):
+    """After an upload is indexed, cached answers and stats are not served."""
+    agent = LegalRAGAgent.__new__(LegalRAGAgent)
+    agent.config = RAGConfig()
+    agent._response_cache = SemanticCache()
+    agent._response_cache.set([1.0, 0.0], "старый ответ")
+    agent._stats_cache = (float("inf"), {"total_documents": 0})
+    agent._vector_store = MagicMock()
+    agent._vector_store.add_documents = AsyncMock()
+    agent._vector_store.flush = AsyncMock()
+    agent.document_loader = MagicMock()
+    agent.document_loader.load_file.return_value = [MagicMock()]
+    agent.text_splitter = MagicMock()
+    agent.text_splitter.split_documents.return_value = [MagicMock(), MagicMock()]
+    service = IngestionService(agent=agent, parse_workers=0, scratch_root=str(tmp_path))
+
+    upload = MagicMock()
+    upload.filename = "test.pdf"
+    upload.file = io.BytesIO(b"pdf content")
+    result = await service.processFile(upload)
+
+    assert result.chunks_count == 2
+    assert agent._response_cache.lookup([1.0, 0.0]) is None
+    assert agent._stats_cache is None
+
+
+@pytest.mark.asyncio
+async def test_reupload_after_collection_clear_is_indexed_again(tmp_path):
+    """A DB record alone does not make a re-upload a duplicate once vectors are gone."""
+    collection: set[str] = set()
+    rows: dict[str, MagicMock] = {}
+
+    agent = MagicMock()
+    agent.document_loader.load_file.return_value = [MagicMock()]
+    agent.text_splitter.split_documents.side_effect = lambda docs: [MagicMock(metadata={})]
+
+    async def index_chunks(chunks):
+        collection.update(chunk.metadata["upload_hash"] for chunk in chunks)
+        return len(chunks)
+
+    agent.index_chunks = AsyncMock(side_effect=index_chunks)
+    agent.vector_store.has_upload = AsyncMock(side_effect=lambda file_hash: file_hash in collection)
+
+    repo = MagicMock()
+    repo.get_by_hash = AsyncMock(side_effect=lambda file_hash: rows.get(file_hash))
+
+    async def create(**fields):
+        rows[fields["file_hash"]] = MagicMock(id=1, **fields)
+
+    repo.create = AsyncMock(side_effect=create)
+    repo.mark_indexed = AsyncMock()
+
+    service = IngestionService(
+        agent=agent, parse_workers=0, scratch_root=str(tmp_path),
+        session_factory=FakeSessionFactory(),
+    )
+
+    def upload():
+        file = MagicMock()
+        file.filename = "test.pdf"
+        file.file = io.BytesIO(b"pdf content")
+        return file
+
+    with patch('src.core.services.IngestionService.DocumentRepository', return_value=repo), \
+            patch('src.core.services.IngestionService.UnitOfWork', FakeUnitOfWork(repo)):
+        first = await service.processFile(upload())
+        assert (await service.processFile(upload())).duplicate is True
+
+        collection.clear()
+        again = await service.processFile(upload())
+
+    assert first.duplicate is False
+    assert again.duplicate is False
+    assert again.chunks_count == 1
+    assert agent.index_chunks.await_count == 2
+    repo.create.assert_awaited_once()
+    repo.mark_indexed.assert_awaited_once_with(1, 1)
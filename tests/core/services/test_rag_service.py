@@ -91,6 +91,34 @@ class TestRAGService:
         assert result == 1
         mock_agent.add_document.assert_called_once_with(path)
 
+    @pytest.mark.asyncio
+    async def test_add_document_stream(self, rag_service_with_mock, mock_agent):
+        """Test add_document_stream yields per-batch counts from the agent."""
+        async def fake_stream(_path):
+            for count in (50, 50, 7):
+                yield count
+
+        mock_agent.add_document_stream = MagicMock(side_effect=fake_stream)
+
+        counts = [n async for n in rag_service_with_mock.add_document_stream("doc.pdf")]
+
+        assert counts == [50, 50, 7]
+        mock_agent.add_document_stream.assert_called_once_with("doc.pdf")
+
+    @pytest.mark.asyncio
+    async def test_index_all_stream(self, rag_service_with_mock, mock_agent):
+        """Test index_all_stream forwards the force flag and yields counts."""
+        async def fake_stream(force_reindex):
+            yield 50
+            yield 3
+
+        mock_agent.index_documents_stream = MagicMock(side_effect=fake_stream)
+
+        counts = [n async for n in rag_service_with_mock.index_all_stream(force=True)]
+
+        assert counts == [50, 3]
+        mock_agent.index_documents_stream.assert_called_once_with(force_reindex=True)
+
     @pytest.mark.asyncio
     async def test_index_all(self, rag_service_with_mock, mock_agent):
         """Test index_all method."""
@@ -0,0 +1,17 @@
+from unittest.mock import patch
+
+from src.core.services import workers
+
+
+def test_available_cpus_respects_affinity():
+    with patch.object(workers.os, "sched_getaffinity", return_value={0, 1}, create=True), \
+            patch.object(workers.os, "cpu_count", return_value=64):
+        assert workers.available_cpus() == 2
+
+
+def test_default_workers_is_capped():
+    with patch.object(workers, "available_cpus", return_value=32):
+        assert workers.default_workers() == 4
+        assert workers.default_workers(limit=16) == 16
+    with patch.object(workers, "available_cpus", return_value=1):
+        assert workers.default_workers() == 1
@@ -50,7 +50,7 @@ class TestChatHistoryRepository:
         assert result.used_sources == {"sources": ["doc1.pdf"]}
         mock_session.add.assert_called_once()
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once_with(result)
+        mock_session.refresh.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_create_chat_history_minimal(self, repository, mock_session):
@@ -160,6 +160,7 @@ class TestChatHistoryRepository:
         result = await repository.count_by_user(1)
 
         assert result == 42
+        assert "count(*)" in str(mock_session.execute.call_args[0][0])
 
     @pytest.mark.asyncio
     async def test_count_by_user_zero(self, repository, mock_session):
@@ -183,6 +184,8 @@ class TestChatHistoryRepository:
 
         assert result == 5
         mock_session.commit.assert_called_once()
+        stmt = mock_session.execute.call_args[0][0]
+        assert stmt.get_execution_options()["synchronize_session"] is False
 
     @pytest.mark.asyncio
     async def test_delete_by_user_no_entries(self, repository, mock_session):
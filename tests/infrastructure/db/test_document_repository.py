@@ -54,7 +54,7 @@ class TestDocumentRepository:
         assert result.status == "processing"
         mock_session.add.assert_called_once()
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once_with(result)
+        mock_session.refresh.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_create_document_defaults(self, repository, mock_session):
@@ -180,7 +180,7 @@ class TestDocumentRepository:
         assert result == sample_document
         assert result.status == "completed"
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once_with(result)
+        mock_session.refresh.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_update_status_document_not_exists(self, repository, mock_session):
@@ -195,6 +195,19 @@ class TestDocumentRepository:
         mock_session.commit.assert_not_called()
         mock_session.refresh.assert_not_called()
 
+    @pytest.mark.asyncio
+    async def test_mark_indexed_updates_status_and_chunks(self, repository, mock_session, sample_document):
+        """Test a stale document row is marked indexed again with the new chunk count."""
+        mock_result = MagicMock()
+        mock_result.scalar_one_or_none.return_value = sample_document
+        mock_session.execute.return_value = mock_result
+
+        result = await repository.mark_indexed(1, 12)
+
+        assert result.status == "indexed"
+        assert result.chunks_count == 12
+        mock_session.commit.assert_called_once()
+
     @pytest.mark.asyncio
     async def test_delete_document_exists(self, repository, mock_session, sample_document):
         """Test deleting document when document exists."""
@@ -0,0 +1,47 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.infra.db.schema import SCHEMA_UPGRADES, upgrade_schema
+
+
+@pytest.mark.asyncio
+async def test_upgrade_schema_runs_every_step_in_order():
+    """All schema upgrade steps are executed on the given connection."""
+    conn = MagicMock()
+    conn.execute = AsyncMock()
+
+    await upgrade_schema(conn)
+
+    executed = [str(call.args[0]) for call in conn.execute.await_args_list]
+    assert executed == list(SCHEMA_UPGRADES)
+
+
+def test_created_at_columns_get_server_defaults():
+    """Existing tables receive the DB-side defaults that inserts now rely on."""
+    for table, column in (
+        ("users", "created_at"),
+        ("documents", "uploaded_at"),
+        ("chat_history", "created_at"),
+    ):
+        assert any(
+            f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT" in step
+            for step in SCHEMA_UPGRADES
+        )
+
+
+def test_chat_history_index_is_replaced_by_composite():
+    """Old single-column index is dropped before the composite one is created."""
+    drop = SCHEMA_UPGRADES.index("DROP INDEX IF EXISTS ix_chat_history_user_id")
+    create = next(
+        i for i, step in enumerate(SCHEMA_UPGRADES)
+        if "ix_chat_history_user_created" in step
+    )
+    assert drop < create
+    assert "(user_id, created_at DESC)" in SCHEMA_UPGRADES[create]
+
+
+def test_upgrade_steps_are_idempotent():
+    """Steps that add objects must be safe to run on every startup."""
+    for step in SCHEMA_UPGRADES:
+        if " ADD " in step or step.startswith(("CREATE", "DROP")):
+            assert "IF NOT EXISTS" in step or "IF EXISTS" in step
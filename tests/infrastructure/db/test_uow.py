@@ -0,0 +1,43 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.infra.db.uow import UnitOfWork
+
+
+@pytest.fixture
+def mock_session():
+    """Create a mock AsyncSession."""
+    session = MagicMock()
+    session.execute = AsyncMock()
+    session.commit = AsyncMock()
+    session.rollback = AsyncMock()
+    session.flush = AsyncMock()
+    session.close = AsyncMock()
+    session.add = MagicMock()
+    return session
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_commits_once(mock_session):
+    """Repository writes inside a UnitOfWork are flushed and committed once."""
+    async with UnitOfWork(lambda: mock_session) as uow:
+        await uow.documents.create(filename="a.pdf", file_path="a.pdf", file_hash="h1")
+        await uow.chat_history.create(user_id=1, query="q", answer="a")
+
+    assert mock_session.flush.await_count == 2
+    mock_session.commit.assert_awaited_once()
+    mock_session.rollback.assert_not_awaited()
+    mock_session.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_rolls_back_on_error(mock_session):
+    """An exception inside a UnitOfWork rolls the transaction back."""
+    with pytest.raises(RuntimeError):
+        async with UnitOfWork(lambda: mock_session) as uow:
+            await uow.documents.create(filename="a.pdf", file_path="a.pdf", file_hash="h1")
+            raise RuntimeError("boom")
+
+    mock_session.commit.assert_not_awaited()
+    mock_session.rollback.assert_awaited_once()
+    mock_session.close.assert_awaited_once()
@@ -96,7 +96,7 @@ class TestUserRepository:
         assert result.username == "newuser"
         mock_session.add.assert_called_once()
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once_with(result)
+        mock_session.refresh.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_upsert_existing_user_update_role_only(self, repository, mock_session, sample_user):
@@ -112,7 +112,7 @@ class TestUserRepository:
         assert result.username == "testuser"
         mock_session.add.assert_not_called()
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once_with(result)
+        mock_session.refresh.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_upsert_existing_user_update_username(self, repository, mock_session, sample_user):
@@ -127,7 +127,7 @@ class TestUserRepository:
         assert result.role == "user"
         assert result.username == "updateduser"
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once_with(result)
+        mock_session.refresh.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_delete_by_telegram_id_user_exists(self, repository, mock_session, sample_user):
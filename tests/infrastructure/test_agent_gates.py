@@ -0,0 +1,113 @@
+import pytest
+
+from src.infra.llm.agent import LegalRAGAgent
+
+
+@pytest.fixture
+def agent():
+    # Проверки вопросов не используют клиентов, поэтому __init__ не нужен
+    return LegalRAGAgent.__new__(LegalRAGAgent)
+
+
+@pytest.mark.parametrize("question", [
+    "Привет!",
+    "Добрый  вечер",
+    "что ты умеешь",
+    "Спасибо большое",
+    "пока",
+    "help",
+])
+def test_conversational_phrases(agent, question):
+    assert agent._is_conversational(question)
+
+
+@pytest.mark.parametrize("question", [
+    "пока не выплатили зарплату, что делать?",
+    "Какой срок исковой давности по договору займа?",
+    "штраф",
+])
+def test_not_conversational(agent, question):
+    assert not agent._is_conversational(question)
+
+
+@pytest.mark.parametrize("question", [
+    "Что грозит за неуплату НДФЛ?",
+    "Как оформить договор аренды",
+    "статья 81 ТК РФ",
+])
+def test_legal_questions(agent, question):
+    assert agent._is_legal_question(question)
+
+
+def test_non_legal_question(agent):
+    assert not agent._is_legal_question("какая сегодня погода")
+
+
+def test_short_question_with_legal_term_is_not_conversational(agent):
+    assert not agent._is_conversational("развод")
+    assert agent._is_conversational("отлично")
+
+
+def test_format_context(agent):
+    from langchain_core.documents import Document
+
+    docs = [
+        Document(page_content="Текст 1", metadata={"filename": "a.pdf", "page": 2}),
+        Document(page_content="Текст 2", metadata={}),
+    ]
+
+    assert agent._format_context(docs) == (
+        "[Источник 1: a.pdf, стр. 2]\nТекст 1\n\n---\n\n[Источник 2: ?, стр. ?]\nТекст 2"
+    )
+
+
+def test_no_info_phrase_is_case_insensitive():
+    from src.infra.llm.agent import _NO_INFO_RE
+
+    assert _NO_INFO_RE.search("К сожалению, Информация Отсутствует в документах.")
+    assert not _NO_INFO_RE.search("Согласно статье 81 ТК РФ работодатель вправе...")
+
+
+def test_extract_sources_keeps_first_occurrence_order(agent):
+    from langchain_core.documents import Document
+
+    docs = [
+        Document(page_content="1", metadata={"filename": "b.pdf", "page": 1, "score": 0.9}),
+        Document(page_content="2", metadata={"filename": "a.pdf", "page": 3, "archive_source": "z.zip"}),
+        Document(page_content="3", metadata={"filename": "b.pdf", "page": 1, "score": 0.5}),
+        Document(page_content="4", metadata={}),
+    ]
+
+    assert agent._extract_sources(docs) == [
+        {"filename": "b.pdf", "page": 1, "score": 0.9},
+        {"filename": "a.pdf", "page": 3, "score": None, "archive": "z.zip"},
+        {"filename": "Неизвестно", "page": 0, "score": None},
+    ]
+
+
+def test_gates_accept_precomputed_lowercase(agent):
+    question = "  Что грозит за неуплату НДФЛ?  "
+    question_lower = question.lower().strip()
+
+    assert not agent._is_conversational(question, question_lower)
+
+
+def test_build_rag_prompt_matches_template():
+    from src.infra.llm.agent import build_rag_prompt
+    from src.infra.llm.prompts import RAG_PROMPT_TEMPLATE
+
+    context, question = "[Источник 1: a.pdf, стр. 1]\n{текст}", "Что такое {НДФЛ}?"
+
+    assert build_rag_prompt(context, question) == RAG_PROMPT_TEMPLATE.format(
+        context=context, question=question
+    )
+
+
+@pytest.mark.parametrize("question", ["Как работает поиск по сайту", "Посоветуй внешний диск"])
+def test_keyword_inside_word_is_not_legal(agent, question):
+    assert not agent._is_legal_question(question)
+
+
+def test_legal_keyword_stem_matches_inflected_form(agent):
+    assert agent._is_legal_question("Трудовой кодекс")
+    assert agent._is_legal_question("СУДЕБНАЯ практика")
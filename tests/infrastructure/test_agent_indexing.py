@@ -0,0 +1,165 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from langchain_core.documents import Document
+
+from src.infra.llm import agent as agent_module
+from src.infra.llm.agent import LegalRAGAgent
+from src.infra.llm.config import RAGConfig
+from src.infra.llm.semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def agent():
+    agent = LegalRAGAgent.__new__(LegalRAGAgent)
+    agent.config = RAGConfig(index_concurrency=2)
+    agent._response_cache = SemanticCache()
+    agent._vector_store = MagicMock()
+    agent.text_splitter = MagicMock()
+    agent.text_splitter.split_documents.side_effect = lambda docs: [
+        Document(page_content=part) for part in docs[0].page_content.split()
+    ]
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_split_stream_yields_fixed_size_batches(agent, monkeypatch):
+    monkeypatch.setattr(agent_module, "INDEX_BATCH_SIZE", 2)
+    documents = [Document(page_content="a b c"), Document(page_content="d"), Document(page_content="e")]
+
+    batches = [batch async for batch in agent._split_stream(documents)]
+
+    assert [[d.page_content for d in batch] for batch in batches] == [["a", "b"], ["c", "d"], ["e"]]
+    # Документы разбиваются по одному
+    assert agent.text_splitter.split_documents.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_batches_are_indexed_concurrently_within_limit(agent, monkeypatch):
+    monkeypatch.setattr(agent_module, "INDEX_BATCH_SIZE", 2)
+    running = 0
+    peak = 0
+
+    async def add_documents(batch, wait=True):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    agent._vector_store.add_documents = add_documents
+    documents = [Document(page_content="a b c d e f g")]
+
+    counts = [n async for n in agent._index_chunks_stream(agent._split_stream(documents))]
+
+    assert sorted(counts) == [1, 2, 2, 2]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_indexing_error_cancels_remaining_batches(agent, monkeypatch):
+    monkeypatch.setattr(agent_module, "INDEX_BATCH_SIZE", 1)
+    calls = 0
+
+    async def add_documents(batch, wait=True):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("embeddings down")
+        await asyncio.sleep(1)
+
+    agent._vector_store.add_documents = add_documents
+    documents = [Document(page_content="1 2 3 4 5")]
+
+    with pytest.raises(RuntimeError):
+        async for _ in agent._index_chunks_stream(agent._split_stream(documents)):
+            pass
+
+    assert calls <= 3
+
+
+@pytest.mark.asyncio
+async def test_split_stream_pulls_documents_lazily(agent, monkeypatch):
+    monkeypatch.setattr(agent_module, "INDEX_BATCH_SIZE", 2)
+    pulled = []
+
+    def documents():
+        for text in ("a b", "c d", "e"):
+            pulled.append(text)
+            yield Document(page_content=text)
+
+    batches = agent._split_stream(documents())
+    first = await batches.__anext__()
+
+    assert [d.page_content for d in first] == ["a", "b"]
+    assert pulled == ["a b"]
+    assert [[d.page_content for d in b] async for b in batches] == [["c", "d"], ["e"]]
+
+
+@pytest.mark.asyncio
+async def test_index_documents_stream_closes_loader_when_consumer_stops(agent):
+    closed = []
+
+    def load_directory(workers):
+        try:
+            for text in ("a", "b", "c"):
+                yield Document(page_content=text)
+        finally:
+            closed.append(True)
+
+    agent.document_loader = MagicMock()
+    agent.document_loader.load_directory = load_directory
+    agent.config = RAGConfig(index_concurrency=1)
+
+    async def add_documents(batch, wait=True):
+        pass
+
+    agent._vector_store.add_documents = add_documents
+    agent._vector_store.bulk_upload_mode = MagicMock()
+    agent._vector_store.bulk_upload_mode.return_value.__aenter__ = AsyncMock()
+    agent._vector_store.bulk_upload_mode.return_value.__aexit__ = AsyncMock(return_value=False)
+    agent._stats_cache = None
+
+    stream = agent.index_documents_stream()
+    await stream.__anext__()
+    await stream.aclose()
+
+    assert closed == [True]
+
+
+@pytest.mark.asyncio
+async def test_index_chunks_writes_batches_without_wait_and_flushes_once(agent, monkeypatch):
+    monkeypatch.setattr(agent_module, "INDEX_BATCH_SIZE", 2)
+    calls = []
+
+    async def add_documents(batch, wait=True):
+        calls.append((len(batch), wait))
+
+    agent._vector_store.add_documents = add_documents
+    agent._vector_store.flush = AsyncMock()
+    agent._stats_cache = None
+    chunks = [Document(page_content=str(i)) for i in range(5)]
+
+    count = await agent.index_chunks(chunks)
+
+    assert count == 5
+    assert sorted(calls) == [(1, False), (2, False), (2, False)]
+    agent._vector_store.flush.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_force_reindex_invalidates_caches_after_clear(agent):
+    agent.document_loader = MagicMock()
+    agent.document_loader.load_directory = lambda workers: (d for d in [Document(page_content="a")])
+    agent._vector_store.clear_collection = AsyncMock()
+    agent._vector_store.add_documents = AsyncMock(side_effect=RuntimeError("embeddings down"))
+    agent._response_cache.set([1.0, 0.0], "старый ответ")
+    agent._stats_cache = (float("inf"), {})
+
+    with pytest.raises(RuntimeError):
+        await agent.index_documents(force_reindex=True)
+
+    agent._vector_store.clear_collection.assert_awaited_once()
+    assert agent._response_cache.lookup([1.0, 0.0]) is None
+    assert agent._stats_cache is None
@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from src.infra.llm.agent import LegalRAGAgent
+from src.infra.llm.config import RAGConfig
+from src.infra.llm.semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def agent():
+    agent = LegalRAGAgent.__new__(LegalRAGAgent)
+    agent.config = RAGConfig()
+    agent.yandex_config = SimpleNamespace(model_uri="gpt://folder/yandexgpt-lite/latest")
+    agent._response_cache = SemanticCache()
+    agent._stats_cache = None
+    agent._health_cache = None
+    agent._vector_store = MagicMock()
+    agent._vector_store.get_info = AsyncMock(
+        return_value={"points_count": 10, "name": "legal_documents", "status": "green"}
+    )
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_stats_are_cached_until_ttl(agent):
+    with patch("src.infra.llm.agent.time.monotonic") as now:
+        now.return_value = 100.0
+        first = await agent.get_stats()
+        now.return_value = 110.0
+        second = await agent.get_stats()
+        now.return_value = 131.0
+        await agent.get_stats()
+
+    assert first is second
+    assert agent._vector_store.get_info.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_indexing_invalidates_stats(agent):
+    await agent.get_stats()
+    agent.invalidate_caches()
+    await agent.get_stats()
+
+    assert agent._vector_store.get_info.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_health_check_is_cached(agent):
+    agent._check_health = AsyncMock(return_value=True)
+
+    assert await agent.health_check()
+    assert await agent.health_check()
+
+    agent._check_health.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_conversational_answer_reuses_system_message(agent):
+    from src.infra.llm.agent import _CONVERSATIONAL_SYSTEM_MESSAGE
+    from src.infra.llm.prompts import CONVERSATIONAL_SYSTEM_PROMPT
+
+    agent._gpt_client = MagicMock()
+    agent._gpt_client.complete = AsyncMock(return_value=SimpleNamespace(text="Здравствуйте!", total_tokens=5))
+
+    response = await agent._answer_conversational("Привет")
+
+    messages = agent._gpt_client.complete.await_args.args[0]
+    assert messages[0] is _CONVERSATIONAL_SYSTEM_MESSAGE
+    assert messages[0].text == CONVERSATIONAL_SYSTEM_PROMPT
+    assert (messages[1].role, messages[1].text) == ("user", "Привет")
+    assert response.answer == "Здравствуйте!"
+    assert not response.used_rag
+
+
+@pytest.mark.asyncio
+async def test_cached_answer_is_not_served_for_different_article_number(agent):
+    from langchain_core.documents import Document
+
+    agent.qdrant_config = SimpleNamespace(search_k=5)
+    # Эмбеддинги вопросов, различающихся только номером статьи, совпадают
+    agent._embeddings = MagicMock()
+    agent._embeddings.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+    agent._vector_store.search_by_vector = AsyncMock(return_value=[
+        Document(page_content="текст", metadata={"filename": "tk.pdf", "page": 1}),
+    ])
+    agent._gpt_client = MagicMock()
+    agent._gpt_client.complete = AsyncMock(side_effect=[
+        SimpleNamespace(text="Ответ про статью 81", total_tokens=5),
+        SimpleNamespace(text="Ответ про статью 82", total_tokens=5),
+    ])
+
+    first = await agent.query("Что говорит статья 81 ТК РФ?")
+    second = await agent.query("Что говорит статья 82 ТК РФ?")
+    repeated = await agent.query("статья 81 ТК РФ: что говорит?")
+
+    assert first.answer == "Ответ про статью 81"
+    assert second.answer == "Ответ про статью 82"
+    assert repeated.answer == "Ответ про статью 81"
+    assert agent._gpt_client.complete.await_count == 2
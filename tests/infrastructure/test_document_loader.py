@@ -1,9 +1,12 @@
+import hashlib
 import tarfile
 import zipfile
+from concurrent.futures import Future
 from pathlib import Path
 
 import pytest
 
+from src.infra.llm import document_loader as document_loader_module
 from src.infra.llm.document_loader import (
     ARCHIVE_EXTENSIONS,
     ArchiveError,
@@ -41,7 +44,7 @@ def test_compute_file_hash_is_stable(tmp_path: Path):
     h2 = compute_file_hash(p)
 
     assert h1 == h2
-    assert len(h1) == 32
+    assert h1 == hashlib.md5(b"hello").hexdigest()
 
 
 def test_archive_handler_is_archive_and_type(tmp_path: Path):
@@ -120,6 +123,60 @@ def test_legal_document_loader_load_file_txt_enriches_metadata(tmp_path: Path):
     assert "page" in d0.metadata
 
 
+def test_legal_document_loader_load_directory_in_parallel_matches_sequential(tmp_path: Path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    for i in range(3):
+        (docs_dir / f"doc{i}.txt").write_text(f"Документ {i}", encoding="utf-8")
+    (docs_dir / "broken.pdf").write_bytes(b"not a pdf")
+
+    loader = LegalDocumentLoader(docs_dir)
+    sequential = loader.load_directory()
+    parallel = loader.load_directory(workers=2)
+
+    def key(doc):
+        return doc.metadata["filename"], doc.page_content
+
+    assert sorted(map(key, parallel)) == sorted(map(key, sequential))
+
+
+class _InlineExecutor:
+    """Executor stand-in that runs tasks immediately and counts submissions."""
+
+    def __init__(self, max_workers):
+        self.submitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        _InlineExecutor.last = self
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_legal_document_loader_parallel_submissions_are_bounded(tmp_path: Path, monkeypatch):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    for i in range(20):
+        (docs_dir / f"doc{i:02}.txt").write_text(f"Документ {i}", encoding="utf-8")
+    monkeypatch.setattr(document_loader_module, "ProcessPoolExecutor", _InlineExecutor)
+
+    documents = LegalDocumentLoader(docs_dir).load_directory(workers=2)
+    consumed = 0
+    for _ in documents:
+        consumed += 1
+        # Одновременно в работе не больше workers * 2 файлов
+        assert _InlineExecutor.last.submitted - consumed <= 4
+
+    assert consumed == 20
+
+
 def test_legal_document_loader_load_archive_zip_stats_and_archive_source(tmp_path: Path):
     docs_dir = tmp_path / "docs"
     docs_dir.mkdir()
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from src.infra.llm.config import YandexGPTConfig
+from src.infra.llm.embeddings import YandexEmbeddings
+
+
+@pytest.mark.asyncio
+async def test_documents_are_embedded_concurrently_in_order():
+    embeddings = YandexEmbeddings(YandexGPTConfig(folder_id="folder", embeddings_concurrency=3))
+    running = 0
+    peak = 0
+
+    async def embed(text, model):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return [float(len(text))]
+
+    embeddings._embed_async = embed
+
+    result = await embeddings.aembed_documents(["a", "bb", "  ", "ccc", "dddd", "eeeee"])
+
+    assert result[:2] == [[1.0], [2.0]]
+    assert result[2] == [0.0] * 256
+    assert result[3:] == [[3.0], [4.0], [5.0]]
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_query_embeddings_are_cached_with_lru_eviction():
+    embeddings = YandexEmbeddings(YandexGPTConfig(folder_id="folder", query_embeddings_cache_size=2))
+    calls = []
+
+    async def embed(text, model):
+        calls.append(text)
+        return [float(len(text))]
+
+    embeddings._embed_async = embed
+
+    assert await embeddings.aembed_query("один") == [4.0]
+    assert await embeddings.aembed_query("один") == [4.0]
+    await embeddings.aembed_query("два")
+    await embeddings.aembed_query("три")
+    await embeddings.aembed_query("один")
+
+    assert calls == ["один", "два", "три", "один"]
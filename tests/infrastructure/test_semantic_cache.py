@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+from src.infra.llm.semantic_cache import SemanticCache
+
+
+def test_close_question_hits_cache():
+    cache = SemanticCache(threshold=0.9)
+    cache.set([1.0, 0.0, 0.0], "ответ")
+
+    assert cache.lookup([0.98, 0.1, 0.0]) == "ответ"
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+
+
+def test_expired_entry_is_ignored():
+    cache = SemanticCache(ttl=10)
+    with patch("src.infra.llm.semantic_cache.time.monotonic", return_value=100.0):
+        cache.set([1.0, 0.0], "ответ")
+    with patch("src.infra.llm.semantic_cache.time.monotonic", return_value=111.0):
+        assert cache.lookup([1.0, 0.0]) is None
+        assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(maxsize=2)
+    with patch("src.infra.llm.semantic_cache.time.monotonic") as now:
+        now.return_value = 1.0
+        cache.set([1.0, 0.0, 0.0], "первый")
+        now.return_value = 2.0
+        cache.set([0.0, 1.0, 0.0], "второй")
+        now.return_value = 3.0
+        assert cache.lookup([1.0, 0.0, 0.0]) == "первый"
+        now.return_value = 4.0
+        cache.set([0.0, 0.0, 1.0], "третий")
+
+        assert cache.lookup([1.0, 0.0, 0.0]) == "первый"
+        assert cache.lookup([0.0, 1.0, 0.0]) is None
+        assert cache.lookup([0.0, 0.0, 1.0]) == "третий"
+
+
+def test_clear_and_zero_vector():
+    cache = SemanticCache()
+    cache.set([0.0, 0.0], "ответ")
+    assert cache.lookup([0.0, 0.0]) is None
+
+    cache.set([1.0, 1.0], "ответ")
+    cache.clear()
+    assert cache.lookup([1.0, 1.0]) is None
+
+
+def test_key_must_match_even_for_identical_vectors():
+    cache = SemanticCache()
+    cache.set([1.0, 0.0], "статья 81", key="81 статья")
+
+    assert cache.lookup([1.0, 0.0], key="81 статья") == "статья 81"
+    assert cache.lookup([1.0, 0.0], key="82 статья") is None
+    assert cache.lookup([0.0, 1.0], key="81 статья") is None
+
+
+def test_evicted_entry_is_not_found_by_its_key():
+    cache = SemanticCache(maxsize=1)
+    cache.set([1.0, 0.0], "первый", key="a")
+    cache.set([0.0, 1.0], "второй", key="b")
+
+    assert cache.lookup([1.0, 0.0], key="a") is None
+    assert cache.lookup([0.0, 1.0], key="b") == "второй"
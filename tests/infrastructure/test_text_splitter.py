@@ -0,0 +1,63 @@
+import pickle
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.infra.llm.text_splitter import CachingTextSplitter
+
+
+def _splitter(**kwargs) -> CachingTextSplitter:
+    return CachingTextSplitter(chunk_size=20, chunk_overlap=0, **kwargs)
+
+
+def test_split_text_matches_recursive_splitter():
+    text = "Первый абзац договора.\n\nВторой абзац договора.\n\nПодпись сторон."
+    expected = RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=0).split_text(text)
+
+    assert _splitter().split_text(text) == expected
+
+
+def test_repeated_text_is_split_once():
+    splitter = _splitter()
+    boilerplate = "Настоящий документ является конфиденциальным."
+
+    with patch.object(
+        RecursiveCharacterTextSplitter, "split_text", autospec=True, return_value=["a", "b"]
+    ) as split_text:
+        first = splitter.split_text(boilerplate)
+        second = splitter.split_text(boilerplate)
+
+    assert first == second == ["a", "b"]
+    assert split_text.call_count == 1
+
+
+def test_cached_chunks_keep_document_metadata():
+    splitter = _splitter()
+    docs = [
+        Document(page_content="Подпись сторон.", metadata={"source": "a.pdf"}),
+        Document(page_content="Подпись сторон.", metadata={"source": "b.pdf"}),
+    ]
+
+    chunks = splitter.split_documents(docs)
+
+    assert [chunk.metadata["source"] for chunk in chunks] == ["a.pdf", "b.pdf"]
+
+
+def test_cache_is_bounded():
+    splitter = _splitter(cache_size=2)
+
+    for text in ("один", "два", "три"):
+        splitter.split_text(text)
+
+    assert len(splitter._cache) == 2
+
+
+def test_splitter_pickles_without_cache():
+    splitter = _splitter()
+    splitter.split_text("Подпись сторон.")
+
+    restored = pickle.loads(pickle.dumps(splitter))
+
+    assert len(restored._cache) == 0
+    assert restored.split_text("Подпись сторон.") == splitter.split_text("Подпись сторон.")
@@ -0,0 +1,179 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from langchain_core.documents import Document
+
+from src.infra.llm.config import QdrantConfig
+from src.infra.llm.vector_store import QdrantVectorStore
+
+
+def _point(text: str, score: float = 0.9):
+    return SimpleNamespace(payload={"text": text, "filename": "a.pdf"}, score=score)
+
+
+@pytest.fixture
+def store():
+    embeddings = MagicMock()
+    embeddings.aembed_query = AsyncMock(side_effect=lambda text: [float(len(text))])
+    store = QdrantVectorStore(QdrantConfig(search_batch_wait=0.05), embeddings)
+
+    client = MagicMock()
+
+    async def query_batch_points(collection_name, requests):
+        return [SimpleNamespace(points=[_point(f"ответ {i}")]) for i in range(len(requests))]
+
+    client.query_batch_points = AsyncMock(side_effect=query_batch_points)
+    client.query_points = AsyncMock(return_value=SimpleNamespace(points=[_point("фильтр")]))
+    client.close = AsyncMock()
+    store._get_client = AsyncMock(return_value=client)
+    store.client = client
+    return store
+
+
+@pytest.mark.asyncio
+async def test_concurrent_searches_share_one_batch_request(store):
+    results = await asyncio.gather(
+        store.search("первый вопрос"),
+        store.search("второй вопрос", k=3),
+        store.search("третий вопрос"),
+    )
+
+    store.client.query_batch_points.assert_awaited_once()
+    requests = store.client.query_batch_points.await_args.kwargs["requests"]
+    assert [r.limit for r in requests] == [5, 3, 5]
+    assert [r.score_threshold for r in requests] == [None, None, None]
+    assert [docs[0].page_content for docs in results] == ["ответ 0", "ответ 1", "ответ 2"]
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_error_is_raised_for_every_query(store):
+    store.client.query_batch_points.side_effect = RuntimeError("qdrant down")
+
+    results = await asyncio.gather(
+        store.search("первый вопрос"),
+        store.search("второй вопрос"),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_filtered_search_is_not_batched(store):
+    docs = await store.search("вопрос", filter_dict={"filename": "a.pdf"})
+
+    assert docs[0].page_content == "фильтр"
+    store.client.query_batch_points.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_bulk_upload_mode_restores_indexing_on_error(store):
+    store.client.update_collection = AsyncMock()
+    store.client.get_collection = AsyncMock(return_value=SimpleNamespace(
+        config=SimpleNamespace(optimizer_config=SimpleNamespace(indexing_threshold=5000))
+    ))
+
+    with pytest.raises(RuntimeError):
+        async with store.bulk_upload_mode():
+            raise RuntimeError("upload failed")
+
+    thresholds = [
+        c.kwargs["optimizers_config"].indexing_threshold
+        for c in store.client.update_collection.await_args_list
+    ]
+    assert thresholds == [0, 5000]
+
+
+@pytest.mark.asyncio
+async def test_score_threshold_is_sent_to_qdrant(store):
+    await store.search_by_vector([1.0, 0.0], score_threshold=0.25)
+
+    request = store.client.query_batch_points.await_args.kwargs["requests"][0]
+    assert request.score_threshold == 0.25
+    await store.close()
+
+
+def test_quantized_search_params():
+    config = QdrantConfig(quantization="scalar", search_oversampling=3.0)
+    store = QdrantVectorStore(config, MagicMock())
+
+    params = store._search_kwargs["search_params"]
+    assert params.quantization.rescore is True
+    assert params.quantization.oversampling == 3.0
+    assert store._build_quantization_config().scalar.always_ram is True
+
+
+def test_default_search_params_use_collection_settings():
+    store = QdrantVectorStore(QdrantConfig(), MagicMock())
+
+    assert store._search_kwargs["search_params"] is None
+    assert store._build_quantization_config() is None
+
+
+@pytest.mark.asyncio
+async def test_get_info_tracks_local_writes_between_refreshes(store):
+    store.client.get_collection = AsyncMock(
+        return_value=SimpleNamespace(points_count=10, status=SimpleNamespace(value="green"))
+    )
+    store.client.upsert = AsyncMock()
+    store.client.retrieve = AsyncMock(return_value=[])
+    store.embeddings.aembed_documents = AsyncMock(return_value=[[0.1], [0.2]])
+
+    assert (await store.get_info())["points_count"] == 10
+    await store.add_documents([Document(page_content="a"), Document(page_content="b")])
+    assert (await store.get_info())["points_count"] == 12
+    store.client.get_collection.assert_awaited_once()
+
+    await store.get_info(refresh=True)
+    assert store.client.get_collection.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_add_documents_skips_already_indexed_chunks(store):
+    store.client.upsert = AsyncMock()
+    docs = [
+        Document(page_content="старый", metadata={"file_hash": "h", "page": 1}),
+        Document(page_content="новый", metadata={"file_hash": "h", "page": 1}),
+        Document(page_content="новый", metadata={"file_hash": "h", "page": 1}),
+    ]
+    old_id = QdrantVectorStore._point_id(docs[0])
+    store.client.retrieve = AsyncMock(return_value=[SimpleNamespace(id=old_id)])
+    store.embeddings.aembed_documents = AsyncMock(return_value=[[0.5]])
+
+    ids = await store.add_documents(docs)
+
+    assert ids[0] == old_id
+    assert ids[1] == ids[2] == QdrantVectorStore._point_id(docs[1])
+    store.embeddings.aembed_documents.assert_awaited_once_with(["новый"])
+    points = store.client.upsert.await_args.kwargs["points"]
+    assert [p.id for p in points] == [ids[1]]
+
+
+@pytest.mark.asyncio
+async def test_add_documents_without_new_chunks_does_not_embed(store):
+    store.client.upsert = AsyncMock()
+    doc = Document(page_content="текст", metadata={"file_hash": "h"})
+    store.client.retrieve = AsyncMock(return_value=[SimpleNamespace(id=QdrantVectorStore._point_id(doc))])
+    store.embeddings.aembed_documents = AsyncMock()
+
+    await store.add_documents([doc])
+
+    store.embeddings.aembed_documents.assert_not_called()
+    store.client.upsert.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_has_upload_filters_by_upload_hash(store):
+    store.client.scroll = AsyncMock(side_effect=[([SimpleNamespace(id="p")], None), ([], None)])
+
+    assert await store.has_upload("abc") is True
+    assert await store.has_upload("abc") is False
+
+    kwargs = store.client.scroll.await_args.kwargs
+    condition = kwargs["scroll_filter"].must[0]
+    assert (condition.key, condition.match.value) == ("upload_hash", "abc")
+    assert kwargs["limit"] == 1
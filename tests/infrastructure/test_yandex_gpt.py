@@ -0,0 +1,43 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from src.infra.llm.config import YandexGPTConfig
+from src.infra.llm.yandex_gpt import YandexGPTClient, YandexGPTMessage
+
+
+@pytest.fixture
+def client():
+    client = YandexGPTClient(YandexGPTConfig(folder_id="folder", api_key="key", temperature=0.1, max_tokens=1024))
+    response = MagicMock()
+    response.json.return_value = {"result": {
+        "alternatives": [{"message": {"text": "OK"}}],
+        "usage": {"inputTextTokens": "3", "completionTokens": "1"},
+    }}
+    http = MagicMock()
+    http.post = AsyncMock(return_value=response)
+    client._get_client = AsyncMock(return_value=http)
+    client.http = http
+    return client
+
+
+@pytest.mark.asyncio
+async def test_complete_uses_prebuilt_request_parts(client):
+    result = await client.complete([YandexGPTMessage(role="user", text="Ответь: OK")])
+
+    body = client.http.post.await_args.kwargs["json"]
+    assert result.text == "OK"
+    assert result.total_tokens == 4
+    assert body["modelUri"] == "gpt://folder/yandexgpt-lite/latest"
+    assert body["completionOptions"] == {"stream": False, "temperature": 0.1, "maxTokens": "1024"}
+    assert body["messages"] == [{"role": "user", "text": "Ответь: OK"}]
+
+
+@pytest.mark.asyncio
+async def test_complete_overrides_options(client):
+    await client.complete([YandexGPTMessage(role="user", text="x")], temperature=0.5, max_tokens=2000)
+
+    body = client.http.post.await_args.kwargs["json"]
+    assert body["completionOptions"] == {"stream": False, "temperature": 0.5, "maxTokens": "2000"}
+    # Значения по умолчанию не изменились
+    assert client._default_options["maxTokens"] == "1024"
@@ -64,7 +64,7 @@ async def test_generate_document_success(app_client):
     mock_service.generate = AsyncMock(return_value=mock_result)
     app.dependency_overrides[get_doc_generation_service] = lambda: mock_service
 
-    mock_session = SimpleNamespace()
+    mock_session = SimpleNamespace(close=AsyncMock())
 
     async def override_session():
         yield mock_session
@@ -89,6 +89,7 @@ async def test_generate_document_success(app_client):
         "document_type": "contract"
     }
     mock_service.generate.assert_awaited_once_with(request="contract", context="ctx", use_rag=False)
+    mock_session.close.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -106,7 +107,7 @@ async def test_generate_document_pdf(app_client):
     mock_service.generate = AsyncMock(return_value=mock_result)
     app.dependency_overrides[get_doc_generation_service] = lambda: mock_service
 
-    mock_session = SimpleNamespace()
+    mock_session = SimpleNamespace(close=AsyncMock())
 
     async def override_session():
         yield mock_session
@@ -34,14 +34,15 @@ def _override_session(app, mock_session):
 async def test_upload_document_success(app_client):
     app, client = app_client
 
-    mock_session = SimpleNamespace()
+    mock_session = SimpleNamespace(close=AsyncMock())
     _override_session(app, mock_session)
 
     mock_ingestion_result = SimpleNamespace(
         chunks_count=3,
         file_type="document",
         files_processed=1,
-        errors=["warning"]
+        errors=["warning"],
+        duplicate=False,
     )
 
     ingestion_service = SimpleNamespace(
@@ -62,14 +63,16 @@ async def test_upload_document_success(app_client):
     assert payload["chunks_added"] == 3
     assert payload["file_type"] == "document"
     assert payload["errors"] == ["warning"]
+    assert payload["duplicate"] is False
     ingestion_service.processFile.assert_awaited_once()
+    mock_session.close.assert_awaited_once()
 
 
 @pytest.mark.asyncio
 async def test_upload_document_unsupported(app_client):
     app, client = app_client
 
-    mock_session = SimpleNamespace()
+    mock_session = SimpleNamespace(close=AsyncMock())
     _override_session(app, mock_session)
     app.dependency_overrides[get_ingestion_service] = lambda: SimpleNamespace()
 
@@ -89,7 +92,7 @@ async def test_upload_document_unsupported(app_client):
 async def test_upload_document_forbidden(app_client):
     app, client = app_client
 
-    mock_session = SimpleNamespace()
+    mock_session = SimpleNamespace(close=AsyncMock())
     _override_session(app, mock_session)
     app.dependency_overrides[get_ingestion_service] = lambda: SimpleNamespace()
 
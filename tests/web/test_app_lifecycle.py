@@ -10,12 +10,12 @@ import src.web as web
 async def test_lifespan_initializes_services(monkeypatch):
     fake_agent = SimpleNamespace()
     fake_rag_service = SimpleNamespace(close=AsyncMock())
-    fake_ingestion_service = SimpleNamespace()
-    fake_doc_service = SimpleNamespace()
+    fake_ingestion_service = SimpleNamespace(close=AsyncMock())
+    fake_doc_service = SimpleNamespace(close=AsyncMock())
 
     monkeypatch.setattr(web, "LegalRAGAgent", lambda: fake_agent)
     monkeypatch.setattr(web, "RAGService", lambda agent: fake_rag_service)
-    monkeypatch.setattr(web, "IngestionService", lambda agent: fake_ingestion_service)
+    monkeypatch.setattr(web, "IngestionService", lambda agent, session_factory: fake_ingestion_service)
     monkeypatch.setattr(web, "DocumentGenerationService", lambda agent: fake_doc_service)
 
     web.rag_service = None
@@ -28,6 +28,8 @@ async def test_lifespan_initializes_services(monkeypatch):
         assert web.doc_generation_service is fake_doc_service
 
     fake_rag_service.close.assert_awaited_once()
+    fake_ingestion_service.close.assert_awaited_once()
+    fake_doc_service.close.assert_awaited_once()
     web.rag_service = None
     web.ingestion_service = None
     web.doc_generation_service = None